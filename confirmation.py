@@ -0,0 +1,124 @@
+# This file is a part of the The Fog Development Kit (FDK)
+#
+# Developed by:
+# - Colton Powell
+# - Christopher Desiniotis
+# - Dr. Behnam Dezfouli
+#
+# In the Internet of Things Research Lab, Santa Clara University, CA, USA
+
+import threading
+import time
+import timeit
+
+
+class ConfirmationTimeout(Exception):
+    """
+    Raised when changes pushed to the ODL config data store do not show up in
+    the operational data store in time.
+    """
+    pass
+
+
+class OperationalConfirmer:
+    """
+    OperationalConfirmer confirms that changes written to ODL (queues, QoS'es,
+    ports, etc.) have hit the operational data store.
+
+    Callers register expectations with expect() and then call wait(). All
+    pending expectations are checked together: each tick reads every OVSDB
+    node that has an expectation ONCE (reads of different nodes run in
+    parallel) and evaluates all checks against that data. Ticks back off
+    exponentially, and wait() raises ConfirmationTimeout if something is
+    still unconfirmed after timeout seconds.
+
+    Expectations are kept per thread, so threads programming different
+    switches at the same time only wait on their own changes.
+    """
+
+    def __init__(self, top_mgr, timeout=30.0, initial_delay=0.01,
+                 max_delay=1.0, backoff=2.0):
+        self.top_mgr = top_mgr             # TopologyManager used for reads
+        self.timeout = timeout             # Default timeout of wait() (secs)
+        self.initial_delay = initial_delay # First delay between ticks (secs)
+        self.max_delay = max_delay         # Max delay between ticks (secs)
+        self.backoff = backoff             # Delay multiplier per tick
+
+        # Per-thread list of pending expectations
+        self.local = threading.local()
+
+
+    def __get_pending(self):
+        try:
+            return self.local.pending
+        except AttributeError:
+            self.local.pending = []
+            return self.local.pending
+
+
+    def expect(self, ovsdb_top_id, ovsdb_node_id, check, on_confirm=None,
+               desc=None):
+        """
+        Register an expectation on the operational data of an OVSDB node.
+        check(node_data) must return True once the expected change is seen.
+        on_confirm() is called once the check passes.
+        """
+        self.__get_pending().append({
+            "key": (ovsdb_top_id, ovsdb_node_id),
+            "check": check,
+            "on_confirm": on_confirm,
+            "desc": desc
+        })
+
+
+    def num_pending(self):
+        """ Return the number of unconfirmed expectations of this thread """
+        return len(self.__get_pending())
+
+
+    def wait(self, timeout=None):
+        """
+        Block until every pending expectation of this thread is confirmed.
+        Raise ConfirmationTimeout (and drop the pending expectations) if that
+        takes longer than timeout seconds.
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        pending = self.__get_pending()
+        deadline = timeit.default_timer() + timeout
+        delay = self.initial_delay
+
+        while len(pending) != 0:
+            # One read per OVSDB node with something pending
+            keys = []
+            for expectation in pending:
+                if expectation["key"] not in keys:
+                    keys.append(expectation["key"])
+            node_data = self.top_mgr.query_network_topology_nodes(keys)
+
+            # Check everything against the data of this tick
+            unconfirmed = []
+            for expectation in pending:
+                data = node_data[expectation["key"]]
+                if data is not None and expectation["check"](data):
+                    if expectation["on_confirm"] is not None:
+                        expectation["on_confirm"]()
+                else:
+                    unconfirmed.append(expectation)
+            pending[:] = unconfirmed
+
+            if len(pending) == 0:
+                break
+
+            # Out of time - give up on everything that is still pending
+            remaining = deadline - timeit.default_timer()
+            if remaining <= 0:
+                descs = [str(expectation["desc"]) for expectation in pending]
+                del pending[:]
+                raise ConfirmationTimeout(
+                    "{} change(s) not operational after {}s: {}".format(
+                        len(descs), timeout, ", ".join(descs)))
+
+            time.sleep(min(delay, remaining))
+            delay = min(delay * self.backoff, self.max_delay)
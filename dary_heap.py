@@ -1,152 +1,174 @@
 import json
 
 class dary_heap:
-    def __init__(self, d=2):
-        self._n = 0         # num of nodes currently in heap
-        self._d = 2         # num of children per node
-        self._data = []     # array with keys
-        self._location = {} # location of keys in _data
+    """
+    Indexed d-ary min-heap. Items are integer handles (e.g. interned node
+    ids) 0, 1, 2, ... each with a key (priority). The heap is array-backed:
+    _pos gives the position of every handle in _heap, so decrease_key() finds
+    a handle in O(1) instead of looking up (mutable) objects in a dict.
+
+    A larger d makes the heap shallower: push()/decrease_key() (sift up) get
+    cheaper while pop_min() (sift down, scanning d children per level) gets
+    more expensive. Dijkstra does about m/n decrease_key()s per pop_min(),
+    so d = max(2, m//n) is a good choice there.
+    """
+
+    def __init__(self, d=2, capacity=0):
+        self._n = 0                   # num of handles currently in heap
+        self._d = max(2, d)           # num of children per node
+        self._heap = [0] * capacity   # handles, in heap order
+        self._keys = [0] * capacity   # key of each handle
+        self._pos = [-1] * capacity   # position of each handle in _heap
+                                      # (-1: not in heap)
+
+    def __len__(self):
+        return self._n
 
     def empty(self):
         return self._n == 0
 
+    def __contains__(self, h):
+        return h < len(self._pos) and self._pos[h] >= 0
+
+    def get_key(self, h):
+        """ Return the key of a handle in the heap """
+        if h not in self:
+            raise KeyError(h)
+        return self._keys[h]
+
     def get_min(self):
+        """ Return (handle, key) of the min """
         if self.empty():
             raise IndexError
+        h = self._heap[0]
+        return h, self._keys[h]
+
+    def push(self, h, key):
+        """ Add handle h (not in the heap) with the given key """
+        if h in self:
+            raise ValueError("handle {} already in heap".format(h))
+
+        # Grow the handle arrays to fit h
+        if h >= len(self._pos):
+            grow = h + 1 - len(self._pos)
+            self._keys.extend([0] * grow)
+            self._pos.extend([-1] * grow)
+        if self._n == len(self._heap):
+            self._heap.append(h)
         else:
-            return self._data[0]
-
-    def push(self, x):
-        if self._n == len(self._data):
-            self._data.append(x)
-        else:
-            self._data[self._n] = x
+            self._heap[self._n] = h
 
-        self._location[x] = self._n
+        self._keys[h] = key
         self._n += 1
-
-        i = self._location[x]
-
-        while i > 0:
-            p = (i-1)//self._d
-            if self._data[i] < self._data[p]:
-                # swap
-                self._data[i], self._data[p] = self._data[p], self._data[i]
-                self._location[self._data[i]] = i
-                self._location[self._data[p]] = p
-                i = p
-            else:
-                break
+        self.__sift_up(self._n - 1)
 
     def pop_min(self):
+        """ Remove the min and return its (handle, key) """
         # ensure not empty
         if self.empty():
             raise IndexError
 
-        # Erase the min
-        del self._location[self._data[0]]
+        h = self._heap[0]
+        self._pos[h] = -1
         self._n -= 1
-        if (self._n == 0):
-            return
 
-        # Take the last element and move it to the min spot
-        self._data[0] = self._data[self._n]
-        self._location[self._data[0]] = 0
+        # Take the last handle and move it to the min spot
+        if self._n > 0:
+            self._heap[0] = self._heap[self._n]
+            self.__sift_down(0)
 
-        # i is current node, which is min
-        i = 0
+        return h, self._keys[h]
 
-        # while there is a child of current node
-        while (i*self._d + 1) < self._n:
-            left = i*self._d + 1
-            right = (i+1)*self._d
-            m = left
+    def decrease_key(self, h, key):
+        """ Lower the key of handle h (in the heap) to key """
+        # Error if the handle is not in the heap
+        if h not in self:
+            raise KeyError(h)
+        if key > self._keys[h]:
+            raise ValueError("new key is larger than the current key")
 
-            # get the smallest child
-            c = left+1
-            while c <= right and c < self._n:
-                if self._data[c] < self._data[m]:
-                    m = c
+        self._keys[h] = key
+        self.__sift_up(self._pos[h])
+
+    def __sift_up(self, i):
+        heap = self._heap
+        keys = self._keys
+        pos = self._pos
+        d = self._d
 
-                c += 1
+        h = heap[i]
+        key = keys[h]
 
-            # if child is bigger than i, we are done
-            if not (self._data[m] < self._data[i]):
+        # Move parents down while they are larger, then drop h in place
+        while i > 0:
+            p = (i - 1) // d
+            parent = heap[p]
+            if not (key < keys[parent]):
                 break
+            heap[i] = parent
+            pos[parent] = i
+            i = p
 
-            # otherwise swap current with the child
-            self._data[i], self._data[m] = self._data[m], self._data[i]
-            self._location[self._data[i]] = i
-            self._location[self._data[m]] = m
+        heap[i] = h
+        pos[h] = i
 
-            # move current index to child index location and repeat
-            i = m
+    def __sift_down(self, i):
+        heap = self._heap
+        keys = self._keys
+        pos = self._pos
+        d = self._d
+        n = self._n
 
-    def decrease_key(self, x, newx):
-        # Error if empty (no elements to perform decrease key on)
-        if self.empty():
-            raise IndexError
+        h = heap[i]
+        key = keys[h]
 
-        # Update x's data with newx
-        i = self._location[x]
-        self._data[i] = newx
-        
-        # Delete x's location, replace with newx location
-        del self._location[x]
-        self._location[newx] = i
-
-        # i = newx location
-        # so swap up newx while i > 0 (ensuring parent exists) and newx <
-        # parent
-        while i > 0 and self._data[i] < self._data[(i-1)//self._d]:
-            p = (i-1)//self._d
-            self._data[i], self._data[p] = self._data[p], self._data[i]
-            self._location[self._data[i]] = i
-            self._location[self._data[p]] = p
-            i = p
+        # while there is a child of current node
+        while True:
+            first = i * d + 1
+            if first >= n:
+                break
+            last = min(first + d, n)
 
+            # get the smallest child
+            m = first
+            m_key = keys[heap[first]]
+            for c in range(first + 1, last):
+                c_key = keys[heap[c]]
+                if c_key < m_key:
+                    m = c
+                    m_key = c_key
 
-    # Testing function
-    def is_heap(self):
-        return self.__is_heap(0)
-
-    def __is_heap(self, i):
-        # left and right children
-        l_index = i*self._d+1
-        r_index = (i+1)*self._d
-
-        # Test that children are larger or don't exist (if they don't exist
-        # it's fine - we reached the bottom of the heap)
-        missing_child = False
-        
-        if l_index < self._n:
-            left_good = self._data[l_index] > self._data[i]
-        else:
-            left_good = True
-            missing_child = True
-            
-        if r_index < self._n:
-            right_good = self._data[r_index] > self._data[i]
-        else:
-            right_good = True
-            missing_child = True
+            # if the smallest child is not smaller than h, we are done
+            if not (m_key < key):
+                break
 
-        # problem with heap detected
-        if not (right_good and left_good):
-            print("current: %d" % self._data[i])
-            print("left: %d" % self._data[l_index])
-            print("right: %d" % self._data[r_index])
-            return False
+            # otherwise move the child up and repeat from its position
+            child = heap[m]
+            heap[i] = child
+            pos[child] = i
+            i = m
 
-        # we checked right and left are good. if one is missing, we done
-        if missing_child:
-            return True
+        heap[i] = h
+        pos[h] = i
 
-        # We still have more to check
-        return self.__is_heap(l_index) and self.__is_heap(r_index)
+    # Testing function
+    def is_heap(self):
+        """ Check the heap order and the position index """
+        for i in range(0, self._n):
+            h = self._heap[i]
+            if self._pos[h] != i:
+                print("handle %d: pos %d != %d" % (h, self._pos[h], i))
+                return False
+            if i > 0:
+                parent = self._heap[(i - 1) // self._d]
+                if self._keys[h] < self._keys[parent]:
+                    print("handle %d (key %s) < parent %d (key %s)" %
+                          (h, self._keys[h], parent, self._keys[parent]))
+                    return False
+        return True
 
     def print_status(self):
         print("_d = %d" % self._d)
         print("_n = %d" % self._n)
-        print(self._data)
-        print(json.dumps(self._location, indent=4))
+        print(json.dumps([(h, self._keys[h]) for h in self._heap[:self._n]],
+                         indent=4))
@@ -9,7 +9,9 @@
 
 import flow_manager
 import resource_manager
+import restconf
 import topology_manager
+import warm_restart
 
 import json
 import sys
@@ -27,6 +29,25 @@ with open(config_file, "r") as f:
 try:
     ctrlr_ip_addr = config_data["ctrlr_ip_addr"]
     head = config_data["yang_json_header"]
+
+    # Optional RESTCONF connection pool settings
+    restconf_pool_size = config_data.get("restconf_pool_size", 10)
+    restconf_timeout = config_data.get("restconf_timeout", 10.0)
+    restconf_max_concurrency = config_data.get("restconf_max_concurrency", 8)
+
+    # Optional number of switches whose link QoS is set up at the same time
+    link_qos_workers = config_data.get("link_qos_workers", 1)
+
+    # Optionally drop unused parts of big ODL documents while parsing
+    compact_parse = config_data.get("compact_parse", False)
+
+    # Optional number of edge/shutdown requests handled at the same time
+    request_workers = config_data.get("request_workers", 1)
+
+    # Optional warm restart snapshot file (see warm_restart.py). If set, the
+    # network state is kept and saved there on shutdown, and loaded again on
+    # the next start.
+    warm_restart_file = config_data.get("warm_restart_file", None)
 except KeyError:
     print("Error parsing config file {}".format(config_file), sys.stderr)
     exit(0)
@@ -36,11 +57,21 @@ def main():
     Main entry point to FDK
     """
     
+    # Keep-alive RESTCONF session pool shared by all managers
+    restconf_client = restconf.RestconfClient(
+        ctrlr_ip_addr, head, restconf_pool_size, restconf_timeout,
+        max_concurrency=restconf_max_concurrency)
+
     # Create the managers
     mgrs = {}
-    flow_mgr = flow_manager.FlowManager(mgrs, head, ctrlr_ip_addr)
-    top_mgr = topology_manager.TopologyManager(mgrs, head, ctrlr_ip_addr, 40000000)
-    res_mgr = resource_manager.ResourceManager(mgrs, head, ctrlr_ip_addr)
+    flow_mgr = flow_manager.FlowManager(mgrs, head, ctrlr_ip_addr,
+                                        restconf_client)
+    top_mgr = topology_manager.TopologyManager(mgrs, head, ctrlr_ip_addr,
+                                               40000000, restconf_client,
+                                               compact_parse)
+    res_mgr = resource_manager.ResourceManager(mgrs, head, ctrlr_ip_addr,
+                                               restconf_client=restconf_client,
+                                               request_workers=request_workers)
     
     mgrs["flow"] = flow_mgr
     mgrs["top"] = top_mgr
@@ -53,12 +84,22 @@ def main():
         print("HANDLING SHUTDOWN")
         print("\n\n\n=======================\n\n\n")
 
+        # Let in-flight allocations finish before anything is saved
+        res_mgr.stop_requests()
+
+        warm = warm_restart_file is not None
+        if warm:
+            warm_restart.save_snapshot(warm_restart_file, mgrs)
+
         for mgr_type in mgrs:
             try:
-                mgrs[mgr_type].shutdown()
+                mgrs[mgr_type].shutdown(warm)
             except BaseException:
                 pass
 
+        # Managers are done talking to ODL - drop the pooled connections
+        restconf_client.close()
+
         print("\n\n\n=======================\n\n\n")
         print("IT IS SAFE TO EXIT")
         print("\n\n\n=======================\n\n\n")
@@ -66,8 +107,15 @@ def main():
         sys.exit(0)
 
     # Initialize FDK
+    restored = (warm_restart_file is not None and
+                warm_restart.load_snapshot(warm_restart_file, mgrs))
     top_mgr.update_topology()
-    top_mgr.init_link_qos()
+    if restored:
+        # Only switches which are new since the snapshot need link QoS
+        top_mgr.init_link_qos(link_qos_workers,
+                              top_mgr.get_switches_without_qos())
+    else:
+        top_mgr.init_link_qos(link_qos_workers)
 
     # Register signal interrupt
     signal.signal(signal.SIGINT, handler)
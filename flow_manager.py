@@ -11,10 +11,21 @@ import copy
 import json
 import fdk
 import manager
-import requests as req
 import sys
 import topology
 
+
+class FlowWriteError(Exception):
+    """
+    Raised by FlowManager.commit_flow_batch() when flows could not be
+    written. failed is a list of the (node_id, table_id, flow_id) of those
+    flows; the other flows of the batch were written and are tracked.
+    """
+    def __init__(self, msg, failed):
+        super().__init__(msg)
+        self.failed = failed
+
+
 class FlowManager(manager.Manager):
     """
     FlowManager is a class that provides an interface to writing flows to
@@ -22,9 +33,10 @@ class FlowManager(manager.Manager):
     within.
     """
     
-    def __init__(self, mgrs, head, ctrlr_ip_addr="localhost"):
+    def __init__(self, mgrs, head, ctrlr_ip_addr="localhost",
+                 restconf_client=None):
         # Call Manager constructor
-        super().__init__(mgrs, head, ctrlr_ip_addr)
+        super().__init__(mgrs, head, ctrlr_ip_addr, restconf_client)
 
         # A set of switch_id's for quick access
         self.switch_ids = set([])
@@ -46,10 +58,11 @@ class FlowManager(manager.Manager):
         }
 
         
-    def shutdown(self):
-        super(FlowManager, self).shutdown()
+    def shutdown(self, warm=False):
+        super(FlowManager, self).shutdown(warm)
 
-        self.delete_all_flows()
+        if not warm:
+            self.delete_all_flows()
             
             
         # Add other shutdown capabilities here
@@ -89,7 +102,14 @@ class FlowManager(manager.Manager):
     def create_enqueue_flows(self, top_id, node_id, table_id, flow_prefix,
                              src_ip_addr, dst_ip_addr, 
                              outport_ofid, queue_id, queue_num,
-                             fog_port, proto_num, to_fog, priority=2000):
+                             fog_port, proto_num, to_fog, priority=2000,
+                             batch=None):
+        """
+        Create flows which enqueue traffic of an edge<->fog connection on
+        queue_id and output it on outport_ofid. If a flow batch (see
+        new_flow_batch()) is given, the flows are only added to the batch and
+        are pushed by commit_flow_batch().
+        """
         flow_ids = []
 
         flow_id = flow_prefix + self.proto_map[int(proto_num)].upper()
@@ -154,7 +174,10 @@ class FlowManager(manager.Manager):
 
         # Create + track the flow
         # print("Creating TCP flow {}".format(flow_id))
-        self.create_flow(node_id, table_id, flow_id, payload)
+        if batch is None:
+            self.create_flow(node_id, table_id, flow_id, payload)
+        else:
+            self.add_flow_to_batch(batch, node_id, table_id, flow_id, payload)
         flow_ids.append(flow["id"])
 
         # =========================================================================
@@ -214,6 +237,10 @@ class FlowManager(manager.Manager):
             if top_data["topology-id"] == top_id:
                 cur_top_node_data = top_data["node"]
 
+        # All flows are collected here and pushed with a few requests per
+        # switch at the end
+        batch = self.new_flow_batch()
+
         # Go through nodes
         for cur_node_data in cur_top_node_data:
             tps = []
@@ -292,8 +319,9 @@ class FlowManager(manager.Manager):
                 # Match packets from the controller
                 # self.add_flow_match(payload, "ipv4-source", self.ctrlr_ip_addr + "/32")
 
-                # Push the flow to the controller
-                self.create_flow(node_id, table_id, flow_id, payload)
+                # Queue the flow for the switch
+                self.add_flow_to_batch(batch, node_id, table_id, flow_id,
+                                       payload)
 
                 # debug
                 # #print("pushing switch flows")
@@ -301,6 +329,9 @@ class FlowManager(manager.Manager):
                 # #print(len(payload["flow"][0]["instructions"]["instruction"][0]["apply-actions"]["action"]))
                 i += 1
 
+        # Push the flows to the controller
+        self.commit_flow_batch(batch)
+
 
     
 # ==============================================================================
@@ -336,8 +367,7 @@ class FlowManager(manager.Manager):
         """ Helper function to create_flow() """
         
         # Create URL
-        url = ("http://{}:8181/restconf/config/".format(self.ctrlr_ip_addr) +
-               "opendaylight-inventory:nodes/node/{}/".format(node_id) +
+        url = ("config/opendaylight-inventory:nodes/node/{}/".format(node_id) +
                "flow-node-inventory:table/{}/flow/{}/".format(table_id, flow_id))
 
 
@@ -349,10 +379,90 @@ class FlowManager(manager.Manager):
         #     print(json.dumps(flow_json, indent=4))
             
         # Push the flow to the switch
-        resp = req.put(url, auth=("admin", "admin"),
-                       headers=self.head, data=json.dumps(flow_json))
+        resp = self.restconf.put(url, json.dumps(flow_json))
+
 
 
+    def new_flow_batch(self):
+        """
+        Get an empty flow batch. Fill it with add_flow_to_batch() and push it
+        with commit_flow_batch().
+        Keys: (node_id, table_id)
+        Values: list of (flow_id, flow_json)
+        """
+        return {}
+
+
+    def add_flow_to_batch(self, batch, node_id, table_id, flow_id, flow_json):
+        """ Add a flow built with get_flow_skeleton() to a flow batch """
+        try:
+            batch[(node_id, table_id)].append((flow_id, flow_json))
+        except KeyError:
+            batch[(node_id, table_id)] = [(flow_id, flow_json)]
+
+
+    def commit_flow_batch(self, batch):
+        """
+        Push every flow in a flow batch and begin tracking the flows.
+        The flows of each node/table are written with ONE request on the table
+        resource, and the requests of different node/tables run concurrently.
+        ODL rejects the write of the whole table if any of its flows already
+        exists, so those tables fall back to one PUT per flow (overwriting
+        flows is fine).
+        Raises FlowWriteError if any flow could not be written.
+        """
+        keys = list(batch)
+        if len(keys) == 0:
+            return
+
+        # One POST per node/table
+        requests = []
+        for node_id, table_id in keys:
+            url = self.__get_table_url(node_id, table_id)
+            flows = [flow_json["flow"][0]
+                     for flow_id, flow_json in batch[(node_id, table_id)]]
+            requests.append(("POST", url, json.dumps({"flow": flows})))
+        resps = self.restconf.aio.run(requests)
+
+        # Retry failed tables flow by flow
+        requests = []
+        retried = []
+        for key, resp in zip(keys, resps):
+            if isinstance(resp, Exception) or not resp.ok:
+                node_id, table_id = key
+                for flow_id, flow_json in batch[key]:
+                    url = self.__get_flow_url(node_id, table_id, flow_id)
+                    requests.append(("PUT", url, json.dumps(flow_json)))
+                    retried.append((node_id, table_id, flow_id))
+        resps = self.restconf.aio.run(requests)
+
+        failed = []
+        for flow, resp in zip(retried, resps):
+            if isinstance(resp, Exception) or not resp.ok:
+                failed.append(flow)
+
+        # Track the newly created flows
+        for node_id, table_id in keys:
+            for flow_id, flow_json in batch[(node_id, table_id)]:
+                if (node_id, table_id, flow_id) not in failed:
+                    self._track_flow(node_id, table_id, flow_id)
+
+        batch.clear()
+
+        if failed:
+            raise FlowWriteError("{} of the flows could not be written".format(
+                len(failed)), failed)
+
+
+    def __get_table_url(self, node_id, table_id):
+        return ("config/opendaylight-inventory:nodes/node/{}/".format(node_id) +
+                "flow-node-inventory:table/{}/".format(table_id))
+
+
+    def __get_flow_url(self, node_id, table_id, flow_id):
+        return (self.__get_table_url(node_id, table_id) +
+                "flow/{}/".format(flow_id))
+
 
     def delete_flow(self, node_id, table_id, flow_id):
         """ 
@@ -383,8 +493,7 @@ class FlowManager(manager.Manager):
         """ Helper function to delete_flow() """
         
         # Create URL
-        url = ("http://{}:8181/restconf/config/".format(self.ctrlr_ip_addr) +
-               "opendaylight-inventory:nodes/node/{}/".format(node_id) +
+        url = ("config/opendaylight-inventory:nodes/node/{}/".format(node_id) +
                "flow-node-inventory:table/{}/flow/{}/".format(table_id, flow_id))
 
         # if __debug__:
@@ -393,7 +502,7 @@ class FlowManager(manager.Manager):
         #     print("URL: %s" % url)
         
         # Delete the flow from the switch
-        resp = req.delete(url, auth=("admin", "admin"), headers=self.head)
+        resp = self.restconf.delete(url)
         
 
     def _track_flow(self, node_id, table_id, flow_id):
@@ -436,11 +545,10 @@ class FlowManager(manager.Manager):
 
         # Return a dict with information on any desired flow from a switch
     def get_flow(self, node_id, table_id, flow_id):
-        url = ("http://{}:8181/restconf/config/".format(self.ctrlr_ip_addr) +
-               "opendaylight-inventory:nodes/node/{}/".format(switch_id) +
+        url = ("config/opendaylight-inventory:nodes/node/{}/".format(switch_id) +
                "flow-node-inventory:table/{}/flow/{}/".format(table_id, flow_id))
 
-        resp = req.get(url, auth=("admin", "admin"), headers=self.head)
+        resp = self.restconf.get(url)
         data = resp.json()
 
         return data
@@ -449,10 +557,9 @@ class FlowManager(manager.Manager):
     # Return list of all flows for a specific ovs node.
     # Each element is a dictionary containing flow information
     def get_all_flows(self, switch_id):
-        url = ("http://{}:8181/restconf/config/".format(self.ctrlr_ip_addr) +
-               "opendaylight-inventory:nodes/node/{}/".format(switch_id))
+        url = "config/opendaylight-inventory:nodes/node/{}/".format(switch_id)
 
-        resp = req.get(url, auth=("admin", "admin"), headers=self.head)
+        resp = self.restconf.get(url)
         data = resp.json()
         # #print(json.dumps(data, indent=3))
 
@@ -477,12 +584,11 @@ class FlowManager(manager.Manager):
         """
 
         # Create URL
-        url = ("http://{}:8181/restconf/operational/".format(self.ctrlr_ip_addr) +
-               "opendaylight-inventory:nodes/node/{}/".format(node_id) +
+        url = ("operational/opendaylight-inventory:nodes/node/{}/".format(node_id) +
                "flow-node-inventory:table/{}/flow/{}/".format(table_id, flow_id))
 
         # Query the flow
-        resp = req.get(url, auth=("admin", "admin"), headers=self.head)
+        resp = self.restconf.get(url)
 
         if resp.ok:
             # 200 or other good code detected - operational
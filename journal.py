@@ -0,0 +1,107 @@
+# This file is a part of the The Fog Development Kit (FDK)
+#
+# Developed by:
+# - Colton Powell
+# - Christopher Desiniotis
+# - Dr. Behnam Dezfouli
+#
+# In the Internet of Things Research Lab, Santa Clara University, CA, USA
+
+import collections
+import itertools
+import threading
+
+
+# Kinds of Change records
+NODE_ADDED = "node-added"               # key: node_id, value: node object
+NODE_REMOVED = "node-removed"           # key: node_id, value: node object
+NODE_ROLE_CHANGED = "node-role-changed" # key: node_id, value: new node object
+LINK_ADDED = "link-added"               # key: (src_port, dst_port), value: Link
+LINK_REMOVED = "link-removed"           # key: (src_port, dst_port), value: Link
+LINK_RESERVATION = "link-reservation"   # key: (src_port, dst_port), value: delta bps
+LINK_CAPACITY = "link-capacity"         # key: (src_port, dst_port), value: new bps
+
+# One entry of a ChangeJournal. Links are directed: adding/removing a link
+# records a change for each direction.
+Change = collections.namedtuple("Change", ["version", "kind", "key", "value"])
+
+
+class ChangeJournal:
+    """
+    ChangeJournal is a versioned log of the changes made to a Topology (nodes
+    added/removed/changing role, links added/removed, reservation deltas and
+    capacity changes). Every change gets the next version number.
+
+    Consumers keeping structures derived from the topology subscribe() and
+    read the changes since their last read, so they can update those
+    structures incrementally instead of rescanning the whole topology. Only
+    the last maxlen changes are kept - a consumer that falls further behind
+    is told to rescan.
+    """
+
+    def __init__(self, maxlen=100000):
+        self.changes = collections.deque(maxlen=maxlen)
+        self.version = 0 # Version of the latest change
+
+        # Changes are recorded under the topology mutex as well as under
+        # reservation locks
+        self.mutex = threading.Lock()
+
+
+    def record(self, kind, key, value=None):
+        """ Append a change to the journal """
+        with self.mutex:
+            self.version += 1
+            self.changes.append(Change(self.version, kind, key, value))
+
+
+    def get_version(self):
+        return self.version
+
+
+    def changes_since(self, version):
+        """
+        Return (latest version, list of changes after version). The list is
+        None if some of those changes were already dropped from the journal.
+        """
+        with self.mutex:
+            latest = self.version
+            if version >= latest:
+                return latest, []
+
+            oldest = self.changes[0].version if self.changes else latest + 1
+            if oldest > version + 1:
+                return latest, None
+
+            start = version + 1 - oldest
+            return latest, list(itertools.islice(self.changes, start, None))
+
+
+    def subscribe(self):
+        """ Return a JournalCursor reading the changes made from now on """
+        return JournalCursor(self, self.version)
+
+
+class JournalCursor:
+    """ The position of one consumer in a ChangeJournal """
+
+    def __init__(self, journal, version=0):
+        self.journal = journal
+        self.version = version # Last version read
+
+
+    def read(self):
+        """
+        Return the changes made since the last read() and move past them.
+        Returns None if they are no longer all in the journal (the consumer
+        has to rescan, see skip()).
+        """
+        latest, changes = self.journal.changes_since(self.version)
+        if changes is not None:
+            self.version = latest
+        return changes
+
+
+    def skip(self):
+        """ Move past every change made so far (e.g. after a rescan) """
+        self.version = self.journal.get_version()
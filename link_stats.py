@@ -0,0 +1,313 @@
+# This file is a part of the The Fog Development Kit (FDK)
+#
+# Developed by:
+# - Colton Powell
+# - Christopher Desiniotis
+# - Dr. Behnam Dezfouli
+#
+# In the Internet of Things Research Lab, Santa Clara University, CA, USA
+
+import numpy as np
+
+import journal
+
+
+class LinkStats:
+    """
+    LinkStats is a columnar (NumPy) copy of the per-link counters of a
+    Topology, used to compute the statistics of every link of a poll at once
+    instead of edge by edge.
+
+    Every edge (Link) of the topology gets a row, its link_id. The Link
+    objects stay the authoritative per-edge view: rows are added/removed as
+    links are added/removed (read from the topology's ChangeJournal), and
+    every poll writes its results (byte counters, bps_current, bps_capacity,
+    utilization_pct) back to them.
+    """
+
+    COLUMNS = (
+        "cur_bytes_sent",
+        "cur_bytes_recvd",
+        "prev_bytes_sent",
+        "prev_bytes_recvd",
+        "src_speed",
+        "dst_speed"
+    )
+
+    def __init__(self, change_journal=None):
+        self.edges = []        # Link objects, indexed by link_id
+        self.port_rows = {}    # src port ofid -> list of link_ids
+
+        # Columns, indexed by link_id
+        self.cur_bytes_sent = np.zeros(0, dtype=np.int64)
+        self.cur_bytes_recvd = np.zeros(0, dtype=np.int64)
+        self.prev_bytes_sent = np.zeros(0, dtype=np.int64)
+        self.prev_bytes_recvd = np.zeros(0, dtype=np.int64)
+        self.src_speed = np.zeros(0, dtype=np.int64) # bps
+        self.dst_speed = np.zeros(0, dtype=np.int64) # bps
+
+        # min(src_speed, dst_speed), updated whenever those change
+        # NOTE: need to add support for full/half duplex
+        self.capacity = np.zeros(0, dtype=np.int64) # bps
+
+        # Set when all rows must be rebuilt or port speeds may have changed
+        self.structure_stale = True
+        self.speeds_stale = True
+
+        # Links added/removed since the last sync(). Without a journal, the
+        # rows are rebuilt after every invalidate().
+        self.cursor = None
+        if change_journal is not None:
+            self.cursor = change_journal.subscribe()
+
+
+    def __len__(self):
+        return len(self.edges)
+
+
+    def invalidate(self):
+        """ Rebuild all rows before the next poll (links added/removed) """
+        self.structure_stale = True
+
+
+    def invalidate_speeds(self):
+        """ Re-read the port speeds before the next poll """
+        self.speeds_stale = True
+
+
+    def sync(self, top, max_link_speed):
+        """
+        Bring the columns up to date with top. Only does work for links
+        added/removed since the last sync(), or after invalidate() or
+        invalidate_speeds(). Call with the topology mutex held.
+        """
+        if self.cursor is not None and not self.structure_stale:
+            changes = self.cursor.read()
+            if changes is None:
+                # Fell behind the journal
+                self.structure_stale = True
+            else:
+                self.__apply_changes(top, changes, max_link_speed)
+
+        if self.structure_stale:
+            if self.cursor is not None:
+                self.cursor.skip()
+            self.__rebuild(top)
+            self.speeds_stale = True
+        if self.speeds_stale:
+            self.__refresh_speeds(top, max_link_speed)
+
+
+    def __apply_changes(self, top, changes, max_link_speed):
+        """ Add/remove the rows of links added/removed in changes """
+        # Net effect of changes (links may be added and removed again)
+        added = {} # Link -> None, insertion ordered
+        removed = []
+        for change in changes:
+            if change.kind == journal.LINK_ADDED:
+                added[change.value] = None
+            elif change.kind == journal.LINK_REMOVED:
+                if change.value in added:
+                    del added[change.value]
+                else:
+                    removed.append(change.value)
+
+        if removed:
+            self.__remove_rows(removed)
+        if added:
+            self.__add_rows(top, list(added), max_link_speed)
+        if removed or added:
+            self.capacity = np.minimum(self.src_speed, self.dst_speed)
+
+
+    def __remove_rows(self, removed):
+        # Move the last row into each removed row, then truncate
+        columns = [getattr(self, name) for name in LinkStats.COLUMNS]
+        for edge in removed:
+            row = edge.link_id
+            if (row is None or row >= len(self.edges) or
+                self.edges[row] is not edge):
+                continue
+
+            rows = self.port_rows[edge.src_port]
+            rows.remove(row)
+            if not rows:
+                del self.port_rows[edge.src_port]
+
+            last = len(self.edges) - 1
+            if row != last:
+                moved = self.edges[last]
+                moved.link_id = row
+                self.edges[row] = moved
+                rows = self.port_rows[moved.src_port]
+                rows[rows.index(last)] = row
+                for column in columns:
+                    column[row] = column[last]
+
+            self.edges.pop()
+            edge.link_id = None
+
+        for name, column in zip(LinkStats.COLUMNS, columns):
+            setattr(self, name, column[:len(self.edges)].copy())
+
+
+    def __add_rows(self, top, edges, max_link_speed):
+        for edge in edges:
+            edge.link_id = len(self.edges)
+            self.port_rows.setdefault(edge.src_port, []).append(edge.link_id)
+            self.edges.append(edge)
+
+        speeds = {}
+        new_columns = {
+            "cur_bytes_sent": [e.cur_bytes_sent for e in edges],
+            "cur_bytes_recvd": [e.cur_bytes_recvd for e in edges],
+            "prev_bytes_sent": [e.prev_bytes_sent for e in edges],
+            "prev_bytes_recvd": [e.prev_bytes_recvd for e in edges],
+            "src_speed": [self.__port_speed(top, e.src_port, max_link_speed,
+                                            speeds) for e in edges],
+            "dst_speed": [self.__port_speed(top, e.dst_port, max_link_speed,
+                                            speeds) for e in edges]
+        }
+        for name in LinkStats.COLUMNS:
+            setattr(self, name, np.concatenate(
+                (getattr(self, name),
+                 np.array(new_columns[name], dtype=np.int64))))
+
+
+    def __rebuild(self, top):
+        edges = []
+        port_rows = {}
+        for node_id in top.neighbors:
+            for edge in top.neighbors[node_id]:
+                edge.link_id = len(edges)
+                port_rows.setdefault(edge.src_port, []).append(edge.link_id)
+                edges.append(edge)
+
+        self.edges = edges
+        self.port_rows = port_rows
+        self.cur_bytes_sent = np.array([e.cur_bytes_sent for e in edges],
+                                       dtype=np.int64)
+        self.cur_bytes_recvd = np.array([e.cur_bytes_recvd for e in edges],
+                                        dtype=np.int64)
+        self.prev_bytes_sent = np.array([e.prev_bytes_sent for e in edges],
+                                        dtype=np.int64)
+        self.prev_bytes_recvd = np.array([e.prev_bytes_recvd for e in edges],
+                                         dtype=np.int64)
+        self.structure_stale = False
+
+
+    def __port_speed(self, top, port_ofid, max_link_speed, speeds):
+        # speeds caches the ports looked up so far (each is on 2 edges)
+        try:
+            return speeds[port_ofid]
+        except KeyError:
+            pass
+
+        if port_ofid.startswith("host"):
+            speed = max_link_speed
+        else:
+            node_id = port_ofid.rsplit(":", 1)[0]
+            speed = top.get_node(node_id).get_port_bps(port_ofid)
+            # Ports not reporting a speed (yet) are treated like 0 bps
+            if speed is None:
+                speed = 0
+
+        speeds[port_ofid] = speed
+        return speed
+
+
+    def __refresh_speeds(self, top, max_link_speed):
+        speeds = {}
+        self.src_speed = np.array(
+            [self.__port_speed(top, e.src_port, max_link_speed, speeds)
+             for e in self.edges], dtype=np.int64)
+        self.dst_speed = np.array(
+            [self.__port_speed(top, e.dst_port, max_link_speed, speeds)
+             for e in self.edges], dtype=np.int64)
+        self.capacity = np.minimum(self.src_speed, self.dst_speed)
+        self.speeds_stale = False
+
+
+    def apply_port_stats(self, port_stats):
+        """
+        Shift in new byte counters. port_stats maps src port ofids to the
+        "bytes" statistics of the port. Rows of ports without statistics
+        (hosts, etc.) keep their counters.
+        """
+        rows = []
+        sent = []
+        recvd = []
+        for port_ofid, port_rows in self.port_rows.items():
+            try:
+                util_data = port_stats[port_ofid]
+            except KeyError:
+                continue
+            for row in port_rows:
+                rows.append(row)
+                sent.append(util_data["transmitted"])
+                recvd.append(util_data["received"])
+
+        rows = np.array(rows, dtype=np.intp)
+        self.prev_bytes_sent[rows] = self.cur_bytes_sent[rows]
+        self.prev_bytes_recvd[rows] = self.cur_bytes_recvd[rows]
+        self.cur_bytes_sent[rows] = sent
+        self.cur_bytes_recvd[rows] = recvd
+
+
+    def compute(self, interval):
+        """
+        Return (bps_current, bps_capacity, utilization_pct) columns for a
+        poll interval (secs). Links without capacity get a utilization of
+        110% so they are never used.
+        """
+        new_bits_sent = (self.cur_bytes_sent - self.prev_bytes_sent) * 8
+        bps_current = new_bits_sent // interval
+
+        bps_capacity = self.capacity
+
+        has_capacity = bps_capacity != 0
+        utilization_pct = np.full(len(self.edges), 110.0)
+        np.divide(bps_current, bps_capacity, out=utilization_pct,
+                  where=has_capacity, casting="unsafe")
+        utilization_pct[has_capacity] *= 100
+
+        return bps_current, bps_capacity, utilization_pct
+
+
+    def write_back(self, bps_current, bps_capacity, utilization_pct):
+        """
+        Copy the columns of a poll back to the Link objects. Returns the
+        edges whose capacity changed.
+        """
+        capacity_changed = []
+        columns = zip(self.edges,
+                      self.cur_bytes_sent.tolist(),
+                      self.cur_bytes_recvd.tolist(),
+                      self.prev_bytes_sent.tolist(),
+                      self.prev_bytes_recvd.tolist(),
+                      bps_current.tolist(),
+                      bps_capacity.tolist(),
+                      utilization_pct.tolist())
+        for (edge, cur_sent, cur_recvd, prev_sent, prev_recvd, bps, capacity,
+             utilization) in columns:
+            edge.cur_bytes_sent = cur_sent
+            edge.cur_bytes_recvd = cur_recvd
+            edge.prev_bytes_sent = prev_sent
+            edge.prev_bytes_recvd = prev_recvd
+            edge.bps_current = bps
+            if edge.bps_capacity != capacity:
+                edge.bps_capacity = capacity
+                capacity_changed.append(edge)
+            edge.utilization_pct = utilization
+
+        return capacity_changed
+
+
+    def zero_speed_ports(self, bps_capacity):
+        """
+        Return (link_id, src speed is 0, dst speed is 0) for each link
+        without capacity.
+        """
+        rows = np.flatnonzero(bps_capacity == 0).tolist()
+        return [(row, self.src_speed[row] == 0, self.dst_speed[row] == 0)
+                for row in rows]
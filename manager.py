@@ -7,6 +7,7 @@
 # 
 # In the Internet of Things Research Lab, Santa Clara University, CA, USA
 
+import restconf
 import socket
 import threading
 import topology
@@ -17,11 +18,21 @@ class Manager:
     maximum code-reuse
     """
     
-    def __init__(self, mgrs, head, ctrlr_ip_addr):
+    def __init__(self, mgrs, head, ctrlr_ip_addr, restconf_client=None,
+                 pool_size=10, timeout=10.0):
         self.mgrs = mgrs                   # Refs to other Managers (see fdk.py)
         self.ctrlr_ip_addr = ctrlr_ip_addr # IP Address of controller
         self.head = head                   # HTTP Header
 
+        # Pooled keep-alive client used for ALL calls into ODL.
+        # fdk.py creates one client and hands it to every Manager so they
+        # share the same connection pool. A Manager created on its own gets
+        # a private pool of pool_size connections.
+        if restconf_client is None:
+            restconf_client = restconf.RestconfClient(ctrlr_ip_addr, head,
+                                                      pool_size, timeout)
+        self.restconf = restconf_client
+
         # Socket storage. key=Socket-description, value=socket
         # Ex: socks["greeting"] stores greeting serv socket (in TopologyManager)
         # ALL OPENED SOCKETS SHOULD BE STORED HERE SO shutdown() CAN CLEANLY
@@ -35,10 +46,13 @@ class Manager:
         # HERE SO shutdown() CAN CLEANLY CLOSE THEM
         self.threads = {}
         
-    def shutdown(self):
+    def shutdown(self, warm=False):
         """
         shutdown() performs a clean shutdown of the Manager object by shutting
         down any open sockets and other resources.
+
+        With warm=True, state in the network (queues, flows, containers) is
+        left in place for a warm restart (see warm_restart.py).
         """
 
         # Close all sockets
@@ -0,0 +1,468 @@
+# This file is a part of the The Fog Development Kit (FDK)
+#
+# Developed by:
+# - Colton Powell
+# - Christopher Desiniotis
+# - Dr. Behnam Dezfouli
+#
+# In the Internet of Things Research Lab, Santa Clara University, CA, USA
+
+import collections
+import copy
+import heapq
+import math
+import threading
+
+import dary_heap
+
+
+# What a dijkstra() result depends on, as CompiledTopology edge indices:
+# - tree_edges: the previous edges of the result
+# - examined_edges: every edge the search looked at (leaving a settled node)
+# - min_bandwidth, max_bandwidth: the result holds for required bandwidths
+#   in (min_bandwidth, max_bandwidth] (same edges usable)
+PathDependencies = collections.namedtuple(
+    "PathDependencies",
+    ["tree_edges", "examined_edges", "min_bandwidth", "max_bandwidth"])
+
+
+class CompiledTopology:
+    """
+    CompiledTopology is the links of a TopologySnapshot in CSR (compressed
+    sparse row) form, for path computations. Node ids are interned into
+    integer handles 0..n-1, and the edges leaving handle h are
+    offsets[h] <= i < offsets[h+1] of the per-edge arrays:
+    - sources/targets: handles of the src/dst node
+    - src_ports/dst_ports: port ids of the edge
+    - avail: available bandwidth (bps_capacity - bps_reserved)
+    - inv_avail: 1/avail, the edge weight (inf without available bandwidth)
+
+    The structure (handles, offsets, sources/targets, ports) only depends on the
+    nodes and links of the snapshot; with_bandwidth() shares it with a
+    newer snapshot of the same structure.
+    """
+
+    def __init__(self, snapshot):
+        self.structure_version = snapshot.structure_version
+
+        self.node_ids = list(snapshot.neighbors) # handle -> node id
+        self.handles = {}                        # node id -> handle
+        for h, node_id in enumerate(self.node_ids):
+            self.handles[node_id] = h
+
+        offsets = [0]
+        sources = []
+        targets = []
+        src_ports = []
+        dst_ports = []
+        for node_id in self.node_ids:
+            h = self.handles[node_id]
+            for e in snapshot.neighbors[node_id]:
+                sources.append(h)
+                targets.append(self.handles[e.dst_node_id])
+                src_ports.append(e.src_port)
+                dst_ports.append(e.dst_port)
+            offsets.append(len(targets))
+
+        self.offsets = offsets
+        self.sources = sources
+        self.targets = targets
+        self.src_ports = src_ports
+        self.dst_ports = dst_ports
+
+        # Heap arity of dijkstra(), see dary_heap
+        n = max(1, snapshot.get_num_nodes())
+        self.d = max(2, snapshot.get_num_links()//n)
+
+        self.__set_bandwidth(snapshot)
+
+
+    def with_bandwidth(self, snapshot):
+        """
+        Return a copy with the available bandwidth of snapshot, which must
+        have the same structure_version.
+        """
+        compiled = copy.copy(self)
+        compiled.__set_bandwidth(snapshot)
+        return compiled
+
+
+    def __set_bandwidth(self, snapshot):
+        # Edges are in the same order in every snapshot of a structure
+        # version
+        avail = []
+        for node_id in self.node_ids:
+            for e in snapshot.neighbors[node_id]:
+                avail.append(e.bps_capacity - e.bps_reserved)
+
+        self.version = snapshot.version
+        self.avail = avail
+        self.inv_avail = [1/a if a > 0 else math.inf for a in avail]
+
+
+    def dijkstra(self, src_node_id, required_bandwidth, targets=None):
+        """
+        Shortest (sum of 1/available bandwidth) paths from src_node_id over
+        the edges with at least required_bandwidth available. Returns the
+        cost and previous dicts of ResourceManager.dijkstra().
+
+        With targets (node ids), the search stops as soon as the cheapest
+        targets are known: when every target is settled, or when the
+        frontier is costlier than the cheapest settled target. Only the
+        nodes settled by then are returned, so targets missing from cost
+        have no usable path or are costlier than the cheapest one.
+        """
+        settled, dist, parent = self.__search(
+            self.handles[src_node_id], required_bandwidth,
+            self.__target_handles(targets))
+        return self.__translate(settled, dist, parent)
+
+
+    def dijkstra_with_dependencies(self, src_node_id, required_bandwidth,
+                                   targets=None):
+        """
+        Return (dijkstra() result, PathDependencies of the result), for
+        caching results (see PathEngine).
+        """
+        settled, dist, parent = self.__search(
+            self.handles[src_node_id], required_bandwidth,
+            self.__target_handles(targets))
+        result = self.__translate(settled, dist, parent)
+
+        # The result only depends on the edges leaving the settled nodes
+        offsets = self.offsets
+        examined = []
+        for h in settled:
+            examined.extend(range(offsets[h], offsets[h + 1]))
+
+        min_bandwidth = -math.inf
+        max_bandwidth = math.inf
+        for a in [self.avail[i] for i in examined]:
+            if a < required_bandwidth:
+                if a > min_bandwidth:
+                    min_bandwidth = a
+            elif a < max_bandwidth:
+                max_bandwidth = a
+        tree = frozenset(parent[h] for h in settled if parent[h] >= 0)
+
+        return result, PathDependencies(tree, frozenset(examined),
+                                        min_bandwidth, max_bandwidth)
+
+
+    def k_shortest_paths(self, src_node_id, dst_node_id, required_bandwidth):
+        """
+        Yen's algorithm. Yields (cost, path) for the loopless paths from
+        src_node_id to dst_node_id over the edges with at least
+        required_bandwidth available, cheapest first (same edge weights as
+        dijkstra()). path is the list of previous entries (hops) from
+        dst_node_id back to src_node_id.
+
+        Paths are computed as they are consumed, so only take as many as
+        needed.
+        """
+        src = self.handles[src_node_id]
+        dst = self.handles[dst_node_id]
+
+        first = self.__shortest_path(src, dst, required_bandwidth)
+        if first is None:
+            return
+        found = [first] # paths yielded so far, as lists of edge indices
+        yield self.__path_cost(first), self.__path_hops(first)
+
+        candidates = [] # heap of (cost, path)
+        seen = set([tuple(first)])
+        while True:
+            # Deviate from the last path at each of its nodes (the spur
+            # node), keeping the part before it (the root path)
+            last = found[-1]
+            for j in range(0, len(last)):
+                root = last[:j]
+                spur = self.sources[last[j]]
+
+                # Don't repeat a found path or go back through the root path
+                excluded_edges = set(path[j] for path in found
+                                     if len(path) > j and path[:j] == root)
+                excluded_nodes = set(self.sources[i] for i in root)
+
+                spur_path = self.__shortest_path(spur, dst, required_bandwidth,
+                                                 excluded_nodes,
+                                                 excluded_edges)
+                if spur_path is None:
+                    continue
+                path = tuple(root + spur_path)
+                if path not in seen:
+                    seen.add(path)
+                    heapq.heappush(candidates, (self.__path_cost(path), path))
+
+            if not candidates:
+                return
+            cost, path = heapq.heappop(candidates)
+            found.append(list(path))
+            yield cost, self.__path_hops(path)
+
+
+    def __shortest_path(self, src, dst, required_bandwidth,
+                        excluded_nodes=None, excluded_edges=None):
+        # Edge indices of the shortest usable path from src to dst (handles),
+        # or None
+        settled, dist, parent = self.__search(src, required_bandwidth,
+                                              set([dst]), excluded_nodes,
+                                              excluded_edges)
+        # (dst can't have a finite cost without being settled)
+        if dist[dst] == math.inf:
+            return None
+
+        path = []
+        h = dst
+        while h != src:
+            path.append(parent[h])
+            h = self.sources[parent[h]]
+        path.reverse()
+        return path
+
+
+    def __path_cost(self, path):
+        return sum(self.inv_avail[i] for i in path)
+
+
+    def __path_hops(self, path):
+        return [self.__hop(i) for i in reversed(path)]
+
+
+    def __target_handles(self, targets):
+        if targets is None:
+            return None
+        remaining = set()
+        for node_id in targets:
+            h = self.handles.get(node_id)
+            if h is not None:
+                remaining.add(h)
+        return remaining
+
+
+    def __search(self, src, required_bandwidth, remaining,
+                 excluded_nodes=None, excluded_edges=None):
+        # Returns (settled handles, dist, parent). remaining: the target
+        # handles (modified), or None to search the whole topology.
+        # excluded_nodes/excluded_edges: handles/edge indices not to use.
+        offsets = self.offsets
+        node_targets = self.targets
+        avail = self.avail
+        inv_avail = self.inv_avail
+
+        n = len(self.node_ids)
+
+        dist = [math.inf] * n
+        parent = [-1] * n     # index of the edge into each node
+        reached = [False] * n # pushed onto the heap once
+        done = [False] * n    # popped from the heap
+        order = [src]         # reached handles, in the order reached
+
+        best_cost = math.inf # of the settled targets
+
+        # Excluded nodes are never relaxed
+        if excluded_nodes is not None:
+            for h in excluded_nodes:
+                done[h] = True
+
+        heap = dary_heap.dary_heap(self.d, n)
+
+        dist[src] = 0
+        reached[src] = True
+        heap.push(src, 0)
+
+        while not heap.empty():
+            # Get min node
+            h, h_cost = heap.pop_min()
+
+            if remaining is not None:
+                # Everything left is costlier than the best target (or has
+                # no usable path)
+                if h_cost > best_cost or h_cost == math.inf:
+                    break
+                if h in remaining:
+                    remaining.discard(h)
+                    best_cost = min(best_cost, h_cost)
+                    if not remaining:
+                        done[h] = True
+                        break
+
+            done[h] = True
+
+            for i in range(offsets[h], offsets[h + 1]):
+                n_h = node_targets[i]
+                if done[n_h]:
+                    continue
+                if excluded_edges is not None and i in excluded_edges:
+                    continue
+
+                if avail[i] < required_bandwidth:
+                    n_total_cost = math.inf
+                else:
+                    n_total_cost = h_cost + inv_avail[i]
+
+                # Nodes behind unusable links are still reached (at cost inf)
+                if not reached[n_h]:
+                    reached[n_h] = True
+                    order.append(n_h)
+                    dist[n_h] = n_total_cost
+                    parent[n_h] = i
+                    heap.push(n_h, n_total_cost)
+                elif n_total_cost < dist[n_h]:
+                    dist[n_h] = n_total_cost
+                    parent[n_h] = i
+                    heap.decrease_key(n_h, n_total_cost)
+
+        # Nodes reached but not settled by an early stop only have a
+        # tentative cost - leave them out
+        if remaining is not None:
+            order = [h for h in order if done[h]]
+        return order, dist, parent
+
+
+    def __translate(self, settled, dist, parent):
+        # Translate back to node ids
+        cost = {}     # distance
+        previous = {} # parent
+        for h in settled:
+            node_id = self.node_ids[h]
+            cost[node_id] = dist[h]
+            i = parent[h]
+            if i >= 0:
+                previous[node_id] = self.__hop(i)
+
+        return {
+            "cost": cost,
+            "previous": previous
+        }
+
+
+    def __hop(self, i):
+        # previous entry of edge i
+        return {
+            "dst_node_id": self.node_ids[self.targets[i]],
+            "dst_port": self.dst_ports[i],
+            "src_node_id": self.node_ids[self.sources[i]], # parent of dst node
+            "src_port": self.src_ports[i]
+        }
+
+
+class PathEngine:
+    """
+    PathEngine keeps the CompiledTopology of the latest TopologySnapshot of
+    a Topology for path computations. The CSR structure is only rebuilt when
+    nodes or links were added/removed (the snapshot has a new
+    structure_version); other changes (reservations, capacities) only
+    refresh the available bandwidth.
+
+    Results of dijkstra() on the latest snapshot are kept in an LRU cache
+    of cache_size entries, keyed by source, bandwidth class (power of 2
+    range of the required bandwidth) and targets. An entry stays valid
+    across snapshots until the available bandwidth of an edge on its tree
+    changes, or an edge it examined gets more bandwidth (edges it did not
+    use getting less can't change it). Adding/removing nodes or links
+    clears the cache.
+    """
+
+    def __init__(self, cache_size=1024):
+        self.compiled = None
+
+        # (src node id, bandwidth class, targets) ->
+        #     (PathDependencies, result), least recently used first
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # Guards self.compiled and the cache against request workers
+        self.mutex = threading.Lock()
+
+
+    def compile(self, snapshot):
+        """ Return the CompiledTopology of snapshot """
+        compiled = self.compiled
+        if compiled is not None and compiled.version == snapshot.version:
+            return compiled
+
+        if (compiled is not None and
+            compiled.structure_version == snapshot.structure_version):
+            compiled = compiled.with_bandwidth(snapshot)
+        else:
+            compiled = CompiledTopology(snapshot)
+
+        # Requests run in parallel, possibly on older snapshots - keep the
+        # newest
+        with self.mutex:
+            if self.compiled is None or self.compiled.version < compiled.version:
+                self.__invalidate(self.compiled, compiled)
+                self.compiled = compiled
+        return compiled
+
+
+    def dijkstra(self, snapshot, src_node_id, required_bandwidth,
+                 targets=None):
+        """
+        CompiledTopology.dijkstra() on snapshot, answered from the cache if
+        possible. The result is shared - don't modify it.
+        """
+        compiled = self.compile(snapshot)
+        if targets is not None:
+            targets = frozenset(targets)
+        key = (src_node_id, int(required_bandwidth).bit_length(), targets)
+
+        with self.mutex:
+            # Only results of the latest snapshot are cached
+            cacheable = compiled is self.compiled
+            entry = self.cache.get(key) if cacheable else None
+            if (entry is not None and
+                entry[0].min_bandwidth < required_bandwidth <=
+                entry[0].max_bandwidth):
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                return entry[1]
+            self.cache_misses += 1
+
+        if not cacheable:
+            return compiled.dijkstra(src_node_id, required_bandwidth, targets)
+
+        result, deps = compiled.dijkstra_with_dependencies(
+            src_node_id, required_bandwidth, targets)
+
+        with self.mutex:
+            # Not valid if a newer snapshot was compiled meanwhile
+            if compiled is self.compiled:
+                self.cache[key] = (deps, result)
+                self.cache.move_to_end(key)
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return result
+
+
+    def clear_cache(self):
+        with self.mutex:
+            self.cache.clear()
+
+
+    def __invalidate(self, old, new):
+        # Drop the cache entries old -> new changes. Call with the mutex held.
+        if not self.cache:
+            return
+        if old is None or old.structure_version != new.structure_version:
+            # Edge indices changed
+            self.cache.clear()
+            return
+
+        changed = set()
+        increased = set()
+        for i, (old_avail, new_avail) in enumerate(zip(old.avail, new.avail)):
+            if old_avail != new_avail:
+                changed.add(i)
+                if new_avail > old_avail:
+                    increased.add(i)
+        if not changed:
+            return
+
+        for key, (deps, result) in list(self.cache.items()):
+            if (not deps.tree_edges.isdisjoint(changed) or
+                not deps.examined_edges.isdisjoint(increased)):
+                del self.cache[key]
@@ -7,27 +7,43 @@
 # 
 # In the Internet of Things Research Lab, Santa Clara University, CA, USA
 
+import confirmation
+import flow_manager
 import manager
+import restconf
 
+import concurrent.futures
 import json
 import math
 import random
-import requests as req
 import selectors
 import socket
 import sys
 import time
 import timeit
 import threading
+import traceback
 import types
 import subprocess
 import docker
 import os
-import dary_heap
 
 import topology
 import topology_manager
 
+
+class PathProgrammingError(Exception):
+    """
+    Raised when programming the path of an allocation failed (the
+    allocation is already rolled back): a queue change timed out or flows
+    could not be written. link is the (src_port, dst_port) of the hop which
+    failed, or None if no single hop is to blame.
+    """
+    def __init__(self, msg, link=None):
+        super().__init__(msg)
+        self.link = link
+
+
 class ResourceManager(manager.Manager):
     """
     ResourceManager manages resources in the network by:
@@ -38,13 +54,38 @@ class ResourceManager(manager.Manager):
     - Using OVSDB (via RESTCONF) to setup queues for specific flows
     - <More stuff here>
     """
-    def __init__(self, mgrs, head, ctrlr_ip_addr, swarm=None):
+    def __init__(self, mgrs, head, ctrlr_ip_addr, swarm=None,
+                 restconf_client=None, request_workers=1):
         # Call Manager constructor
-        super().__init__(mgrs, head, ctrlr_ip_addr)
+        super().__init__(mgrs, head, ctrlr_ip_addr, restconf_client)
 
         # 1 Tbps max link speed
         self.max_link_speed = 1000000000000
 
+        # Workers handling edge and shutdown requests. Each request only
+        # holds the reservation locks of its own fog node and path, so
+        # requests over disjoint paths are allocated in parallel.
+        self.request_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=request_workers, thread_name_prefix="requests")
+
+        # Set by stop_requests(). The edge/shutdown request servers check it
+        # at least once per interval and stop taking requests.
+        self.requests_stopped = threading.Event()
+
+        # Guards self.allocated_resources (and swarm port numbers) and
+        # self.req_id/self.test_data against concurrent request workers
+        self.alloc_mutex = threading.Lock()
+        self.stats_mutex = threading.Lock()
+
+        # Times the RAA searches again when the resources it chose on a
+        # topology snapshot were taken before it could allocate them
+        self.raa_attempts = 3
+
+        # Paths to the chosen fog node the RAA tries on one snapshot (the
+        # shortest one, then alternatives - see k_shortest_paths()) when
+        # links on them were taken meanwhile
+        self.raa_paths = 3
+
         # Allocated resources - used for deallocation later
         self.allocated_resources = {
             # "edge-node-id": {
@@ -155,13 +196,20 @@ class ResourceManager(manager.Manager):
             self.swarm = DockerSwarm(ctrlr_ip_addr=ctrlr_ip_addr)
 
             
-    def shutdown(self):
-        super(ResourceManager, self).shutdown()
+    def shutdown(self, warm=False):
+        super(ResourceManager, self).shutdown(warm)
+
+        # Stop taking edge/shutdown requests
+        self.stop_requests()
 
         # write test data to file
         json.dump(self.test_data, self.test_data_fp)
         # close file
         self.test_data_fp.close()
+
+        # Containers stay up for a warm restart
+        if warm:
+            return
         
         # shutdown containers
         self.swarm.remove_all_containers()
@@ -173,23 +221,29 @@ class ResourceManager(manager.Manager):
         # Add other shutdown capabilities here
         
         
-    def start_link_util(self, top_id="flow:1", interval=1.0):
+    def start_link_util(self, top_id="flow:1", interval=1.0, bulk=True):
         """
         start_link_util:
         Starts a thread that retrieves and prints out link utilization
         information once every interval seconds
 
+        bulk=True reads the whole opendaylight-inventory once per interval
+        and fans the port statistics out to every link (1 request per tick).
+        bulk=False reads each switch separately, with all reads of a tick
+        running in parallel.
+
         notes:
         link = 2-tuple consisting of source and destination port (which are strings)
         Ex: ("openflow:1234:1", "openflow:5678:2")
         """
 
         self.threads["link_util"] = threading.Thread(target=self.__start_link_util,
-                                                     args=(top_id, interval, ))
+                                                     args=(top_id, interval,
+                                                           bulk, ))
         self.threads["link_util"].start()                        
         
 
-    def __start_link_util(self, top_id="flow:1", interval=1.0):
+    def __start_link_util(self, top_id="flow:1", interval=1.0, bulk=True):
         top_mgr = self.mgrs["top"]
         cur_top = top_mgr.get_topology(top_id)
         
@@ -197,8 +251,12 @@ class ResourceManager(manager.Manager):
         while True:
             start_time = timeit.default_timer()
             cur_top.acquire_mutex(sys._getframe().f_code.co_name)
-            self.update_bandwidth_data(top_id, interval)
+            reservations = self.__update_link_stats(top_id, interval, bulk)
             cur_top.release_mutex(sys._getframe().f_code.co_name)
+
+            # Reservations wait for the link locks, which allocations hold
+            # while programming switches - never wait for them with the mutex
+            self.__apply_zero_speed_reservations(cur_top, reservations)
             # Not sure why we had another thread spinning off here
             # thread = threading.Thread(target=self.update_bandwidth_data,
             #                           args=(top_id, interval, ))
@@ -216,16 +274,32 @@ class ResourceManager(manager.Manager):
                 first_run = False
 
             if elapsed_time > interval:
+                # Slow poll - start the next one right away
                 fname = sys._getframe().f_code.co_name
-                #print("{}: ERROR".format(fname), file=sys.stderr)
-                return
+                print("{}: poll took {:.2f}s (interval {:.2f}s)".format(
+                    fname, elapsed_time, interval), file=sys.stderr)
             else:
                 time.sleep(interval - elapsed_time)
 
                 
     # interval is a float and is in seconds
-    def update_bandwidth_data(self, top_id, interval):
-        self.__update_bandwidth_data(top_id)
+    def update_bandwidth_data(self, top_id, interval, bulk=True):
+        cur_top = self.mgrs["top"].get_topology(top_id)
+        reservations = self.__update_link_stats(top_id, interval, bulk)
+        self.__apply_zero_speed_reservations(cur_top, reservations)
+
+
+    def __update_link_stats(self, top_id, interval, bulk=True):
+        """
+        Read the port statistics and update the link statistics of top_id.
+        Returns the reservations (node id, port, bps) which take links not
+        reporting their capacity correctly out of use; see
+        __apply_zero_speed_reservations().
+        """
+        if bulk:
+            self.__update_bandwidth_data_bulk(top_id)
+        else:
+            self.__update_bandwidth_data(top_id)
 
         # Keep this seperate from __update_bandwidth_data
         # We want to make all requests first in that function, then update
@@ -233,118 +307,123 @@ class ResourceManager(manager.Manager):
         # other resulting in inconsistent)
         top_mgr = self.mgrs["top"]
         cur_top = top_mgr.get_topology(top_id)
+        stats = cur_top.link_stats
+        stats.sync(cur_top, self.max_link_speed)
+
+        # Calculate the statistics of all links at once (see LinkStats)
+        # new_bits / interval -> bits per second on the link
+        bps_current, bps_capacity, utilization_pct = stats.compute(interval)
+        capacity_changed = stats.write_back(bps_current, bps_capacity,
+                                            utilization_pct)
+        cur_top.record_capacity_changes(capacity_changed)
+        cur_top.mark_changed()
+
+        # Don't use links not reporting capacity correctly
+        reservations = []
+        for link_id, src_zero, dst_zero in stats.zero_speed_ports(bps_capacity):
+            edge = stats.edges[link_id]
+            if src_zero:
+                reservations.append((edge.src_node_id, edge.src_port,
+                                     self.max_link_speed))
+            if dst_zero:
+                reservations.append((edge.src_node_id, edge.dst_port,
+                                     self.max_link_speed))
+
+        return reservations
+
+
+    def __apply_zero_speed_reservations(self, cur_top, reservations):
+        # Takes the link locks - call without holding the topology mutex
+        for node_id, port, value in reservations:
+            cur_top.add_link_reservation(node_id, port, value)
+                    
         
-        for node_id in cur_top.get_node_ids():
-            for edge in cur_top.get_neighbors(node_id):
-                # Get link data from the TopologyManager
-                cur_bytes_sent = edge["cur_bytes_sent"]
-                cur_bytes_recvd = edge["cur_bytes_recvd"]
-                prev_bytes_sent = edge["prev_bytes_sent"]
-                prev_bytes_recvd = edge["prev_bytes_recvd"]
-
-                # Calculate link statistics based on the data from TopologyManager
-                new_bytes_sent = cur_bytes_sent - prev_bytes_sent
-                new_bits_sent = new_bytes_sent * 8
-                
-                new_bytes_recvd = cur_bytes_recvd - prev_bytes_recvd
-                new_bits_recvd = new_bytes_recvd * 8
-                
-                new_bytes = new_bytes_sent + new_bytes_recvd
-                new_bits = new_bytes * 8
+    def __update_bandwidth_data(self, top_id):
+        """
+        Read the statistics of every switch with one request per switch. The
+        requests of a poll are issued in parallel, so a poll costs about one
+        round-trip to ODL regardless of the number of switches.
+        """
+        cur_top = self.mgrs["top"].get_topology(top_id)
 
-                # new_bits / interval -> bits per second on the link
-                edge["bps_current"] = new_bits_sent // interval
+        # One operational read per switch, all in flight at the same time
+        switch_ids = cur_top.get_switch_ids()
+        urls = [("operational/" +
+                 "opendaylight-inventory:nodes/node/{}/".format(node_id))
+                for node_id in switch_ids]
+        resps = self.restconf.get_all(urls)
 
-                # Get link speed information
-                src_port_ofid = edge["src_port"]
-                if src_port_ofid.startswith("host"):
-                    src_port_speed = self.max_link_speed
-                else:
-                    src_node_id = src_port_ofid.rsplit(":", 1)[0]
-                    src_node = cur_top.get_node(src_node_id)
-                    src_port_speed = src_node.get_port_speed(src_port_ofid) #kbps
-                    src_port_speed *= 1000
-
-                dst_port_ofid = edge["dst_port"]
-                if dst_port_ofid.startswith("host"):
-                    dst_port_speed = self.max_link_speed
-                else:
-                    dst_node_id = dst_port_ofid.rsplit(":", 1)[0]
-                    dst_node = cur_top.get_node(dst_node_id)
-                    dst_port_speed = dst_node.get_port_speed(dst_port_ofid) #kbps
-                    dst_port_speed *= 1000
+        nodes = []
+        for resp in resps:
+            try:
+                nodes.append(self.__parse_stats(resp.content)["node"][0])
+            except Exception as ex:
+                ex_type = type(ex).__name__
+                fname = sys._getframe().f_code.co_name
+                # #print("{}: {} parsing data for {}".format(fname, ex_type, top_id),
+                #       file=sys.stderr)
+                continue
 
-                # Update the capacity of the link
-                # NOTE: need to add support for full/half duplex
-                edge["bps_capacity"] = min(src_port_speed, dst_port_speed)
+        self.__apply_port_stats(cur_top, self.__index_port_stats(nodes))
 
-                # Update link utilization
-                try:
-                    ratio = edge["bps_current"] / edge["bps_capacity"] 
-                    edge["utilization_pct"] = ratio * 100
-                except ZeroDivisionError:
-                    # Don't use links not reporting capacity correctly
-                    edge["utilization_pct"] = 110
-
-                    if (src_port_speed == 0):
-                        cur_top.add_link_reservation(node_id, src_port_ofid,
-                                                     self.max_link_speed)
-                    if (dst_port_speed == 0):
-                        cur_top.add_link_reservation(node_id, dst_port_ofid,
-                                                     self.max_link_speed)
-                    
-        
-    def __update_bandwidth_data(self, top_id):
+
+    def __update_bandwidth_data_bulk(self, top_id):
+        """
+        Same as __update_bandwidth_data, but reads the statistics of every
+        port in a single request to opendaylight-inventory:nodes. Number of
+        requests per poll is constant instead of 1 per switch.
+        """
         cur_top = self.mgrs["top"].get_topology(top_id)
 
-        for node_id in cur_top.get_node_ids():
-            for edge in cur_top.get_neighbors(node_id):
-                # Get the port/link we're updating bandwidth for
-                port_ofid = edge["src_port"]
-                
-                # Then create a URL to get utilization information for the link
-                url = ("http://{}:8181/".format(self.ctrlr_ip_addr) +
-                       "restconf/operational/" +
-                       "opendaylight-inventory:nodes/node/{}/".format(node_id) +
-                       "node-connector/{}".format(port_ofid))
-
-                # Make and parse request
-                resp = req.get(url, auth=("admin", "admin"), headers=self.head)
+        # Grab the statistics of all ports on all switches at once
+        url = "operational/opendaylight-inventory:nodes/"
+        resp = self.restconf.get(url)
+        try:
+            nodes = self.__parse_stats(resp.content)["nodes"]["node"]
+        except Exception as ex:
+            ex_type = type(ex).__name__
+            fname = sys._getframe().f_code.co_name
+            # #print("{}: {} parsing data for {}".format(fname, ex_type, top_id),
+            #       file=sys.stderr)
+            return
+
+        self.__apply_port_stats(cur_top, self.__index_port_stats(nodes))
+
+
+    def __parse_stats(self, content):
+        """
+        Parse opendaylight-inventory data read for port statistics. Flow
+        tables etc. are dropped while parsing if TopologyManager.compact_parse
+        is set.
+        """
+        if self.mgrs["top"].compact_parse:
+            return restconf.loads_compact(content,
+                                          restconf.INVENTORY_UNUSED_KEYS)
+        return json.loads(content)
+
+
+    def __index_port_stats(self, nodes):
+        """
+        Index the byte counters of all ports in a list of
+        opendaylight-inventory nodes by port OF id.
+        """
+        key = ("opendaylight-port-statistics:"
+               "flow-capable-node-connector-statistics")
+        port_stats = {}
+        for node in nodes:
+            for port in node.get("node-connector", []):
                 try:
-                    # #print(json.dumps(resp.json(), indent=3), file=sys.stderr)
-                    # index 0 appears to have all information... Not sure why
-                    # its in a list
-                    # #print(url)
-                    # #print(json.dumps(resp.json(), indent=3))
-                    data = resp.json()["node-connector"][0]
-                    key = ("opendaylight-port-statistics:"
-                           "flow-capable-node-connector-statistics")
-                    util_data = data[key]
-
-                except Exception as ex:
-                    ex_type = type(ex).__name__
-                    fname = sys._getframe().f_code.co_name
-                    # #print("{}: {} parsing data for {}".format(fname, ex_type, top_id),
-                    #       file=sys.stderr)
+                    port_stats[port["id"]] = port[key]["bytes"]
+                except KeyError:
                     continue
 
-                # Update link information
-                # edge["bps_current"] = 0
+        return port_stats
 
-                # Old way of setting capacity - OVS doesn't appear to display
-                # capacity correctly though so instead we are using a different method
-                # bps = data["flow-node-inventory:current-speed"] * 1000
-                # self.links[link]["bps_capacity"] = bps
-                # link_capacity_kbps = data["flow-node-inventory:current-speed"]
-                # edge["bps_capacity"] = link_capacity_kbps * 1000
-                edge["prev_bytes_sent"] = edge["cur_bytes_sent"]
-                edge["prev_bytes_recvd"] = edge["cur_bytes_recvd"]
 
-                bytes_sent = util_data["bytes"]["transmitted"]
-                bytes_recvd = util_data["bytes"]["received"]
-                edge["cur_bytes_sent"] = bytes_sent
-                edge["cur_bytes_recvd"] = bytes_recvd
-                # edge["utilization_pct"] = 0.0
+    def __apply_port_stats(self, cur_top, port_stats):
+        """ Fan port statistics out to every edge leaving those ports """
+        cur_top.link_stats.sync(cur_top, self.max_link_speed)
+        cur_top.link_stats.apply_port_stats(port_stats)
 
                 
     def add_link_reservation(self, top_id, node_id, tp_ofid, value):
@@ -410,11 +489,25 @@ class ResourceManager(manager.Manager):
                 if key.data is None:
                     self.accept_connection(key.fileobj, sel)
                 else:
-                    cur_top.acquire_mutex(sys._getframe().f_code.co_name)
+                    # service_fog() takes the reservation lock of the node
                     self.service_fog(top_id, key, mask, sel)
-                    cur_top.release_mutex(sys._getframe().f_code.co_name)
 
      # Get resource data for fog nodes
+    def stop_requests(self):
+        """
+        Stop the edge/shutdown request servers and wait for the requests
+        already handed to request workers, so no allocation is left
+        half-done (e.g. before a warm restart snapshot is saved).
+        """
+        self.requests_stopped.set()
+        for thread_type in ("edge_requests", "shutdown_requests"):
+            thread = self.threads.get(thread_type)
+            if thread is not None:
+                thread.join()
+
+        self.request_pool.shutdown(wait=True)
+
+
     def start_edge_requests(self, top_id="flow:1", interval=1.0):
         self.threads["edge_requests"] = threading.Thread(target=self.__start_edge_requests,
                                                     args=(top_id, interval, ))
@@ -439,18 +532,19 @@ class ResourceManager(manager.Manager):
         # Select self.socks["edge_requests"] for I/O event monitoring 
         sel.register(self.socks["edge_requests"], selectors.EVENT_READ, data=None)
 
-        while True:
+        while not self.requests_stopped.is_set():
             # wait until selector is ready (or timeout expires)
-            events = sel.select(timeout=None)
+            events = sel.select(timeout=interval)
 
             # For each file object, process
             for key, mask in events:
                 if key.data is None:
                     self.accept_connection(key.fileobj, sel)
                 else:
-                    cur_top.acquire_mutex(sys._getframe().f_code.co_name)
+                    # The RAA takes the reservation locks of its fog node
+                    # and path itself, only while allocating (not while
+                    # searching or creating containers)
                     self.service_edge(top_id, key, mask, sel)
-                    cur_top.release_mutex(sys._getframe().f_code.co_name)
 
                     
     def start_shutdown_requests(self, top_id="flow:1", interval=1.0):
@@ -477,18 +571,18 @@ class ResourceManager(manager.Manager):
         # Select self.socks["shutdown_requests"] for I/O event monitoring 
         sel.register(self.socks["shutdown_requests"], selectors.EVENT_READ, data=None)
 
-        while True:
+        while not self.requests_stopped.is_set():
             # wait until selector is ready (or timeout expires)
-            events = sel.select(timeout=None)
+            events = sel.select(timeout=interval)
 
             # For each file object, process
             for key, mask in events:
                 if key.data is None:
                     self.accept_connection(key.fileobj, sel)
                 else:
-                    cur_top.acquire_mutex(sys._getframe().f_code.co_name)
+                    # The DAA takes the reservation locks of its fog node
+                    # and path itself
                     self.service_shutdown_request(top_id, key, mask, sel)
-                    cur_top.release_mutex(sys._getframe().f_code.co_name)
 
                     
     # Note: start_greeting_server() and associated greeting functions are
@@ -517,13 +611,15 @@ class ResourceManager(manager.Manager):
                 # Get current topology according to top_id
                 cur_top = self.mgrs["top"].get_topology(top_id)
 
-                # Store HostNode class type in a variable (shorter label)
-                for node_id in cur_top.nodes:
-                    if(isinstance(cur_top.nodes[node_id], topology.FogNode) and
-                       cur_top.nodes[node_id].ip_addr == data.addr[0]):
-                        cur_top.nodes[node_id].cpu_util = float(resources[0])
-                        cur_top.nodes[node_id].mem_available = float(resources[1])
-                        cur_top.nodes[node_id].disk_available = float(resources[2])
+                for node_id in cur_top.get_fog_ids():
+                    fog_node = cur_top.get_node(node_id)
+                    if fog_node.ip_addr == data.addr[0]:
+                        locks = cur_top.acquire_reservation_locks([node_id])
+                        fog_node.cpu_util = float(resources[0])
+                        fog_node.mem_available = float(resources[1])
+                        fog_node.disk_available = float(resources[2])
+                        cur_top.mark_changed()
+                        cur_top.release_reservation_locks(locks)
                         break
             else:
                 #print("closing connection to", data.addr)
@@ -564,67 +660,10 @@ class ResourceManager(manager.Manager):
                 }
                 '''
                 
-                start_time = time.time()
-                # Run RAA on request 
-                # Below is a crude RAA, simply selects an arbitrary fog node
-                cur_top = self.mgrs["top"].get_topology(top_id)
-                # get first fog node
-                # node_id = next(iter(self.mgrs["res"].swarm.nodes))
-                # get random fog node
-                # node_id = random.choice(list(self.mgrs["res"].swarm.nodes.keys()))
-                # fog_ip = cur_top.nodes[node_id].ip_addr
-                # docker_port = cur_top.nodes[node_id].docker_port
-                # RAA should return response message
-                # A simple response is constructed below
-                response = self.resource_alloc_algorithm(request, top_id)
-                raa_overhead = time.time() - start_time
-                node_id = response["node_id"]
-                fog_ip = response["ip"]
-                docker_port = response["port"]
-            
-                # If success, allocate resources for container
-                if response["resp-code"] == 0:
-                    start_time = time.time()
-                    resp, service_id = self.swarm.create_container(node_id,
-                                                                   request,
-                                                                   docker_port)
-                    docker_overhead = time.time() - start_time
-                    # Check for error while creating container
-                    if resp is not True:
-                        response["resp-code"] = -1
-                        response["failure-msg"] = "Error creating container"
-                    else:
-                        response["service_id"] = service_id
-
-                # Add field for request id in response message
-                response["req_id"] = self.req_id
-                # Send success/failure msg to edge node
-                start_time = time.time()
-                sock.sendall(json.dumps(response).encode())
-                resp_overhead = time.time() - start_time
-
-                # Report overhead data to appropriate files
-                #self.req_raa_fp.write("{} {}\n".format(self.req_id, raa_overhead))
-                #self.req_docker_fp.write("{} {}\n".format(self.req_id, docker_overhead))
-                #self.req_resp_fp.write("{} {}\n".format(self.req_id,
-                #resp_overhead))
-
-                # Report overhead data on successful request
-                if response["resp-code"] is 0:
-                    ip = data.addr[0]
-                    if ip in self.test_data:
-                        self.test_data[ip][self.req_id] = {}
-                    else:
-                        self.test_data[ip] = {}
-                        self.test_data[ip][self.req_id] = {}
-
-                    self.test_data[ip][self.req_id]["req_raa_overhead"] = raa_overhead
-                    self.test_data[ip][self.req_id]["req_docker_overhead"] = docker_overhead
-                    self.test_data[ip][self.req_id]["req_resp_overhead"] = resp_overhead
-
-                    # Increment request id
-                    self.req_id += 1
-                    os.environ["REQ_ID"] = str(self.req_id)
+                # Handled by a request worker, so requests over disjoint
+                # paths are allocated in parallel
+                self.request_pool.submit(self.__handle_edge_request, top_id,
+                                         sock, data, request)
             else:
                 #print("closing connection to", data.addr)
                 sel.unregister(sock)
@@ -632,6 +671,90 @@ class ResourceManager(manager.Manager):
 
             
                 
+    def __handle_edge_request(self, top_id, sock, data, request):
+        """ Run the RAA for an edge request and respond to the edge node """
+        start_time = time.time()
+        # Run RAA on request 
+        # Below is a crude RAA, simply selects an arbitrary fog node
+        cur_top = self.mgrs["top"].get_topology(top_id)
+        # get first fog node
+        # node_id = next(iter(self.mgrs["res"].swarm.nodes))
+        # get random fog node
+        # node_id = random.choice(list(self.mgrs["res"].swarm.nodes.keys()))
+        # fog_ip = cur_top.nodes[node_id].ip_addr
+        # docker_port = cur_top.nodes[node_id].docker_port
+        # RAA should return response message
+        # A simple response is constructed below
+        try:
+            response = self.resource_alloc_algorithm(request, top_id)
+        except Exception:
+            # Still answer the edge node (it waits for a reply)
+            traceback.print_exc()
+            response = {
+                "resp-code": -1,
+                "node_id": None,
+                "ip": None,
+                "port": None,
+                "service_id": None,
+                "failure-msg": "Internal error."
+            }
+        raa_overhead = time.time() - start_time
+        node_id = response["node_id"]
+        fog_ip = response["ip"]
+        docker_port = response["port"]
+        
+        # If success, allocate resources for container
+        if response["resp-code"] == 0:
+            start_time = time.time()
+            try:
+                resp, service_id = self.swarm.create_container(node_id,
+                                                               request,
+                                                               docker_port)
+            except Exception:
+                traceback.print_exc()
+                resp = False
+            docker_overhead = time.time() - start_time
+            # Check for error while creating container
+            if resp is not True:
+                response["resp-code"] = -1
+                response["failure-msg"] = "Error creating container"
+            else:
+                response["service_id"] = service_id
+        
+        # Add field for request id in response message
+        # (only successful requests use up a request id)
+        with self.stats_mutex:
+            req_id = self.req_id
+            if response["resp-code"] == 0:
+                self.req_id += 1
+                os.environ["REQ_ID"] = str(self.req_id)
+        response["req_id"] = req_id
+        # Send success/failure msg to edge node
+        start_time = time.time()
+        sock.sendall(json.dumps(response).encode())
+        resp_overhead = time.time() - start_time
+        
+        # Report overhead data to appropriate files
+        #self.req_raa_fp.write("{} {}\n".format(req_id, raa_overhead))
+        #self.req_docker_fp.write("{} {}\n".format(req_id, docker_overhead))
+        #self.req_resp_fp.write("{} {}\n".format(req_id,
+        #resp_overhead))
+        
+        # Report overhead data on successful request
+        if response["resp-code"] == 0:
+            ip = data.addr[0]
+            with self.stats_mutex:
+                if ip in self.test_data:
+                    self.test_data[ip][req_id] = {}
+                else:
+                    self.test_data[ip] = {}
+                    self.test_data[ip][req_id] = {}
+
+                self.test_data[ip][req_id]["req_raa_overhead"] = raa_overhead
+                self.test_data[ip][req_id]["req_docker_overhead"] = docker_overhead
+                self.test_data[ip][req_id]["req_resp_overhead"] = resp_overhead
+
+
     def service_shutdown_request(self, top_id, key, mask, sel):
         sock = key.fileobj
         data = key.data
@@ -649,196 +772,121 @@ class ResourceManager(manager.Manager):
                     req_id = int(request["req_id"])
                     #self.shutdown_total_overhead_fp.write("{}
                     #{}\n").format(req_id, shutdown_total_overhead)
-                    self.test_data[data.addr[0]][req_id]["shutdown_total_overhead"]= shutdown_total_overhead
+                    with self.stats_mutex:
+                        self.test_data[data.addr[0]][req_id]["shutdown_total_overhead"]= shutdown_total_overhead
                     return
                 
-                # Call shutdown api for deallocating all the resources along path
-                # Chris: for right now i am just going to deallocate container
-                node_id = request["node_id"]
-                service_id = request["service_id"]
-                port = request["port"]
-                req_id = request["req_id"]
-                req_total_overhead = request["req_total_overhead"]
-
-                # Resource deallocation algorithm here
-                start_time = time.time()
-                self.resource_dealloc_algorithm(request, top_id)
-                daa_overhead = time.time() - start_time
-                
-                # Remove the container
-                start_time = time.time()
-                resp = self.swarm.remove_container(node_id, service_id)
-                docker_overhead = time.time() - start_time
-                
-                # create response to send back to edge
-                response = {}
-                if resp is True:
-                    response["resp-code"] = 0
-                else:
-                    response["resp-code"] = -1
-
-                # Send success/failure msg to edge node
-                start_time = time.time()
-                sock.sendall(json.dumps(response).encode())
-                resp_overhead = time.time() - start_time
-
-                # Receive shutdown total overhead from edge
-                #recv_data = sock.recv(1024)
-                #shutdown_total_overhead = float(recv_data.decode())
-                
-                # Report overhead data to appropriate files
-                #self.req_total_overhead_fp.write("{} {}\n").format(req_id, req_total_overhead)
-                #self.shutdown_daa_fp.write("{} {}\n".format(req_id, daa_overhead))
-                #self.shutdown_docker_fp.write("{} {}\n".format(req_id, docker_overhead))
-                #self.shutdown_resp_fp.write("{} {}\n".format(req_id,
-                #resp_overhead))
-
-                # Report overhead data
-                ip = data.addr[0]
-                self.test_data[ip][req_id]["req_total_overhead"] = req_total_overhead
-                self.test_data[ip][req_id]["shutdown_daa_overhead"] = daa_overhead
-                self.test_data[ip][req_id]["shutdown_docker_overhead"] = docker_overhead
-                self.test_data[ip][req_id]["shutdown_resp_overhead"] = resp_overhead
-                self.test_data[ip][req_id]["shutdown_timestamp"] = time.time()
+                self.request_pool.submit(self.__handle_shutdown_request,
+                                         top_id, sock, data, request)
             else:
                 #print("closing connection to", data.addr)
                 sel.unregister(sock)
                 sock.close()
 
-    class wedge:
-        def __init__(self, src_node_id, dst_node_id,
-                     src_port, dst_port, weight):
-            self.src_node_id = src_node_id
-            self.src_port = src_port
-            self.dst_node_id = dst_node_id
-            self.dst_port = dst_port
-            self.weight = weight
-
-        def __gt__(self, wedge2):
-            return self.weight > wedge2.weight
-
-        def __lt__(self, wedge2):
-            return self.weight < wedge2.weight
-
-        def __ge__(self, wedge2):
-            return self.weight >= wedge2.weight
-
-        def __le__(self, wedge2):
-            return self.weight <= wedge2.weight
-
-        def __eq__(self, wedge2):
-            return self.weight == wedge2.weight
-
-        def __ne__(self, wedge2):
-            return self.weight != wedge2.weight
-
-        def __add__(self, wedge2):
-            return self.weight + wedge2.weight
 
-        def __sub__(self, wedge2):
-            return self.weight - wedge2.weight
-
-        def __hash__(self):
-            return (
-                hash(self.src_node_id) ^ hash(self.dst_node_id) ^
-                hash(self.src_port) ^ hash(self.dst_port) ^
-                hash(self.weight)
-            )
+    def __handle_shutdown_request(self, top_id, sock, data, request):
+        """ Run the DAA for a shutdown request and respond to the edge node """
+        # Call shutdown api for deallocating all the resources along path
+        # Chris: for right now i am just going to deallocate container
+        node_id = request["node_id"]
+        service_id = request["service_id"]
+        port = request["port"]
+        req_id = request["req_id"]
+        req_total_overhead = request["req_total_overhead"]
         
-
-    def dijkstra(self, src_node_id, top_id, required_bandwidth):
+        # Resource deallocation algorithm here
+        start_time = time.time()
+        self.resource_dealloc_algorithm(request, top_id)
+        daa_overhead = time.time() - start_time
+        
+        # Remove the container
+        start_time = time.time()
+        resp = self.swarm.remove_container(node_id, service_id)
+        docker_overhead = time.time() - start_time
+        
+        # create response to send back to edge
+        response = {}
+        if resp is True:
+            response["resp-code"] = 0
+        else:
+            response["resp-code"] = -1
+        
+        # Send success/failure msg to edge node
+        start_time = time.time()
+        sock.sendall(json.dumps(response).encode())
+        resp_overhead = time.time() - start_time
+        
+        # Receive shutdown total overhead from edge
+        #recv_data = sock.recv(1024)
+        #shutdown_total_overhead = float(recv_data.decode())
+        
+        # Report overhead data to appropriate files
+        #self.req_total_overhead_fp.write("{} {}\n").format(req_id, req_total_overhead)
+        #self.shutdown_daa_fp.write("{} {}\n".format(req_id, daa_overhead))
+        #self.shutdown_docker_fp.write("{} {}\n".format(req_id, docker_overhead))
+        #self.shutdown_resp_fp.write("{} {}\n".format(req_id,
+        #resp_overhead))
+        
+        # Report overhead data
+        ip = data.addr[0]
+        with self.stats_mutex:
+            self.test_data[ip][req_id]["req_total_overhead"] = req_total_overhead
+            self.test_data[ip][req_id]["shutdown_daa_overhead"] = daa_overhead
+            self.test_data[ip][req_id]["shutdown_docker_overhead"] = docker_overhead
+            self.test_data[ip][req_id]["shutdown_resp_overhead"] = resp_overhead
+            self.test_data[ip][req_id]["shutdown_timestamp"] = time.time()
+
+
+    def dijkstra(self, src_node_id, top_id, required_bandwidth, snapshot=None,
+                 targets=None):
         """
         Dijkstra's algorithm. Should return a previous dictionary that enables
         traversal of the graph from any node to src_node_id along the shortest
         path between the two, and a cost dictionary denoting the cost from
         src_node_id to any other node.
+
+        Runs on snapshot (the latest TopologySnapshot of top_id by default),
+        so the topology mutex is not needed. See path_engine.
+
+        If only the cheapest of some nodes is needed, pass them as targets:
+        the search then stops early and only returns the nodes it settled
+        (see CompiledTopology.dijkstra()).
+
+        The result may be shared with other requests - don't modify it.
         """
 
-        top_mgr = self.mgrs["top"]
-        cur_top = top_mgr.get_topology(top_id)
+        cur_top = self.mgrs["top"].get_topology(top_id)
+        if snapshot is None:
+            snapshot = cur_top.get_snapshot()
 
-        # This is ans graph
-        cost = {}     # distance
-        previous = {} # parent
-        
-        best = {}     # <T, Wedge>
-
-        # Create optimal heap
-        m = cur_top.get_num_links()
-        n = cur_top.get_num_nodes()
-        d = max(2, m//n)
-        heap = dary_heap.dary_heap(d)
-
-        # Dummy edge onto heap
-        heap.push(self.wedge(src_node_id, src_node_id, 0, 0, 0))
-
-        while(not heap.empty()):
-            # Get min edge
-            e = heap.get_min()
-            heap.pop_min()
-
-            # Add edge to answer if e is not dummy edge or points to itself
-            # (since any self-pointing edge with pos weight can't be on
-            # shortest path)
-            if e.src_node_id != e.dst_node_id:
-                # Track TOTAL cost to e.dst plus information on the path to it
-                cost[e.dst_node_id] = e.weight
-                previous[e.dst_node_id] = {
-                    "dst_node_id": e.dst_node_id,
-                    "dst_port": e.dst_port,
-                    "src_node_id": e.src_node_id, # parent of dst node
-                    "src_port": e.src_port
-                }
+        # The CSR form of the snapshot is shared by all requests, and only
+        # rebuilt when nodes/links were added or removed. Results are cached
+        # until the bandwidth of the links they depend on changes.
+        return cur_top.path_engine.dijkstra(snapshot, src_node_id,
+                                            required_bandwidth, targets)
 
-            for n in cur_top.get_neighbors(e.dst_node_id):
-                # n is a dict w/ edge information - search src_entry in
-                # topology.py
 
-                # Parse out information on the neighbor nodes + edges to them
-                # print(str(n))
-                n_id = n["dst_node_id"]
+    def k_shortest_paths(self, src_node_id, top_id, dst_node_id,
+                         required_bandwidth, snapshot=None):
+        """
+        Yield (cost, path) for the loopless paths from src_node_id to
+        dst_node_id which support required_bandwidth, cheapest first (see
+        CompiledTopology.k_shortest_paths()). Paths are lists of previous
+        entries from dst_node_id back to src_node_id, like the ones walked
+        in a dijkstra() previous dict.
 
-                # skip heap ops for edges to edge nodes
-                # if isinstance(cur_top.get_node(n_id), topology.EdgeNode):
-                #     continue
-                
-                avail_bandwidth = n["bps_capacity"] - n["bps_reserved"]
+        Runs on snapshot like dijkstra().
+        """
+        cur_top = self.mgrs["top"].get_topology(top_id)
+        if snapshot is None:
+            snapshot = cur_top.get_snapshot()
 
-                if (avail_bandwidth < required_bandwidth or avail_bandwidth <= 0):
-                    n_edge_cost = math.inf
-                else:
-                    n_edge_cost = 1/avail_bandwidth
+        compiled = cur_top.path_engine.compile(snapshot)
+        return compiled.k_shortest_paths(src_node_id, dst_node_id,
+                                         required_bandwidth)
 
-                # Set the cost of a node
-                # Note: cost is cumulative weight to that node according to the
-                # summation of the costs along the path to it.
-                try:
-                    n_total_cost = best[e.dst_node_id].weight + n_edge_cost
-                except KeyError:
-                    n_total_cost = n_edge_cost
-
-                if (e.dst_node_id != n["src_node_id"]):
-                    print("error in dijkstra")
-
-                # Create the version of the edge to put into the heap
-                fringe = self.wedge(n["src_node_id"], n["dst_node_id"],
-                                    n["src_port"], n["dst_port"],
-                                    n_total_cost)
-                               
-                if n_id not in best:
-                    heap.push(fringe)
-                    best[n_id] = fringe
-                elif fringe.weight < best[n_id].weight:
-                    heap.decrease_key(best[n_id], fringe)
-                    best[n_id] = fringe
-
-        del previous[src_node_id]
-        return {
-            "cost": cost,
-            "previous": previous
-        }
-        
-    def distance_vector(self, src_node_id, top_id, required_bandwidth):
+    def distance_vector(self, src_node_id, top_id, required_bandwidth,
+                        snapshot=None):
         """
         Run the Bellman-Ford distance vector algorithm on the given node in the
         given topology. Return a dictionary, containing the distance vector and
@@ -849,6 +897,7 @@ class ResourceManager(manager.Manager):
         has a link directly connecting to node_1)
 
         Required bandwidth is the bandwidth along a path requested by an edge device.
+        Runs on snapshot like dijkstra().
         """
 
         # Distance and parent vectors
@@ -856,9 +905,9 @@ class ResourceManager(manager.Manager):
         parent = {}
 
         # Get topology of the switch
-        top_mgr = self.mgrs["top"]
-        #cur_top_id = top_mgr.get_ovsnode_top_ofid(src_node_id)
-        cur_top = top_mgr.get_topology(top_id)
+        if snapshot is None:
+            snapshot = self.mgrs["top"].get_topology(top_id).get_snapshot()
+        cur_top = snapshot
 
         # Initialize the distance vector (SSSP_0)
         for node_id in cur_top.get_node_ids():
@@ -869,10 +918,10 @@ class ResourceManager(manager.Manager):
         for i in range(1, cur_top.get_num_nodes()):
             for edge in cur_top.get_all_edges():
                 # Maybe calculate the weight here
-                available_bandwidth = edge["bps_capacity"] - edge["bps_reserved"]
+                available_bandwidth = edge.bps_capacity - edge.bps_reserved
 
                 try:
-                    temp = distance[edge["src_node_id"]] + 1/available_bandwidth
+                    temp = distance[edge.src_node_id] + 1/available_bandwidth
                 except ZeroDivisionError:
                     # do not consider links with 0 available bandwidth
                     continue
@@ -880,17 +929,17 @@ class ResourceManager(manager.Manager):
                 # If the new path is better AND still supports the bandwidth
                 # requirement then update the cost of the path to reflec this
                 # better route. Update the parent to reflect this change
-                if (distance[edge["dst_node_id"]] > temp and
+                if (distance[edge.dst_node_id] > temp and
                     available_bandwidth >= required_bandwidth):
                     # Update distance vector
-                    distance[edge["dst_node_id"]] = temp
+                    distance[edge.dst_node_id] = temp
 
                     # Update parent vector
-                    parent[edge["dst_node_id"]] = {
-                        "dst_node_id": edge["dst_node_id"],
-                        "dst_port": edge["dst_port"],
-                        "src_node_id": edge["src_node_id"], # parent of dst node
-                        "src_port": edge["src_port"]
+                    parent[edge.dst_node_id] = {
+                        "dst_node_id": edge.dst_node_id,
+                        "dst_port": edge.dst_port,
+                        "src_node_id": edge.src_node_id, # parent of dst node
+                        "src_port": edge.src_port
                     }
 
         return {
@@ -903,6 +952,11 @@ class ResourceManager(manager.Manager):
         """
         Fulfill an edge request by allocating resources on the network and fog
         devices.
+
+        The fog node and path are chosen on a TopologySnapshot, without any
+        locks. Only the reservation locks of the chosen fog node and path are
+        taken to allocate them, after checking they are still available
+        (otherwise the search is retried on a newer snapshot).
         """
 
         # Initialize successful response:
@@ -911,11 +965,9 @@ class ResourceManager(manager.Manager):
 
         # Other managers
         top_mgr = self.mgrs["top"]
-        flow_mgr = self.mgrs["flow"]
 
         # Get fog node
         cur_top = top_mgr.get_topology(top_id)
-        fog_node_ids = cur_top.get_fog_ids()
 
         # Parse edge request data
         edge_node_id = edge_req["node_id"]
@@ -924,81 +976,268 @@ class ResourceManager(manager.Manager):
         cpu_pct_req = edge_req["cpu"]
         mem_mb_req = edge_req["ram"]
         bandwidth_bps_req = edge_req["bandwidth"]
-        proto_num = int(edge_req["proto_num"])
 
-        # Get all fog nodes which can service the edge request
-        # print("GETTING ALL POSSIBLE FOG NODES WHICH CAN SERVICE EDGE")
-        request_servicers = []
-        for node_id in fog_node_ids:
-            cur_fog_node = cur_top.get_node(node_id)
-            if (cur_fog_node.get_cpu_avail_pct() >= cpu_pct_req and
-                cur_fog_node.get_mem_avail_mb() >= mem_mb_req):
-                request_servicers.append(node_id)
-
-        # Return a bad response when no resources exist for the container
-        if len(request_servicers) == 0:
-            # print("SENDING FAILURE MSG BACK TO EDGE: NO FOG HAS ENOUGH RESOURCES")
+        # Fog nodes found full when about to allocate them. The snapshot of
+        # a retry can be the same one (see Topology.get_snapshot()), so
+        # they are left out of the following attempts.
+        full_fog_node_ids = set()
+
+        for attempt in range(0, self.raa_attempts):
+            snapshot = cur_top.get_snapshot()
+            fog_node_ids = [node_id for node_id in snapshot.get_fog_ids()
+                            if node_id not in full_fog_node_ids]
+
+            # Get all fog nodes which can service the edge request
+            # print("GETTING ALL POSSIBLE FOG NODES WHICH CAN SERVICE EDGE")
+            request_servicers = []
+            for node_id in fog_node_ids:
+                cur_fog_node = snapshot.get_node(node_id)
+                if (cur_fog_node.get_cpu_avail_pct() >= cpu_pct_req and
+                    cur_fog_node.get_mem_avail_mb() >= mem_mb_req):
+                    request_servicers.append(node_id)
+
+            # Return a bad response when no resources exist for the container
+            if len(request_servicers) == 0:
+                # print("SENDING FAILURE MSG BACK TO EDGE: NO FOG HAS ENOUGH RESOURCES")
+                response["resp-code"] = -1
+                response["node_id"] = None
+                response["ip"] = None
+                response["port"] = None  # self.swarm.generate_port_num(node_id)
+                response["service_id"] = None
+                response["failure-msg"] = "No fog nodes can satisfy the request."
+                return response
+
+            # Run the distance vector algorithm to find good paths to the fog node
+            # print("RUNNING DISTANCE VECTOR")
+            # res = self.distance_vector(edge_node_id, top_id, bandwidth_bps_req)
+            # Only the cheapest servicer matters - stop the search once it is
+            # known
+            res = self.dijkstra(edge_node_id, top_id, bandwidth_bps_req,
+                                snapshot, request_servicers)
+            # print("DISTANCE VECTOR RETURNED")
+            previous = res["previous"]
+            cost = res["cost"]
+
+            # Choose the fog node along the path with the greatest amount of
+            # bandwidth
+            # print("FINDING THE LOWEST COST FOG NODE")
+            cheapest_fog_node = {
+                "node_id": None,
+                "cost": math.inf
+            }
+            for node_id in request_servicers:
+                node_cost = cost.get(node_id, math.inf)
+                if node_cost < cheapest_fog_node["cost"]:
+                    cheapest_fog_node["node_id"] = node_id
+                    cheapest_fog_node["cost"] = node_cost
+
+            fog_node_id = cheapest_fog_node["node_id"]
+
+            # If the cheapest fog node has a cost of infinity, then there
+            # exists no path to that node!
+            if cheapest_fog_node["cost"] == math.inf:
+                # print("SENDING FAILURE MSG BACK TO EDGE: NO PATH EXISTS TO FOG")
+                response["resp-code"] = -1
+                response["node_id"] = None
+                response["ip"] = None
+                response["port"] = None # self.swarm.generate_port_num(node_id)
+                response["service_id"] = None
+                response["failure-msg"] = "Insufficient network bandwidth."
+                return response
+
+            # The snapshot may be out of date by now - make sure the choice
+            # still fits, then reserve and program it while holding the
+            # reservation locks of the fog node and of every link on the path.
+            # If links on the path were taken meanwhile, try the next
+            # cheapest paths avoiding them before searching again.
+            path = self.__get_path(previous, fog_node_id)
+            alternatives = None
+            taken_links = set()
+            programming_error = None
+            for path_num in range(0, self.raa_paths):
+                links = [(hop["src_port"], hop["dst_port"]) for hop in path]
+                locks = cur_top.acquire_reservation_locks([fog_node_id], links)
+                try:
+                    if not self.__is_fog_still_available(cur_top, fog_node_id,
+                                                         cpu_pct_req,
+                                                         mem_mb_req):
+                        full_fog_node_ids.add(fog_node_id)
+                        break
+
+                    unavailable = self.__get_unavailable_links(
+                        cur_top, path, bandwidth_bps_req)
+                    if not unavailable:
+                        self.__reserve(cur_top, fog_node_id, path, cpu_pct_req,
+                                       mem_mb_req, bandwidth_bps_req)
+                        try:
+                            return self.__allocate_resources(edge_req, top_id,
+                                                             fog_node_id,
+                                                             previous, links)
+                        except PathProgrammingError as e:
+                            # Already rolled back - avoid the failed hop
+                            print("RAA: programming the path to {} failed: {}".
+                                  format(fog_node_id, e), file=sys.stderr)
+                            programming_error = e
+                            if e.link is None:
+                                break
+                            unavailable = [e.link]
+                finally:
+                    cur_top.release_reservation_locks(locks)
+
+                # Next cheapest path (on the same snapshot) without the links
+                # found taken
+                taken_links.update(unavailable)
+                if alternatives is None:
+                    alternatives = self.k_shortest_paths(
+                        edge_node_id, top_id, fog_node_id, bandwidth_bps_req,
+                        snapshot)
+                path = None
+                for alt_cost, alt_path in alternatives:
+                    if taken_links.isdisjoint(
+                            (hop["src_port"], hop["dst_port"])
+                            for hop in alt_path):
+                        path = alt_path
+                        break
+                if path is None:
+                    break
+                previous = self.__get_previous(path)
+
+            # Searching again would pick the path which failed again
+            if programming_error is not None:
+                response["resp-code"] = -1
+                response["node_id"] = None
+                response["ip"] = None
+                response["port"] = None
+                response["service_id"] = None
+                response["failure-msg"] = "Error programming the path."
+                return response
+        else:
             response["resp-code"] = -1
             response["node_id"] = None
             response["ip"] = None
-            response["port"] = None  # self.swarm.generate_port_num(node_id)
+            response["port"] = None
             response["service_id"] = None
-            response["failure-msg"] = "No fog nodes can satisfy the request."
+            response["failure-msg"] = "Resources changed during allocation."
             return response
 
-        # Run the distance vector algorithm to find good paths to the fog node
-        # print("RUNNING DISTANCE VECTOR")
-        # res = self.distance_vector(edge_node_id, top_id, bandwidth_bps_req)
-        res = self.dijkstra(edge_node_id, top_id, bandwidth_bps_req)
-        # print("DISTANCE VECTOR RETURNED")
-        previous = res["previous"]
-        cost = res["cost"]
-
-        # Choose the fog node along the path with the greatest amount of
-        # bandwidth
-        # print("FINDING THE LOWEST COST FOG NODE")
-        cheapest_fog_node = {
-            "node_id": None,
-            "cost": math.inf
-        }
-        for node_id in request_servicers:
-            if cost[node_id] < cheapest_fog_node["cost"]:
-                cheapest_fog_node["node_id"] = node_id
-                cheapest_fog_node["cost"] = cost[node_id]
 
-        fog_node_id = cheapest_fog_node["node_id"]
-        
-        # If the cheapest fog node has a cost of infinity, then there
-        # exists no path to that node!
-        if cheapest_fog_node["cost"] == math.inf:
-            # print("SENDING FAILURE MSG BACK TO EDGE: NO PATH EXISTS TO FOG")
-            response["resp-code"] = -1
-            response["node_id"] = None
-            response["ip"] = None
-            response["port"] = None # self.swarm.generate_port_num(node_id)
-            response["service_id"] = None
-            response["failure-msg"] = "Insufficient network bandwidth."
-            return response
+    def __get_path(self, previous, fog_node_id):
+        """
+        Return the hops (previous entries) of the path from the edge node to
+        fog_node_id, starting at the fog node.
+        """
+        path = []
+        cur = previous[fog_node_id]
+        while True:
+            path.append(cur)
+            if cur["src_node_id"] not in previous:
+                return path
+            cur = previous[cur["src_node_id"]]
+
+
+    def __get_previous(self, path):
+        """ Return a previous dict with only the hops of path """
+        previous = {}
+        for hop in path:
+            previous[hop["dst_node_id"]] = hop
+        return previous
+
+
+    def __is_fog_still_available(self, cur_top, fog_node_id, cpu_pct_req,
+                                 mem_mb_req):
+        """
+        Check that a fog node (chosen on a snapshot) can still fit a request
+        in cur_top. Call with the reservation lock of the fog node held.
+        """
+        try:
+            fog_node = cur_top.get_node(fog_node_id)
+        except KeyError:
+            return False
+        return (isinstance(fog_node, topology.FogNode) and
+                fog_node.get_cpu_avail_pct() >= cpu_pct_req and
+                fog_node.get_mem_avail_mb() >= mem_mb_req)
+
+
+    def __get_unavailable_links(self, cur_top, path, bandwidth_bps_req):
+        """
+        Return the links ((src_port, dst_port)) of a path (chosen on a
+        snapshot) which are gone or can't fit a request anymore in cur_top.
+        Call with the reservation locks of the path held.
+        """
+        unavailable = []
+        for hop in path:
+            link = (hop["src_port"], hop["dst_port"])
+            edge = cur_top.get_link(*link)
+            if edge is None:
+                unavailable.append(link)
+                continue
+            avail_bandwidth = edge.bps_capacity - edge.bps_reserved
+            if avail_bandwidth < bandwidth_bps_req or avail_bandwidth <= 0:
+                unavailable.append(link)
+
+        return unavailable
+
+
+    def __reserve(self, cur_top, fog_node_id, path, cpu_pct_req, mem_mb_req,
+                  bandwidth_bps_req):
+        """
+        Reserve fog node resources and bandwidth on every link of path (both
+        directions). Call with the reservation locks of the fog node and the
+        path held.
+        """
+        fog_node = cur_top.get_node(fog_node_id)
+        fog_node.add_reserved_cpu_pct(cpu_pct_req)
+        fog_node.add_reserved_mem_mb(mem_mb_req)
+        cur_top.mark_changed()
+
+        for hop in path:
+            cur_top.add_link_reservation(hop["dst_node_id"], hop["dst_port"],
+                                         bandwidth_bps_req)
+            cur_top.add_link_reservation(hop["src_node_id"], hop["src_port"],
+                                         bandwidth_bps_req)
+
+
+    def __allocate_resources(self, edge_req, top_id, fog_node_id, previous,
+                             links):
+        """
+        Second half of the RAA: program the path to a fog node (given as a
+        dijkstra previous dict) once its resources are reserved. Call with
+        the reservation locks of the fog node and of links (the path) held.
+        """
+        top_mgr = self.mgrs["top"]
+        flow_mgr = self.mgrs["flow"]
+        cur_top = top_mgr.get_topology(top_id)
+
+        edge_node_id = edge_req["node_id"]
+        cpu_pct_req = edge_req["cpu"]
+        mem_mb_req = edge_req["ram"]
+        bandwidth_bps_req = edge_req["bandwidth"]
+        proto_num = int(edge_req["proto_num"])
 
-        fog_port = self.swarm.generate_port_num(fog_node_id)
-        
         # AT THIS POINT: The RAA is sucessful. Now we allocate resources.
         # Prepare the allocated_resources dict entry:
         # print("UPDATING ALLOCATED RESOURCE DATA STRUCTURES")
-        try:
-            self.allocated_resources[edge_node_id][fog_node_id][fog_port] = {}
-        except KeyError:
+        with self.alloc_mutex:
+            # Ports of allocations whose containers are not created yet are
+            # not in swarm.ports - the alloc entry reserves the port
+            taken_ports = set([])
+            for fog_allocs in self.allocated_resources.values():
+                taken_ports.update(fog_allocs.get(fog_node_id, ()))
+            fog_port = self.swarm.generate_port_num(fog_node_id, taken_ports)
             try:
-                self.allocated_resources[edge_node_id][fog_node_id] = {
-                    fog_port: {}
-                }
+                self.allocated_resources[edge_node_id][fog_node_id][fog_port] = {}
             except KeyError:
-                self.allocated_resources[edge_node_id] = {
-                    fog_node_id: {
+                try:
+                    self.allocated_resources[edge_node_id][fog_node_id] = {
                         fog_port: {}
                     }
-                }
-        alloc = self.allocated_resources[edge_node_id][fog_node_id][fog_port]
+                except KeyError:
+                    self.allocated_resources[edge_node_id] = {
+                        fog_node_id: {
+                            fog_port: {}
+                        }
+                    }
+            alloc = self.allocated_resources[edge_node_id][fog_node_id][fog_port]
 
         # Initialize all hops for later
         # print("INITIALIZING ALL HOPS")
@@ -1033,7 +1272,6 @@ class ResourceManager(manager.Manager):
         #print("\n============================================================\n")
         
         # Store data on edge and fog
-        fog_node_id = cheapest_fog_node["node_id"]
         fog_node = cur_top.get_node(fog_node_id)
         fog_ip_addr = fog_node.get_ip_addr()
         edge_node = cur_top.get_node(edge_node_id)
@@ -1055,122 +1293,152 @@ class ResourceManager(manager.Manager):
         alloc["cpu_pct"] = cpu_pct_req
         alloc["mem_mb"] = mem_mb_req
         alloc["bandwidth_bps"] = bandwidth_bps_req
-        fog_node.add_reserved_cpu_pct(cpu_pct_req)
-        fog_node.add_reserved_mem_mb(mem_mb_req)
+        alloc["links"] = links
 
-        # Traverse the path and allocate resources
-        # print("ATTEMPTING TO ALLOCATE RESOURCES")
-        cur = previous[fog_node_id]
-        num_flows = 0
-        while True:
-            # For reference
-            dst_node_id = cur["dst_node_id"]
-            dst_node = cur_top.get_node(dst_node_id)
-            dst_port = cur["dst_port"]
-
-            src_node_id = cur["src_node_id"]
-            src_port = cur["src_port"]
-            src_node = cur_top.get_node(src_node_id)
-
-            # print("src: %s" % src_node_id)
-            # print("dst: %s" % dst_node_id)
-
-            # 1. Create Queues to limit bandwidth in 1 direction:
-            # Create queue on the src_side (unless it is an edge node)
-            # Queue points up (created on top of src node)
-            if not isinstance(src_node, topology.EdgeNode):
-                src_queue_id = (edge_node_id + "-TO-" +
-                                fog_node_id + "-" + str(response["port"]))
-                top_mgr.create_queue(src_node_id, src_queue_id, bandwidth_bps_req)
-
-                # QoS Already exists - get the qos_id put the queue on it.
-                src_qos_id = "defaultqos" + str(src_port.rsplit(":", 1)[-1])
-                top_mgr.place_queue_on_qos(src_node_id, src_qos_id, src_queue_id)
-
-                # Update alloc
-                queues = alloc["hops"][src_node_id]["queues"]
-                queues[src_queue_id] = {
-                    "queue_num": src_node.get_queue_num(src_qos_id, src_queue_id),
-                    "qos_id": src_qos_id
-                }
+        # Traverse the path and allocate resources. If a queue change does
+        # not become operational, undo everything done for this allocation.
+        try:
+            # print("ATTEMPTING TO ALLOCATE RESOURCES")
+            cur = previous[fog_node_id]
+            num_flows = 0
+            # Flows of every hop are pushed together once the path is walked
+            flow_batch = flow_mgr.new_flow_batch()
+            while True:
+                # For reference
+                dst_node_id = cur["dst_node_id"]
+                dst_node = cur_top.get_node(dst_node_id)
+                dst_port = cur["dst_port"]
+
+                src_node_id = cur["src_node_id"]
+                src_port = cur["src_port"]
+                src_node = cur_top.get_node(src_node_id)
+
+                # print("src: %s" % src_node_id)
+                # print("dst: %s" % dst_node_id)
+
+                # 1. Create Queues to limit bandwidth in 1 direction:
+                # Create queue on the src_side (unless it is an edge node)
+                # Queue points up (created on top of src node)
+                if not isinstance(src_node, topology.EdgeNode):
+                    src_queue_id = (edge_node_id + "-TO-" +
+                                    fog_node_id + "-" + str(response["port"]))
+                    src_qos_id = "defaultqos" + str(src_port.rsplit(":", 1)[-1])
+
+                    # Update alloc first, so a rollback removes the queue
+                    queues = alloc["hops"][src_node_id]["queues"]
+                    queues[src_queue_id] = {
+                        "queue_num": None,
+                        "qos_id": src_qos_id
+                    }
 
-            # 2. Create Queues to limit bandwidth in the other direction:
-            # Create queue on the dst side (unless it is the fog node)
-            # Queue points down (created on bot of dst node)
-            if not isinstance(dst_node, topology.FogNode):
-                # Create Queue (edge -> fog)
-                dst_queue_id = (fog_node_id + "-TO-" +
-                                edge_node_id + "-" + str(response["port"]))
-                top_mgr.create_queue(dst_node_id, dst_queue_id, bandwidth_bps_req)
-
-                # QoS Already exists - get the qos_id put the queue on it.
-                dst_qos_id = "defaultqos" + str(dst_port.rsplit(":", 1)[-1])
-                top_mgr.place_queue_on_qos(dst_node_id, dst_qos_id, dst_queue_id)
-
-                # Update alloc
-                queues = alloc["hops"][dst_node_id]["queues"]
-                queues[dst_queue_id] = {
-                    "queue_num": dst_node.get_queue_num(dst_qos_id, dst_queue_id),
-                    "qos_id": dst_qos_id
-                }
+                    top_mgr.create_queue(src_node_id, src_queue_id, bandwidth_bps_req)
+
+                    # QoS Already exists - get the qos_id put the queue on it.
+                    top_mgr.place_queue_on_qos(src_node_id, src_qos_id, src_queue_id)
+                    queues[src_queue_id]["queue_num"] = (
+                        src_node.get_queue_num(src_qos_id, src_queue_id))
+
+                # 2. Create Queues to limit bandwidth in the other direction:
+                # Create queue on the dst side (unless it is the fog node)
+                # Queue points down (created on bot of dst node)
+                if not isinstance(dst_node, topology.FogNode):
+                    # Create Queue (edge -> fog)
+                    dst_queue_id = (fog_node_id + "-TO-" +
+                                    edge_node_id + "-" + str(response["port"]))
+                    dst_qos_id = "defaultqos" + str(dst_port.rsplit(":", 1)[-1])
+
+                    # Update alloc first, so a rollback removes the queue
+                    queues = alloc["hops"][dst_node_id]["queues"]
+                    queues[dst_queue_id] = {
+                        "queue_num": None,
+                        "qos_id": dst_qos_id
+                    }
 
-            fog_port = str(response["port"])
-            # 3. Push flows to reserve the path in 1 direction:
-            # Push flow on src side unless its an edge node
-            # Flow points up (edge src, fog dst)
-            if not isinstance(src_node, topology.EdgeNode):
-                flow_prefix = (edge_node_id + "-TO-" +
-                               fog_node_id + "-" + fog_port)
-                src_queue_num = src_node.get_queue_num(src_qos_id, src_queue_id)
-                flow_ids = flow_mgr.create_enqueue_flows(
-                    top_id, src_node_id, 0, flow_prefix,
-                    edge_ip_addr, fog_ip_addr,
-                    src_port, src_queue_id, src_queue_num,
-                    fog_port, proto_num, True, 2000
-                )
+                    top_mgr.create_queue(dst_node_id, dst_queue_id, bandwidth_bps_req)
+
+                    # QoS Already exists - get the qos_id put the queue on it.
+                    top_mgr.place_queue_on_qos(dst_node_id, dst_qos_id, dst_queue_id)
+                    queues[dst_queue_id]["queue_num"] = (
+                        dst_node.get_queue_num(dst_qos_id, dst_queue_id))
+
+                fog_port = str(response["port"])
+                # 3. Push flows to reserve the path in 1 direction:
+                # Push flow on src side unless its an edge node
+                # Flow points up (edge src, fog dst)
+                if not isinstance(src_node, topology.EdgeNode):
+                    flow_prefix = (edge_node_id + "-TO-" +
+                                   fog_node_id + "-" + fog_port)
+                    src_queue_num = src_node.get_queue_num(src_qos_id, src_queue_id)
+                    flow_ids = flow_mgr.create_enqueue_flows(
+                        top_id, src_node_id, 0, flow_prefix,
+                        edge_ip_addr, fog_ip_addr,
+                        src_port, src_queue_id, src_queue_num,
+                        fog_port, proto_num, True, 2000, flow_batch
+                    )
                 
-                # Update alloc
-                flows = alloc["hops"][src_node_id]["flows"]
-                for flow_id in flow_ids:
-                    flows.append(flow_id)
-
-                num_flows += 2
-                # Link reservation used to be here
-
-            # 4. Push flows to reserve the path in the other direction:
-            # Push flow on dst side unless its a fog node
-            # Flow points down (fog src, edge dst)
-            if not isinstance(dst_node, topology.FogNode):
-                flow_prefix = (fog_node_id + "-TO-" +
-                               edge_node_id + "-" + fog_port)
-                dst_queue_num = dst_node.get_queue_num(dst_qos_id, dst_queue_id)
-                flow_ids = flow_mgr.create_enqueue_flows(
-                    top_id, dst_node_id, 0, flow_prefix,
-                    fog_ip_addr, edge_ip_addr,
-                    dst_port, dst_queue_id, dst_queue_num,
-                    fog_port, proto_num, False, 2000
-                )
+                    # Update alloc
+                    flows = alloc["hops"][src_node_id]["flows"]
+                    for flow_id in flow_ids:
+                        flows.append(flow_id)
+
+                    num_flows += 2
+                    # Link reservation used to be here
+
+                # 4. Push flows to reserve the path in the other direction:
+                # Push flow on dst side unless its a fog node
+                # Flow points down (fog src, edge dst)
+                if not isinstance(dst_node, topology.FogNode):
+                    flow_prefix = (fog_node_id + "-TO-" +
+                                   edge_node_id + "-" + fog_port)
+                    dst_queue_num = dst_node.get_queue_num(dst_qos_id, dst_queue_id)
+                    flow_ids = flow_mgr.create_enqueue_flows(
+                        top_id, dst_node_id, 0, flow_prefix,
+                        fog_ip_addr, edge_ip_addr,
+                        dst_port, dst_queue_id, dst_queue_num,
+                        fog_port, proto_num, False, 2000, flow_batch
+                    )
                 
-                # Update alloc
-                flows = alloc["hops"][dst_node_id]["flows"]
-                for flow_id in flow_ids:
-                    flows.append(flow_id)
+                    # Update alloc
+                    flows = alloc["hops"][dst_node_id]["flows"]
+                    for flow_id in flow_ids:
+                        flows.append(flow_id)
 
-                num_flows += 2
+                    num_flows += 2
 
-                # Link reservation used to be here
+                    # Link reservation used to be here
 
-            # Reserve the link
-            cur_top.add_link_reservation(dst_node_id, dst_port, bandwidth_bps_req)
-            cur_top.add_link_reservation(src_node_id, src_port, bandwidth_bps_req)
+                # Link reservations were made before programming (see __reserve)
 
-            # Stop if no previous(next node is edge)
-            if cur["src_node_id"] not in previous:
-                #print("EXITING RAA")
-                break
+                # Stop if no previous(next node is edge)
+                if cur["src_node_id"] not in previous:
+                    #print("EXITING RAA")
+                    break
+
+                cur = previous[cur["src_node_id"]]
+
+            # Push the flows of all hops
+            cur = None
+            flow_mgr.commit_flow_batch(flow_batch)
+        except (confirmation.ConfirmationTimeout,
+                flow_manager.FlowWriteError) as e:
+            # The flows are only pushed at the end: a queue timeout leaves
+            # none to delete, a failed push only the ones it wrote
+            if isinstance(e, flow_manager.FlowWriteError):
+                failed = set((node_id, flow_id)
+                             for node_id, table_id, flow_id in e.failed)
+            for node_id, hop in alloc["hops"].items():
+                if isinstance(e, flow_manager.FlowWriteError):
+                    hop["flows"] = [flow_id for flow_id in hop["flows"]
+                                    if (node_id, flow_id) not in failed]
+                else:
+                    hop["flows"] = []
+            self.__rollback_allocation(cur_top, alloc, edge_node_id,
+                                       fog_node_id, response["port"])
+            link = None
+            if cur is not None:
+                link = (cur["src_port"], cur["dst_port"])
+            raise PathProgrammingError(str(e), link) from e
 
-            cur = previous[cur["src_node_id"]]
-                        
         # Update other alloc information
         alloc["edge_ip_addr"] = edge_ip_addr
         alloc["fog_ip_addr"] = fog_ip_addr
@@ -1183,7 +1451,6 @@ class ResourceManager(manager.Manager):
         # Get manager references
         top_mgr = self.mgrs["top"]
         cur_top = top_mgr.get_topology(top_id)
-        flow_mgr = self.mgrs["flow"]
         
         # To access alloc
         fog_port = edge_req["port"]
@@ -1192,30 +1459,90 @@ class ResourceManager(manager.Manager):
 
         # Get alloc entry for this container
         try:
-            alloc = self.allocated_resources[edge_node_id][fog_node_id][fog_port]
+            with self.alloc_mutex:
+                alloc = self.allocated_resources[edge_node_id][fog_node_id][fog_port]
         except KeyError:
             # No resources have been allocated
             return
 
-        # Begin extracting data
-        # fog_node_id = alloc["fog_node_id"]
-        edge_ip_addr = alloc["edge_ip_addr"]
-        fog_ip_addr = alloc["fog_ip_addr"]
+        # Hold the reservation locks of the fog node and the path while
+        # removing its queues, so that QoS'es on the path are not changed by
+        # an allocation at the same time
+        locks = cur_top.acquire_reservation_locks([fog_node_id],
+                                                  alloc["links"])
+        try:
+            self.__dealloc_resources(cur_top, alloc, edge_node_id,
+                                     fog_node_id)
+        finally:
+            cur_top.release_reservation_locks(locks)
+
+        # Remove the allocated_resources entry:
+        with self.alloc_mutex:
+            del self.allocated_resources[edge_node_id][fog_node_id][fog_port]
+
+
+    def has_allocations(self, node_id):
+        """ Return True if node_id is the edge or fog node of an allocation """
+        with self.alloc_mutex:
+            for edge_node_id, edge_allocs in self.allocated_resources.items():
+                for fog_node_id, fog_allocs in edge_allocs.items():
+                    if fog_allocs and node_id in (edge_node_id, fog_node_id):
+                        return True
+        return False
+
+
+    def __rollback_allocation(self, cur_top, alloc, edge_node_id, fog_node_id,
+                              fog_port):
+        """
+        Undo an allocation whose programming failed: release its
+        reservations, remove the queues/flows it got so far and drop its
+        allocated_resources entry. Call with the reservation locks of the fog
+        node and the path held.
+        """
+        try:
+            self.__dealloc_resources(cur_top, alloc, edge_node_id, fog_node_id)
+        except confirmation.ConfirmationTimeout as e:
+            # The reservations are released before any queue is touched
+            print("Rollback of {} -> {} incomplete: {}".format(
+                edge_node_id, fog_node_id, e), file=sys.stderr)
+
+        with self.alloc_mutex:
+            fog_allocs = self.allocated_resources[edge_node_id][fog_node_id]
+            del fog_allocs[fog_port]
+
+
+    def __dealloc_resources(self, cur_top, alloc, edge_node_id, fog_node_id):
+        """
+        Release the fog node and path reservations of alloc and remove its
+        flows and queues. Call with the reservation locks of the fog node and
+        the path held.
+        """
+        top_mgr = self.mgrs["top"]
+        flow_mgr = self.mgrs["flow"]
 
-        # Resource data
         cpu_pct = alloc["cpu_pct"]
         mem_mb = alloc["mem_mb"]
         bandwidth_bps = alloc["bandwidth_bps"]
 
-        # Paths data
-        hops = alloc["hops"]
-
         # Deallocate fog resources
         # - add reservation of each resource negatively
-        cur_top = top_mgr.get_topology(top_id)
         fog_node = cur_top.get_node(fog_node_id)
         fog_node.add_reserved_cpu_pct(-cpu_pct)
         fog_node.add_reserved_mem_mb(-mem_mb)
+        cur_top.mark_changed()
+
+        # Release the link reservations first, so they are not leaked if
+        # removing a queue times out
+        for node_id in alloc["hops"]:
+            # Add link reservation of negative bandwidth reservation
+            src_port_ofid = alloc["hops"][node_id]["src_port"]
+            dst_port_ofid = alloc["hops"][node_id]["dst_port"]
+            cur_top.add_link_reservation(node_id, src_port_ofid, -bandwidth_bps)
+            cur_top.add_link_reservation(node_id, dst_port_ofid, -bandwidth_bps)
+
+        # Deallocate the link on the edge and fog
+        cur_top.add_link_reservation(edge_node_id, edge_node_id, -bandwidth_bps)
+        cur_top.add_link_reservation(fog_node_id, fog_node_id, -bandwidth_bps)
 
         # Remove the path (before deleting queues):
         # Go through all hops
@@ -1236,20 +1563,6 @@ class ResourceManager(manager.Manager):
                 # - Delete the queues
                 top_mgr.delete_queue(node_id, queue_id)
 
-            # Add link reservation of negative bandwidth reservation
-            src_port_ofid = alloc["hops"][node_id]["src_port"]
-            dst_port_ofid = alloc["hops"][node_id]["dst_port"]
-            cur_top.add_link_reservation(node_id, src_port_ofid, -bandwidth_bps)
-            cur_top.add_link_reservation(node_id, dst_port_ofid, -bandwidth_bps)
-
-
-        # Finally deallocate the link on the edge and fog
-        cur_top.add_link_reservation(edge_node_id, edge_node_id, -bandwidth_bps)
-        cur_top.add_link_reservation(fog_node_id, fog_node_id, -bandwidth_bps)
-            
-        # Remove the allocated_resources entry:
-        del self.allocated_resources[edge_node_id][fog_node_id][fog_port]
-        
 
 class DockerSwarm:
 
@@ -1492,13 +1805,12 @@ class DockerSwarm:
         return int((mem_request * math.pow(10,6)))
 
     # Generate a random port not currently being used by the node for another container
-    def generate_port_num(self, node_id):
+    def generate_port_num(self, node_id, taken_ports=()):
+        # taken_ports: ports in use on node_id which are not in self.ports
         port = random.randint(1024, 10000)
-        # check if node_id has any ports exposed
-        if (node_id not in self.ports):
-            return port
+        used = self.ports.get(node_id, ())
         
-        while(port in self.ports[node_id]):
+        while(port in used or port in taken_ports):
             port = random.randint(1024, 6000)
         return port
     
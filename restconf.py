@@ -0,0 +1,210 @@
+# This file is a part of the The Fog Development Kit (FDK)
+#
+# Developed by:
+# - Colton Powell
+# - Christopher Desiniotis
+# - Dr. Behnam Dezfouli
+#
+# In the Internet of Things Research Lab, Santa Clara University, CA, USA
+
+import asyncio
+import concurrent.futures
+import functools
+import json
+import requests as req
+import threading
+
+
+# Keys of opendaylight-inventory nodes which the FDK never reads. Flow tables
+# (with per-flow statistics), groups and meters are by far the largest part
+# of the document on switches with many flows.
+INVENTORY_UNUSED_KEYS = frozenset([
+    "flow-node-inventory:table",
+    "flow-node-inventory:group",
+    "flow-node-inventory:meter",
+    "flow-node-inventory:switch-features",
+    "flow-node-inventory:snapshot-gathering-status-start",
+    "flow-node-inventory:snapshot-gathering-status-end",
+    "opendaylight-group-statistics:group-features",
+    "opendaylight-meter-statistics:meter-features"
+])
+
+# Keys of network-topology nodes which the FDK never reads. OVSDB termination
+# points are NOT dropped since they are pushed back to ODL as-is.
+NETWORK_TOPOLOGY_UNUSED_KEYS = frozenset([
+    "ovsdb:queues",
+    "ovsdb:qos-entries",
+    "ovsdb:connection-info",
+    "ovsdb:openvswitch-other-configs",
+    "ovsdb:openvswitch-external-ids",
+    "ovsdb:datapath-type-entry",
+    "ovsdb:interface-type-entry",
+    "ovsdb:managed-node-entry"
+])
+
+
+def loads_compact(data, drop_keys):
+    """
+    Parse a JSON document, dropping every object member whose key is in
+    drop_keys as soon as its parent object is built. Unused sub-trees are
+    only ever alive one at a time, instead of for as long as the document.
+    """
+    def compact_object(pairs):
+        obj = dict(pairs)
+        for key in drop_keys.intersection(obj):
+            del obj[key]
+        return obj
+
+    return json.loads(data, object_pairs_hook=compact_object)
+
+
+class RestconfClient:
+    """
+    RestconfClient is a thin wrapper around a pooled, keep-alive
+    requests.Session which is used for every call into the ODL RESTCONF API.
+
+    Paths handed to get/put/post/delete are relative to the RESTCONF root, so
+    "operational/opendaylight-inventory:nodes/" is requested from
+    http://<ctrlr_ip_addr>:8181/restconf/operational/opendaylight-inventory:nodes/
+    """
+
+    def __init__(self, ctrlr_ip_addr, head, pool_size=10, timeout=10.0,
+                 auth=("admin", "admin"), port=8181, max_concurrency=None):
+        self.ctrlr_ip_addr = ctrlr_ip_addr # IP Address of controller
+        self.head = head                   # HTTP Header
+        self.auth = auth                   # RESTCONF credentials
+        self.timeout = timeout             # Default per-call timeout (secs)
+        self.pool_size = pool_size         # Max kept-alive connections
+
+        self.base_url = "http://{}:{}/restconf/".format(ctrlr_ip_addr, port)
+
+        # One session shared by every Manager. The adapter keeps up to
+        # pool_size connections to ODL open, so concurrent callers (the
+        # topology update thread, link util thread, RAA, etc.) reuse
+        # established TCP connections instead of opening one per call.
+        self.session = req.Session()
+        self.session.auth = self.auth
+        self.session.headers.update(self.head)
+        adapter = req.adapters.HTTPAdapter(pool_connections=1,
+                                           pool_maxsize=pool_size,
+                                           pool_block=True)
+        self.session.mount("http://", adapter)
+
+        # asyncio front-end used to fan requests out in parallel. Never run
+        # more requests at once than there are pooled connections.
+        if max_concurrency is None or max_concurrency > pool_size:
+            max_concurrency = pool_size
+        self.aio = AsyncRestconfClient(self, max_concurrency)
+
+        # Guards close() against concurrent shutdowns of several Managers
+        self.mutex = threading.Lock()
+        self.closed = False
+
+
+    def url(self, path):
+        """ Return the full URL for a path relative to the RESTCONF root """
+        if path.startswith("http://"):
+            return path
+        return self.base_url + path.lstrip("/")
+
+
+    def request(self, method, path, data=None, timeout=None):
+        """
+        Issue a request on the shared session. timeout overrides the default
+        per-call timeout (seconds) of this client.
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        return self.session.request(method, self.url(path), data=data,
+                                    timeout=timeout)
+
+
+    def get(self, path, timeout=None):
+        return self.request("GET", path, timeout=timeout)
+
+
+    def put(self, path, data, timeout=None):
+        return self.request("PUT", path, data=data, timeout=timeout)
+
+
+    def post(self, path, data, timeout=None):
+        return self.request("POST", path, data=data, timeout=timeout)
+
+
+    def delete(self, path, timeout=None):
+        return self.request("DELETE", path, timeout=timeout)
+
+
+    def get_all(self, paths, timeout=None):
+        """
+        GET every path in paths concurrently (see AsyncRestconfClient).
+        Returns the responses in the same order as paths. A request that
+        failed is returned as its exception instead of a response.
+        """
+        return self.aio.get_all(paths, timeout)
+
+
+    def close(self):
+        """ Close all pooled connections. Safe to call more than once. """
+        with self.mutex:
+            if self.closed:
+                return
+            self.closed = True
+            self.aio.close()
+            self.session.close()
+
+
+class AsyncRestconfClient:
+    """
+    AsyncRestconfClient runs many RESTCONF requests at the same time with
+    asyncio, so a poll over N switches/nodes costs about one round-trip
+    instead of N.
+
+    Requests are issued on the pooled session of a RestconfClient from a
+    small worker pool, and at most max_concurrency of them are in flight at
+    once. Pollers are plain threads, so get_all() is a blocking entry point
+    which runs its own event loop.
+    """
+
+    def __init__(self, restconf_client, max_concurrency=8):
+        self.restconf = restconf_client
+        self.max_concurrency = max_concurrency
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix="restconf")
+
+
+    async def request(self, semaphore, method, path, data=None, timeout=None):
+        """ Issue a single request once a concurrency slot is free """
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(self.restconf.request, method, path,
+                                     data, timeout)
+            return await loop.run_in_executor(self.executor, call)
+
+
+    async def gather(self, requests, timeout=None):
+        """
+        Run a list of (method, path, data) requests concurrently. Results
+        (responses or exceptions) are returned in the order of requests.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [self.request(semaphore, method, path, data, timeout)
+                 for method, path, data in requests]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+    def run(self, requests, timeout=None):
+        """ Blocking wrapper around gather() for use from threads """
+        if len(requests) == 0:
+            return []
+        return asyncio.run(self.gather(requests, timeout))
+
+
+    def get_all(self, paths, timeout=None):
+        return self.run([("GET", path, None) for path in paths], timeout)
+
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,194 @@
+# This file is a part of the The Fog Development Kit (FDK)
+#
+# Developed by:
+# - Colton Powell
+# - Christopher Desiniotis
+# - Dr. Behnam Dezfouli
+#
+# In the Internet of Things Research Lab, Santa Clara University, CA, USA
+
+"""
+End-to-end benchmark of the FDK managers against the ODL emulator.
+
+Times the main RESTCONF-heavy paths (topology updates, link QoS bootstrap,
+link utilization polls, flow programming and the RAA) and reports the
+number of requests each one issued.
+
+Usage: python3 benchmark.py [--switches N] [--hosts N] [--latency S]
+                            [--op-lag S] [--workers N] [--iterations N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+import odl_emulator
+
+# The FDK modules live two directories up, and fdk.py reads fdk_conf.json
+# from the working directory on import
+FDK_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, FDK_DIR)
+cwd = os.getcwd()
+os.chdir(FDK_DIR)
+import flow_manager
+import resource_manager
+import restconf
+import topology
+import topology_manager
+os.chdir(cwd)
+
+
+class BenchmarkSwarm:
+    """ Docker swarm replacement. Benchmarks never start containers. """
+
+    def __init__(self):
+        self.nodes = {}
+        self.next_port = 30000
+
+    def generate_port_num(self, node_id, taken_ports=()):
+        self.next_port += 1
+        return self.next_port
+
+
+def timed(name, emulator, fn, iterations=1):
+    """ Run fn iterations times and print the mean time and request counts """
+    emulator.reset_counts()
+    start = timeit.default_timer()
+    for i in range(0, iterations):
+        fn()
+    elapsed = (timeit.default_timer() - start) / iterations
+    counts = emulator.reset_counts()
+    num_requests = sum(counts.values()) / iterations
+    print("{:<36} {:>10.4f}s {:>10.1f} requests".format(name, elapsed,
+                                                        num_requests))
+    return elapsed
+
+
+def make_managers(port, args):
+    head = {
+        "Content-type": "application/yang.data+json",
+        "Accept": "application/yang.data+json"
+    }
+    client = restconf.RestconfClient("127.0.0.1", head, args.pool_size,
+                                     port=port,
+                                     max_concurrency=args.pool_size)
+    mgrs = {}
+    mgrs["flow"] = flow_manager.FlowManager(mgrs, head, "127.0.0.1", client)
+    mgrs["top"] = topology_manager.TopologyManager(
+        mgrs, head, "127.0.0.1", 40000000, client,
+        compact_parse=args.compact_parse)
+    mgrs["res"] = resource_manager.ResourceManager(
+        mgrs, head, "127.0.0.1", BenchmarkSwarm(), client)
+    return mgrs, client
+
+
+def make_fog_and_edge(top_mgr, fabric, top_id="flow:1"):
+    """
+    Turn the first host into an edge node and the host furthest away (in
+    the ring) into a fog node, like their greetings would.
+    """
+    cur_top = top_mgr.get_topology(top_id)
+    host_ids = list(fabric.hosts)
+    edge_id = host_ids[0]
+    fog_id = host_ids[len(host_ids) // 2]
+
+    cur_top.replace_node(edge_id, cur_top.nodes[edge_id].create_edge_node())
+    fog_node = cur_top.nodes[fog_id].create_fog_node()
+    fog_node.mem_max = 4096
+    cur_top.replace_node(fog_id, fog_node)
+
+    return edge_id, fog_id
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="FDK benchmark")
+    parser.add_argument("--switches", type=int, default=16)
+    parser.add_argument("--hosts", type=int, default=2,
+                        help="hosts per switch")
+    parser.add_argument("--latency", type=float, default=0.002,
+                        help="delay of every request (secs)")
+    parser.add_argument("--op-lag", type=float, default=0.01,
+                        help="config -> operational delay (secs)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="switches bootstrapped at once")
+    parser.add_argument("--pool-size", type=int, default=10,
+                        help="RESTCONF connection pool size")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--compact-parse", action="store_true")
+    opts = parser.parse_args(args[1:])
+
+    fabric = odl_emulator.SyntheticFabric(opts.switches, opts.hosts)
+    emulator = odl_emulator.OdlEmulator(fabric, latency=opts.latency,
+                                        op_lag=opts.op_lag)
+    port = emulator.start()
+
+    # Results of the RAA go to test_data_new.json in the working directory
+    os.chdir(tempfile.mkdtemp(prefix="fdk-bench-"))
+
+    print("{} switches, {} hosts, {} links, latency {}s, op lag {}s".format(
+        len(fabric.switches), len(fabric.hosts), len(fabric.links),
+        opts.latency, opts.op_lag))
+    print()
+
+    mgrs, client = make_managers(port, opts)
+    top_mgr = mgrs["top"]
+    flow_mgr = mgrs["flow"]
+    res_mgr = mgrs["res"]
+
+    try:
+        timed("update_topology (cold)", emulator, top_mgr.update_topology)
+        timed("update_topology (steady)", emulator, top_mgr.update_topology,
+              opts.iterations)
+
+        timed("init_link_qos (1 worker)", emulator,
+              lambda: top_mgr.init_link_qos(1))
+        timed("shutdown_link_qos", emulator, top_mgr.shutdown_link_qos)
+        timed("init_link_qos ({} workers)".format(opts.workers), emulator,
+              lambda: top_mgr.init_link_qos(opts.workers))
+
+        timed("update_bandwidth_data (bulk)", emulator,
+              lambda: res_mgr.update_bandwidth_data("flow:1", 1.0, True),
+              opts.iterations)
+        timed("update_bandwidth_data (per switch)", emulator,
+              lambda: res_mgr.update_bandwidth_data("flow:1", 1.0, False),
+              opts.iterations)
+
+        timed("init_flows", emulator,
+              lambda: flow_mgr.init_flows("flow:1", 0, 1000))
+
+        edge_id, fog_id = make_fog_and_edge(top_mgr, fabric)
+        edge_req = {
+            "node_id": edge_id,
+            "image": "benchmark",
+            "cpu": 0,
+            "ram": 0,
+            "bandwidth": 1000000,
+            "proto_num": 6
+        }
+        timed("resource_alloc_algorithm", emulator,
+              lambda: res_mgr.resource_alloc_algorithm(edge_req, "flow:1"))
+        # Clear the path cache to time the searches themselves
+        path_engine = top_mgr.get_topology("flow:1").path_engine
+
+        def dijkstra(targets=None):
+            path_engine.clear_cache()
+            res_mgr.dijkstra(edge_id, "flow:1", 1000000, targets=targets)
+
+        near_id = list(fabric.hosts)[1]
+        timed("dijkstra", emulator, dijkstra, opts.iterations)
+        timed("dijkstra (far target)", emulator,
+              lambda: dijkstra([fog_id]), opts.iterations)
+        timed("dijkstra (near target)", emulator,
+              lambda: dijkstra([near_id]), opts.iterations)
+        timed("dijkstra (cached)", emulator,
+              lambda: res_mgr.dijkstra(edge_id, "flow:1", 1000000),
+              opts.iterations)
+    finally:
+        client.close()
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
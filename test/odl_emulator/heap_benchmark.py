@@ -0,0 +1,115 @@
+# This file is a part of the The Fog Development Kit (FDK)
+#
+# Developed by:
+# - Colton Powell
+# - Christopher Desiniotis
+# - Dr. Behnam Dezfouli
+#
+# In the Internet of Things Research Lab, Santa Clara University, CA, USA
+
+"""
+Micro-benchmark of dary_heap arities.
+
+Runs the heap operations of CompiledTopology.dijkstra() (push, pop_min,
+decrease_key on integer node handles) over the synthetic fabrics of the ODL
+emulator, for several fabric sizes and heap arities. The arity dijkstra()
+picks, max(2, m//n), is marked with a *.
+
+Usage: python3 heap_benchmark.py [--sizes N,N,...] [--hosts N]
+                                 [--arities D,D,...] [--iterations N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+import odl_emulator
+
+FDK_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, FDK_DIR)
+import dary_heap
+
+
+def make_graph(num_switches, hosts_per_switch, seed=0):
+    """
+    Return (adjacency lists of (handle, weight), number of undirected links)
+    of a synthetic fabric, with random link weights like 1/avail_bandwidth.
+    """
+    fabric = odl_emulator.SyntheticFabric(num_switches, hosts_per_switch)
+    node_ids = list(fabric.switches) + list(fabric.hosts)
+    handles = {node_id: h for h, node_id in enumerate(node_ids)}
+
+    rng = random.Random(seed)
+    adj = [[] for _ in node_ids]
+    for src_node, src_tp, dst_node, dst_tp in fabric.links:
+        weight = 1 / rng.randint(1000000, 1000000000)
+        adj[handles[src_node]].append((handles[dst_node], weight))
+
+    return adj, len(fabric.links) // 2
+
+
+def dijkstra(adj, src, d):
+    """ Same heap usage as path_engine.CompiledTopology.dijkstra() """
+    n = len(adj)
+    dist = [0] * n
+    reached = [False] * n
+    done = [False] * n
+    heap = dary_heap.dary_heap(d, n)
+
+    reached[src] = True
+    heap.push(src, 0)
+    while not heap.empty():
+        h, h_cost = heap.pop_min()
+        done[h] = True
+        for n_h, weight in adj[h]:
+            if done[n_h]:
+                continue
+            n_cost = h_cost + weight
+            if not reached[n_h]:
+                reached[n_h] = True
+                dist[n_h] = n_cost
+                heap.push(n_h, n_cost)
+            elif n_cost < dist[n_h]:
+                dist[n_h] = n_cost
+                heap.decrease_key(n_h, n_cost)
+
+    return dist
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="dary_heap benchmark")
+    parser.add_argument("--sizes", default="16,64,256,1024",
+                        help="numbers of switches")
+    parser.add_argument("--hosts", type=int, default=2,
+                        help="hosts per switch")
+    parser.add_argument("--arities", default="2,3,4,8,16")
+    parser.add_argument("--iterations", type=int, default=20)
+    opts = parser.parse_args(args[1:])
+
+    sizes = [int(size) for size in opts.sizes.split(",")]
+    arities = [int(d) for d in opts.arities.split(",")]
+
+    print("{:>9} {:>7} {:>7}  ".format("switches", "nodes", "links") +
+          " ".join("{:>10}".format("d={}".format(d)) for d in arities))
+    for size in sizes:
+        adj, num_links = make_graph(size, opts.hosts)
+        num_nodes = len(adj)
+        chosen = max(2, num_links // num_nodes)
+
+        times = []
+        for d in arities:
+            start = timeit.default_timer()
+            for i in range(opts.iterations):
+                dijkstra(adj, i % num_nodes, d)
+            elapsed = (timeit.default_timer() - start) / opts.iterations
+            mark = "*" if d == chosen else " "
+            times.append("{:>9.2f}{}".format(elapsed * 1000, mark))
+
+        print("{:>9} {:>7} {:>7}  ".format(size, num_nodes, num_links) +
+              " ".join(times) + "  (ms per run)")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,734 @@
+# This file is a part of the The Fog Development Kit (FDK)
+#
+# Developed by:
+# - Colton Powell
+# - Christopher Desiniotis
+# - Dr. Behnam Dezfouli
+#
+# In the Internet of Things Research Lab, Santa Clara University, CA, USA
+
+"""
+A small stand-in for the OpenDaylight RESTCONF API, so the FDK managers can
+be run (and benchmarked) without a real controller or switches.
+
+Serves a synthetic fabric of OVS switches and hosts:
+- operational/network-topology:network-topology (flow:1 and ovsdb:1)
+- operational/opendaylight-inventory:nodes (ports, port statistics, flows)
+- config OVSDB queues, qos-entries and termination points
+- config flows (PUT/DELETE per flow, POST of several flows on a table)
+
+Writes to the config data store show up in the operational data store after
+op_lag seconds, and every request is delayed by latency seconds.
+
+Usage: python3 odl_emulator.py [--switches N] [--hosts N] [--latency S]
+                               [--op-lag S] [--port P]
+"""
+
+import argparse
+import collections
+import copy
+import http.server
+import json
+import sys
+import threading
+import time
+import urllib.parse
+
+NT = "network-topology:network-topology"
+INV = "opendaylight-inventory:nodes"
+TABLE = "flow-node-inventory:table"
+PORT_STATS = ("opendaylight-port-statistics:"
+              "flow-capable-node-connector-statistics")
+
+
+class SyntheticFabric:
+    """
+    A ring (or line) of OVS switches with hosts_per_switch hosts on each.
+    Switch i is "openflow:i". Ports 1..hosts_per_switch connect hosts, port
+    hosts_per_switch+1 connects to the next switch and hosts_per_switch+2 to
+    the previous one. Interface names are "eth<port number>".
+    """
+
+    def __init__(self, num_switches=4, hosts_per_switch=2,
+                 port_speed_kbps=1000000, ring=True):
+        self.num_switches = num_switches
+        self.hosts_per_switch = hosts_per_switch
+        self.port_speed_kbps = port_speed_kbps
+        self.ring = ring and num_switches > 2
+
+        self.switches = {}  # node_id -> switch info
+        self.hosts = {}     # node_id -> host info
+        self.links = []     # (src_node, src_tp, dst_node, dst_tp), directed
+
+        for i in range(1, num_switches + 1):
+            node_id = "openflow:{}".format(i)
+            ovsdb_id = "ovsdb://uuid/00000000-0000-0000-0000-{:012x}".format(i)
+            self.switches[node_id] = {
+                "dpid": i,
+                "datapath_id": self.int_to_mac(i, 8),
+                "ovsdb_id": ovsdb_id,
+                "br_ovsdb_id": ovsdb_id + "/bridge/br0",
+                "ports": list(range(1, hosts_per_switch + 3))
+            }
+
+            for j in range(1, hosts_per_switch + 1):
+                mac = "02:00:00:{:02x}:{:02x}:{:02x}".format(
+                    (i >> 8) & 0xff, i & 0xff, j)
+                host_id = "host:" + mac
+                self.hosts[host_id] = {
+                    "mac": mac,
+                    "ip": "10.{}.{}.{}".format((i >> 8) & 0xff, i & 0xff, j),
+                    "switch": node_id,
+                    "port": j
+                }
+                self.add_link(node_id, "{}:{}".format(node_id, j),
+                              host_id, host_id)
+
+        # Inter-switch links
+        num_links = num_switches if self.ring else num_switches - 1
+        for i in range(1, num_links + 1):
+            nxt = i % num_switches + 1
+            self.add_link("openflow:{}".format(i),
+                          "openflow:{}:{}".format(i, hosts_per_switch + 1),
+                          "openflow:{}".format(nxt),
+                          "openflow:{}:{}".format(nxt, hosts_per_switch + 2))
+
+
+    def add_link(self, node_a, tp_a, node_b, tp_b):
+        """ Add a bidirectional link """
+        self.links.append((node_a, tp_a, node_b, tp_b))
+        self.links.append((node_b, tp_b, node_a, tp_a))
+
+
+    def int_to_mac(self, value, num_bytes=6):
+        hex_str = "{:0{}x}".format(value, num_bytes * 2)
+        return ":".join(hex_str[i:i+2] for i in range(0, len(hex_str), 2))
+
+
+class OdlEmulator:
+    """
+    Emulates the ODL RESTCONF endpoints used by the FDK for a
+    SyntheticFabric. Thread-safe. Start with start() and stop with stop().
+    """
+
+    def __init__(self, fabric, host="127.0.0.1", port=0, latency=0.0,
+                 op_lag=0.0, traffic_bps=1000000):
+        self.fabric = fabric
+        self.host = host
+        self.port = port
+        self.latency = latency          # Delay of every request (secs)
+        self.op_lag = op_lag            # Config -> operational delay (secs)
+        self.traffic_bps = traffic_bps  # Synthetic traffic on every port
+
+        self.mutex = threading.Lock()
+        self.start_time = time.time()
+
+        # Config data store. ovsdb_id -> {queue_id: queue}, etc.
+        self.config_queues = collections.defaultdict(dict)
+        self.config_qoses = collections.defaultdict(dict)
+        self.config_tps = collections.defaultdict(dict)  # br_ovsdb_id -> {name: tp}
+        self.config_flows = collections.defaultdict(dict)  # node -> {(table, flow): flow}
+
+        # Operational data store (same layout), lagging behind config
+        self.op_queues = collections.defaultdict(dict)
+        self.op_qoses = collections.defaultdict(dict)
+        self.op_tps = collections.defaultdict(dict)
+        self.op_flows = collections.defaultdict(dict)
+
+        # (apply_time, function) of config changes not yet operational
+        self.pending = []
+
+        # Number of requests served, by (method, datastore)
+        self.request_counts = collections.Counter()
+
+        self.server = None
+        self.thread = None
+
+
+    def start(self):
+        """ Serve in a background thread. Returns the port in use. """
+        emulator = self
+
+        class Handler(RestconfHandler):
+            odl = emulator
+
+        self.server = http.server.ThreadingHTTPServer((self.host, self.port),
+                                                      Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self.port
+
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+    def reset_counts(self):
+        with self.mutex:
+            counts = dict(self.request_counts)
+            self.request_counts.clear()
+        return counts
+
+
+# ==============================================================================
+# Data store handling
+# ==============================================================================
+
+    def commit(self, fn):
+        """
+        Apply fn (a change to the operational data store) once op_lag has
+        passed. Call with self.mutex held.
+        """
+        if self.op_lag <= 0:
+            fn()
+        else:
+            self.pending.append((time.time() + self.op_lag, fn))
+
+
+    def apply_pending(self):
+        """ Make due config changes operational. Call with self.mutex held. """
+        if len(self.pending) == 0:
+            return
+        now = time.time()
+        remaining = []
+        for apply_time, fn in self.pending:
+            if apply_time <= now:
+                fn()
+            else:
+                remaining.append((apply_time, fn))
+        self.pending = remaining
+
+
+    def set_entry(self, store, key, entry_id, entry):
+        def fn():
+            store[key][entry_id] = entry
+        return fn
+
+
+    def del_entry(self, store, key, entry_id):
+        def fn():
+            store[key].pop(entry_id, None)
+        return fn
+
+
+# ==============================================================================
+# Document builders (call with self.mutex held)
+# ==============================================================================
+
+    def port_bytes(self, node_id, port_num):
+        """ Byte counters of a port, growing at traffic_bps """
+        elapsed = time.time() - self.start_time
+        base = int(self.traffic_bps / 8 * elapsed)
+        return {
+            "transmitted": base + port_num,
+            "received": base
+        }
+
+
+    def build_flow_topology(self):
+        fabric = self.fabric
+        nodes = []
+        for node_id, switch in fabric.switches.items():
+            tps = [{"tp-id": "{}:{}".format(node_id, p)}
+                   for p in switch["ports"]]
+            tps.append({"tp-id": node_id + ":LOCAL"})
+            nodes.append({
+                "node-id": node_id,
+                "opendaylight-topology-inventory:inventory-node-ref":
+                "/opendaylight-inventory:nodes/opendaylight-inventory:node"
+                "[opendaylight-inventory:id='{}']".format(node_id),
+                "termination-point": tps
+            })
+
+        for host_id, host in fabric.hosts.items():
+            nodes.append({
+                "node-id": host_id,
+                "host-tracker-service:id": host_id,
+                "host-tracker-service:addresses": [{
+                    "id": 1,
+                    "mac": host["mac"],
+                    "ip": host["ip"],
+                    "first-seen": 0,
+                    "last-seen": 0
+                }],
+                "host-tracker-service:attachment-points": [{
+                    "tp-id": "{}:{}".format(host["switch"], host["port"]),
+                    "active": True,
+                    "corresponding-tp": host_id
+                }],
+                "termination-point": [{"tp-id": host_id}]
+            })
+
+        links = []
+        for src_node, src_tp, dst_node, dst_tp in fabric.links:
+            links.append({
+                "link-id": src_tp + "/" + dst_tp,
+                "source": {"source-node": src_node, "source-tp": src_tp},
+                "destination": {"dest-node": dst_node, "dest-tp": dst_tp}
+            })
+
+        return {"topology-id": "flow:1", "node": nodes, "link": links}
+
+
+    def build_ovsdb_node(self, node_id):
+        """ The OVSDB (manager) node of a switch """
+        switch = self.fabric.switches[node_id]
+        ovsdb_id = switch["ovsdb_id"]
+        node = {
+            "node-id": ovsdb_id,
+            "ovsdb:connection-info": {
+                "remote-ip": "127.0.0.1",
+                "remote-port": 6640,
+                "local-ip": self.host,
+                "local-port": 6640
+            },
+            "ovsdb:ovs-version": "2.9.0",
+            "ovsdb:managed-node-entry": [{
+                "bridge-ref": ("/network-topology:network-topology/"
+                               "network-topology:topology"
+                               "[network-topology:topology-id='ovsdb:1']/"
+                               "network-topology:node"
+                               "[network-topology:node-id='{}']".format(
+                                   switch["br_ovsdb_id"]))
+            }]
+        }
+
+        queues = list(self.op_queues[ovsdb_id].values())
+        if len(queues) != 0:
+            node["ovsdb:queues"] = queues
+        qoses = list(self.op_qoses[ovsdb_id].values())
+        if len(qoses) != 0:
+            node["ovsdb:qos-entries"] = qoses
+
+        return node
+
+
+    def build_base_tp(self, node_id, port_num):
+        name = "eth{}".format(port_num)
+        dpid = self.fabric.switches[node_id]["dpid"]
+        return {
+            "tp-id": name,
+            "ovsdb:name": name,
+            "ovsdb:ofport": port_num,
+            "ovsdb:ifindex": 1000 * dpid + port_num,
+            "ovsdb:port-uuid": "{:08x}-0000-0000-0000-{:012x}".format(
+                dpid, port_num),
+            "ovsdb:interface-uuid": "{:08x}-0000-0000-0001-{:012x}".format(
+                dpid, port_num)
+        }
+
+
+    def build_bridge_node(self, node_id):
+        """ The OVSDB bridge node of a switch """
+        switch = self.fabric.switches[node_id]
+        br_ovsdb_id = switch["br_ovsdb_id"]
+
+        tps = [{
+            "tp-id": "br0",
+            "ovsdb:name": "br0",
+            "ovsdb:interface-type": "ovsdb:interface-type-internal",
+            "ovsdb:ofport": 65534
+        }]
+        for port_num in switch["ports"]:
+            tp = self.build_base_tp(node_id, port_num)
+            written = self.op_tps[br_ovsdb_id].get(tp["tp-id"])
+            if written is not None:
+                tp.update(written)
+                tp["ovsdb:ifindex"] = 1000 * switch["dpid"] + port_num
+            tps.append(tp)
+
+        return {
+            "node-id": br_ovsdb_id,
+            "ovsdb:bridge-uuid": "{:08x}-0000-0000-0002-000000000000".format(
+                switch["dpid"]),
+            "ovsdb:bridge-name": "br0",
+            "ovsdb:datapath-id": switch["datapath_id"],
+            "ovsdb:datapath-type": "ovsdb:datapath-type-system",
+            "ovsdb:managed-by": ("/network-topology:network-topology/"
+                                 "network-topology:topology"
+                                 "[network-topology:topology-id='ovsdb:1']/"
+                                 "network-topology:node"
+                                 "[network-topology:node-id='{}']".format(
+                                     switch["ovsdb_id"])),
+            "termination-point": tps
+        }
+
+
+    def build_ovsdb_topology(self):
+        nodes = []
+        for node_id in self.fabric.switches:
+            nodes.append(self.build_ovsdb_node(node_id))
+            nodes.append(self.build_bridge_node(node_id))
+        return {"topology-id": "ovsdb:1", "node": nodes}
+
+
+    def build_network_topology(self):
+        return {
+            "network-topology": {
+                "topology": [
+                    self.build_flow_topology(),
+                    self.build_ovsdb_topology()
+                ]
+            }
+        }
+
+
+    def build_node_connector(self, node_id, port_num):
+        ofid = "{}:{}".format(node_id, port_num)
+        return {
+            "id": ofid,
+            "flow-node-inventory:port-number": port_num,
+            "flow-node-inventory:name": "eth{}".format(port_num),
+            "flow-node-inventory:current-speed": self.fabric.port_speed_kbps,
+            "flow-node-inventory:maximum-speed": 0,
+            "flow-node-inventory:hardware-address":
+            self.fabric.int_to_mac(
+                self.fabric.switches[node_id]["dpid"] * 256 + port_num),
+            "flow-node-inventory:state": {
+                "link-down": False,
+                "blocked": False,
+                "live": False
+            },
+            PORT_STATS: {
+                "bytes": self.port_bytes(node_id, port_num),
+                "packets": {"transmitted": 0, "received": 0},
+                "duration": {
+                    "second": int(time.time() - self.start_time),
+                    "nanosecond": 0
+                }
+            }
+        }
+
+
+    def build_tables(self, flows):
+        tables = {}
+        for (table_id, flow_id), flow in flows.items():
+            tables.setdefault(table_id, []).append(flow)
+        return [{"id": int(table_id), "flow": table_flows}
+                for table_id, table_flows in sorted(tables.items())]
+
+
+    def build_inventory_node(self, node_id):
+        switch = self.fabric.switches[node_id]
+        connectors = [self.build_node_connector(node_id, p)
+                      for p in switch["ports"]]
+        connectors.append({
+            "id": node_id + ":LOCAL",
+            "flow-node-inventory:port-number": "LOCAL",
+            "flow-node-inventory:name": "br0",
+            "flow-node-inventory:current-speed": 0
+        })
+        return {
+            "id": node_id,
+            "flow-node-inventory:manufacturer": "Nicira, Inc.",
+            "flow-node-inventory:software": "2.9.0",
+            "flow-node-inventory:switch-features": {
+                "max_tables": 254,
+                "max_buffers": 0
+            },
+            "node-connector": connectors,
+            TABLE: self.build_tables(self.op_flows[node_id])
+        }
+
+
+    def build_inventory(self):
+        return {
+            "nodes": {
+                "node": [self.build_inventory_node(node_id)
+                         for node_id in self.fabric.switches]
+            }
+        }
+
+
+# ==============================================================================
+# Request handling
+# ==============================================================================
+
+    def handle(self, method, path, body):
+        """
+        Serve one request. Returns (status code, response dict or None).
+        """
+        segs = [urllib.parse.unquote(seg)
+                for seg in path.split("?")[0].split("/") if seg != ""]
+        if len(segs) < 3 or segs[0] != "restconf":
+            return 404, self.error("unknown path")
+        segs = segs[1:]
+        datastore = segs[0]
+
+        with self.mutex:
+            self.request_counts[(method, datastore)] += 1
+            self.apply_pending()
+
+            if segs[1] == NT:
+                return self.handle_network_topology(method, datastore,
+                                                    segs[2:], body)
+            elif segs[1] == INV:
+                return self.handle_inventory(method, datastore, segs[2:],
+                                             body)
+
+        return 404, self.error("unknown path")
+
+
+    def handle_network_topology(self, method, datastore, segs, body):
+        if len(segs) == 0:
+            if method == "GET" and datastore == "operational":
+                return 200, self.build_network_topology()
+            return 405, self.error("unsupported")
+
+        # topology/<top>/node/<node>/...
+        if len(segs) < 4 or segs[0] != "topology" or segs[2] != "node":
+            return 404, self.error("unknown path")
+        node_id = segs[3]
+        rest = segs[4:]
+
+        # Find the switch owning this OVSDB node
+        owner = None
+        for switch_id, switch in self.fabric.switches.items():
+            if node_id in (switch["ovsdb_id"], switch["br_ovsdb_id"]):
+                owner = switch_id
+                break
+        if owner is None:
+            return 404, self.error("node {} not found".format(node_id))
+        switch = self.fabric.switches[owner]
+
+        if len(rest) == 0:
+            if method != "GET":
+                return 405, self.error("unsupported")
+            if node_id == switch["ovsdb_id"]:
+                return 200, {"node": [self.build_ovsdb_node(owner)]}
+            return 200, {"node": [self.build_bridge_node(owner)]}
+
+        if len(rest) != 2 or datastore != "config":
+            return 404, self.error("unknown path")
+        kind, entry_id = rest
+
+        if kind == "ovsdb:queues":
+            return self.handle_entry(method, body, node_id, entry_id,
+                                     "ovsdb:queues", "queue-id",
+                                     self.config_queues, self.op_queues)
+        elif kind == "ovsdb:qos-entries":
+            return self.handle_entry(method, body, node_id, entry_id,
+                                     "ovsdb:qos-entries", "qos-id",
+                                     self.config_qoses, self.op_qoses)
+        elif kind == "termination-point":
+            return self.handle_entry(method, body, node_id, entry_id,
+                                     "termination-point", "tp-id",
+                                     self.config_tps, self.op_tps)
+
+        return 404, self.error("unknown path")
+
+
+    def handle_entry(self, method, body, key, entry_id, list_name, id_name,
+                     config_store, op_store):
+        """ GET/PUT/DELETE of one keyed list entry of an OVSDB node """
+        if method == "GET":
+            try:
+                return 200, {list_name: [config_store[key][entry_id]]}
+            except KeyError:
+                return 404, self.error("{} not found".format(entry_id))
+
+        elif method == "PUT":
+            try:
+                entry = dict(json.loads(body)[list_name][0])
+            except (ValueError, KeyError, IndexError, TypeError):
+                return 400, self.error("malformed {}".format(list_name))
+            entry[id_name] = entry_id
+            created = entry_id not in config_store[key]
+            config_store[key][entry_id] = entry
+            self.commit(self.set_entry(op_store, key, entry_id,
+                                       copy.deepcopy(entry)))
+            return (201 if created else 200), None
+
+        elif method == "DELETE":
+            if entry_id not in config_store[key]:
+                return 404, self.error("{} not found".format(entry_id))
+            del config_store[key][entry_id]
+            self.commit(self.del_entry(op_store, key, entry_id))
+            return 200, None
+
+        return 405, self.error("unsupported")
+
+
+    def handle_inventory(self, method, datastore, segs, body):
+        if len(segs) == 0:
+            if method == "GET" and datastore == "operational":
+                return 200, self.build_inventory()
+            return 405, self.error("unsupported")
+
+        if len(segs) < 2 or segs[0] != "node":
+            return 404, self.error("unknown path")
+        node_id = segs[1]
+        if node_id not in self.fabric.switches:
+            return 404, self.error("node {} not found".format(node_id))
+        rest = segs[2:]
+
+        if len(rest) == 0:
+            if method != "GET":
+                return 405, self.error("unsupported")
+            if datastore == "operational":
+                return 200, {"node": [self.build_inventory_node(node_id)]}
+            return 200, {"node": [{
+                "id": node_id,
+                TABLE: self.build_tables(self.config_flows[node_id])
+            }]}
+
+        if rest[0] == "node-connector" and len(rest) == 2:
+            port_num = rest[1].rsplit(":", 1)[-1]
+            if (method != "GET" or not port_num.isdigit() or
+                int(port_num) not in self.fabric.switches[node_id]["ports"]):
+                return 404, self.error("{} not found".format(rest[1]))
+            return 200, {"node-connector": [
+                self.build_node_connector(node_id, int(port_num))
+            ]}
+
+        if rest[0] != TABLE or len(rest) < 2:
+            return 404, self.error("unknown path")
+        table_id = rest[1]
+
+        # POST of several flows on a table
+        if len(rest) == 2:
+            if method != "POST" or datastore != "config":
+                return 405, self.error("unsupported")
+            try:
+                flows = json.loads(body)["flow"]
+            except (ValueError, KeyError, TypeError):
+                return 400, self.error("malformed flows")
+            for flow in flows:
+                if (table_id, str(flow.get("id"))) in self.config_flows[node_id]:
+                    return 409, self.error("flow {} exists".format(flow["id"]))
+            for flow in flows:
+                self.put_flow(node_id, table_id, str(flow["id"]), flow)
+            return 204, None
+
+        if len(rest) != 4 or rest[2] != "flow":
+            return 404, self.error("unknown path")
+        flow_key = (table_id, rest[3])
+
+        if method == "GET":
+            store = (self.config_flows if datastore == "config"
+                     else self.op_flows)
+            try:
+                return 200, {"flow": [store[node_id][flow_key]]}
+            except KeyError:
+                return 404, self.error("flow {} not found".format(rest[3]))
+
+        if datastore != "config":
+            return 405, self.error("unsupported")
+
+        if method == "PUT":
+            try:
+                flow = json.loads(body)["flow"][0]
+            except (ValueError, KeyError, IndexError, TypeError):
+                return 400, self.error("malformed flow")
+            created = flow_key not in self.config_flows[node_id]
+            self.put_flow(node_id, table_id, rest[3], flow)
+            return (201 if created else 200), None
+
+        elif method == "DELETE":
+            if flow_key not in self.config_flows[node_id]:
+                return 404, self.error("flow {} not found".format(rest[3]))
+            del self.config_flows[node_id][flow_key]
+            self.commit(self.del_entry(self.op_flows, node_id, flow_key))
+            return 200, None
+
+        return 405, self.error("unsupported")
+
+
+    def put_flow(self, node_id, table_id, flow_id, flow):
+        flow = dict(flow)
+        flow["id"] = flow_id
+        self.config_flows[node_id][(table_id, flow_id)] = flow
+        self.commit(self.set_entry(self.op_flows, node_id, (table_id, flow_id),
+                                   copy.deepcopy(flow)))
+
+
+    def error(self, msg):
+        return {
+            "errors": {
+                "error": [{
+                    "error-type": "application",
+                    "error-tag": "data-missing",
+                    "error-message": msg
+                }]
+            }
+        }
+
+
+class RestconfHandler(http.server.BaseHTTPRequestHandler):
+    """ HTTP front-end of an OdlEmulator (set as the odl class attribute) """
+
+    odl = None
+    protocol_version = "HTTP/1.1"  # Keep-alive, like ODL
+
+    # Headers and body are written separately - without this, Nagle's
+    # algorithm adds ~40ms to every response on a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.serve("GET")
+
+    def do_PUT(self):
+        self.serve("PUT")
+
+    def do_POST(self):
+        self.serve("POST")
+
+    def do_DELETE(self):
+        self.serve("DELETE")
+
+    def serve(self, method):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length > 0 else b""
+
+        if self.odl.latency > 0:
+            time.sleep(self.odl.latency)
+
+        status, data = self.odl.handle(method, self.path, body)
+
+        payload = b"" if data is None else json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/yang.data+json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Quiet - benchmarks issue thousands of requests
+        pass
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="ODL RESTCONF emulator")
+    parser.add_argument("--switches", type=int, default=4)
+    parser.add_argument("--hosts", type=int, default=2,
+                        help="hosts per switch")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="delay of every request (secs)")
+    parser.add_argument("--op-lag", type=float, default=0.0,
+                        help="config -> operational delay (secs)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8181)
+    opts = parser.parse_args(args[1:])
+
+    fabric = SyntheticFabric(opts.switches, opts.hosts)
+    emulator = OdlEmulator(fabric, opts.host, opts.port, opts.latency,
+                           opts.op_lag)
+    port = emulator.start()
+    print("Serving {} switches / {} hosts on http://{}:{}/restconf/".format(
+        len(fabric.switches), len(fabric.hosts), opts.host, port))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -7,10 +7,220 @@
 # 
 # In the Internet of Things Research Lab, Santa Clara University, CA, USA
 
+import collections
 import json
 import sys
 import time
 import threading
+import types
+
+import journal
+import link_stats
+import path_engine
+
+
+class Link:
+    """
+    One directed edge (link) in Topology.neighbors.
+    Slotted instead of a 14-key dict: smaller, and attribute access is
+    faster in the hot paths (bandwidth updates, path computations).
+    Also readable/writable like the dicts it replaced (edge["bps_reserved"]),
+    so existing callers keep working.
+    """
+
+    FIELDS = (
+        "src_node_id",
+        "dst_node_id",
+        "src_port",
+        "dst_port",
+        "src_int",
+        "dst_int",
+        "bps_reserved",
+        "bps_current",
+        "bps_capacity",
+        "cur_bytes_sent",
+        "cur_bytes_recvd",
+        "prev_bytes_sent",
+        "prev_bytes_recvd",
+        "utilization_pct"
+    )
+
+    # link_id: row of the link in Topology.link_stats
+    __slots__ = FIELDS + ("link_id",)
+
+    def __init__(self, src_node_id, dst_node_id, src_port, dst_port,
+                 src_int, dst_int, capacity):
+        self.src_node_id = src_node_id
+        self.dst_node_id = dst_node_id
+        self.src_port = src_port
+        self.dst_port = dst_port
+        self.src_int = src_int
+        self.dst_int = dst_int
+        self.bps_reserved = 0
+        self.bps_current = 0
+        self.bps_capacity = capacity
+        self.cur_bytes_sent = 0
+        self.cur_bytes_recvd = 0
+        self.prev_bytes_sent = 0
+        self.prev_bytes_recvd = 0
+        self.utilization_pct = 0.0
+        self.link_id = None
+
+    def __getitem__(self, key):
+        if key not in Link.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in Link.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in Link.FIELDS
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(Link.FIELDS)
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in Link.FIELDS]
+
+    def to_dict(self):
+        """ Return the link as a plain dict (for json, etc.) """
+        return dict(self.items())
+
+
+# Immutable copies of Links/nodes held by a TopologySnapshot
+LinkState = collections.namedtuple("LinkState", [
+    "src_node_id",
+    "dst_node_id",
+    "src_port",
+    "dst_port",
+    "bps_reserved",
+    "bps_current",
+    "bps_capacity",
+    "utilization_pct"
+])
+
+
+class NodeState(collections.namedtuple("NodeState", [
+        "node_id",
+        "ip_addr",
+        "cpu_max",
+        "cpu_reserved",
+        "mem_max",
+        "mem_reserved",
+        "cpu_util",
+        "mem_available",
+        "disk_available"
+])):
+    """
+    Immutable copy of a node. Resource fields are None for everything but
+    FogNodes. Has the accessors of FogNode used by the RAA.
+    """
+    __slots__ = ()
+
+    def get_ip_addr(self):
+        return self.ip_addr
+
+    def get_mem_avail_mb(self):
+        return self.mem_max - self.mem_reserved
+
+    def get_disk_avail_mb(self):
+        return self.disk_available
+
+    def get_cpu_avail_pct(self):
+        return self.cpu_max - self.cpu_reserved
+
+
+class TopologySnapshot:
+    """
+    Immutable, versioned view of the nodes, links and reservations of a
+    Topology, published by Topology.publish(). Has the read accessors of
+    Topology, so path computations and status queries can run on a snapshot
+    without holding Topology.mutex.
+    """
+
+    def __init__(self, top, version):
+        self.version = version
+        self.structure_version = top.structure_version
+
+        nodes = {}
+        for node_id, node in top.nodes.items():
+            if isinstance(node, FogNode):
+                nodes[node_id] = NodeState(
+                    node_id, node.ip_addr, node.cpu_max, node.cpu_reserved,
+                    node.mem_max, node.mem_reserved, node.cpu_util,
+                    node.mem_available, node.disk_available)
+            else:
+                nodes[node_id] = NodeState(
+                    node_id, getattr(node, "ip_addr", None),
+                    None, None, None, None, None, None, None)
+        self.nodes = types.MappingProxyType(nodes)
+
+        neighbors = {}
+        for node_id, edges in top.neighbors.items():
+            neighbors[node_id] = tuple(
+                LinkState(e.src_node_id, e.dst_node_id, e.src_port,
+                          e.dst_port, e.bps_reserved, e.bps_current,
+                          e.bps_capacity, e.utilization_pct)
+                for e in edges)
+        self.neighbors = types.MappingProxyType(neighbors)
+
+        self.node_ids = frozenset(top.node_ids)
+        self.switch_ids = tuple(top.switch_ids)
+        self.host_ids = tuple(top.host_ids)
+        self.edge_ids = tuple(top.edge_ids)
+        self.fog_ids = tuple(top.fog_ids)
+        self.n = top.n
+        self.l = top.l
+
+
+    def get_node_ids(self):
+        return self.node_ids
+
+
+    def get_node(self, node_id):
+        return self.nodes[node_id]
+
+
+    def get_neighbors(self, node_id):
+        return self.neighbors[node_id]
+
+
+    def get_all_edges(self):
+        return [edge for edges in self.neighbors.values() for edge in edges]
+
+
+    def get_num_links(self):
+        return self.l
+
+
+    def get_num_nodes(self):
+        return self.n
+
+
+    def get_switch_ids(self):
+        return list(self.switch_ids)
+
+
+    def get_host_ids(self):
+        return list(self.host_ids)
+
+
+    def get_edge_ids(self):
+        return list(self.edge_ids)
+
+
+    def get_fog_ids(self):
+        return list(self.fog_ids)
+
 
 class Topology:
     def __init__(self, mgr, ctrlr_ip_addr="localhost"):
@@ -23,6 +233,13 @@ class Topology:
         self.nodes = {}
         self.node_ids = set([])
 
+        # Node id's by role, maintained by add_node(), del_node() and
+        # replace_node(). Dicts (insertion ordered) used as sets.
+        self.switch_ids = {}   # OVSNodes
+        self.host_ids = {}     # HostNodes (including Edge/FogNodes)
+        self.edge_ids = {}     # EdgeNodes
+        self.fog_ids = {}      # FogNodes
+
         # dict of node neighbor info
         # keys: Node ID's
         # Top-level keys: node_id's
@@ -35,18 +252,29 @@ class Topology:
         
         self.neighbors = {}
 
-        # dict of links mapping to utilization information
+        # Index of the edges in self.neighbors (same objects, not copies)
         # keys: 2-tuples of form (src_port, dst_port) <- uniquely ID links
-        # ^ these keys map to dicts of the form:
-        # {
-        # "cur_bytes": current-byte-reading
-        # "prev_bytes": previous-byte-reading
-        # }
-        # Want to access link utilization from neighbors? Then do:
-        # src_port = self.neighbors[node_id][x]["src_port"]
-        # dst_port = self.neighbors[node_id][x]["dst_port"]
-        # Then lookup self.links[(src_port, dst_port)]["utilization"]
-        # self.links = {}
+        # ^ these keys map to the edge leaving src_port towards dst_port.
+        # Maintained by add_link() and del_link() for O(1) lookups of links
+        # (reservations, capacities, etc.) instead of neighbor list scans.
+        self.links = {}
+
+        # Index of the edges in self.neighbors by src_port only
+        # keys: port ids (host node id's for hosts) -> edge leaving that port
+        self.port_links = {}
+
+        # Log of the changes to nodes, links and reservations, for
+        # consumers updating derived structures incrementally (see
+        # journal.ChangeJournal)
+        self.journal = journal.ChangeJournal()
+
+        # Columnar copy of the link counters for bandwidth polls. Follows
+        # the links added/removed through the journal.
+        self.link_stats = link_stats.LinkStats(self.journal)
+
+        # CSR form of the latest snapshot for path computations. Rebuilt
+        # when structure_version changes (see mark_structure_changed()).
+        self.path_engine = path_engine.PathEngine()
 
         # dict of flow_ids to flow information
         # self.flows = {
@@ -64,8 +292,27 @@ class Topology:
         self.n = 0                     # num nodes
         self.l = 0                     # num links
 
-        # Mutex for topology access and manipulation
+        # Lock hierarchy:
+        # 1. mutex - structural lock. Held to add/remove nodes and links and
+        #    by the topology update, greeting and link util loops.
+        # 2. Reservation locks - one per fog node and one per link (both
+        #    directions), held to check, change and program reservations
+        #    (see acquire_reservation_locks()). Always taken in sorted order, and
+        #    never held while waiting for the mutex, so allocations over
+        #    disjoint paths proceed in parallel.
         self.mutex = threading.Lock()
+        self.reservation_locks = {} # lock key -> RLock, created on first use
+        self.reservation_locks_mutex = threading.Lock()
+
+        # Latest published TopologySnapshot and its version. changed is set
+        # by every modification (see mark_changed()), and the next
+        # get_snapshot() publishes a new snapshot. Publishing on demand keeps
+        # long runs of modifications (e.g. update_topology()) from building a
+        # snapshot after every change.
+        self.version = 0
+        self.structure_version = 0
+        self.changed = False
+        self.snapshot = TopologySnapshot(self, self.version)
 
       
     # Formats the network topology as a string [Ex: str(topology_object_name)]
@@ -85,7 +332,7 @@ class Topology:
 
             top_str += ": ["
             for n in self.neighbors[node_id]:
-                top_str += json.dumps(n, indent=3) + ",\n"
+                top_str += json.dumps(n.to_dict(), indent=3) + ",\n"
                 # top_str += ("\n\t" + n["dst_node_id"] + ", " +
                 #             n["src_port"] + " -> " + n["dst_port"])
 
@@ -107,16 +354,144 @@ class Topology:
             
         self.mutex.release()
 
+
+    def acquire_reservation_locks(self, fog_node_ids=(), links=()):
+        """
+        Acquire the reservation locks of the given fog nodes and links
+        (2-tuples of the ports on either end) in a global order. Returns the
+        locks, to be handed to release_reservation_locks().
+        """
+        keys = set([])
+        for node_id in fog_node_ids:
+            keys.add(("fog", node_id))
+        for src_port, dst_port in links:
+            keys.add(self.__link_lock_key(src_port, dst_port))
+
+        return self.__acquire_locks(sorted(keys))
+
+
+    def release_reservation_locks(self, locks):
+        """
+        Release locks from acquire_reservation_locks(). The reservations made
+        while holding them are published by the next get_snapshot().
+        """
+        self.__release_locks(locks)
+
+
+    def __link_lock_key(self, src_port, dst_port):
+        # Both directions of a link share a lock
+        if dst_port < src_port:
+            src_port, dst_port = dst_port, src_port
+        return ("link", src_port, dst_port)
+
+
+    def __acquire_locks(self, keys):
+        while True:
+            locks = []
+            with self.reservation_locks_mutex:
+                for key in keys:
+                    try:
+                        locks.append(self.reservation_locks[key])
+                    except KeyError:
+                        lock = threading.RLock()
+                        self.reservation_locks[key] = lock
+                        locks.append(lock)
+
+            for lock in locks:
+                lock.acquire()
+
+            # __drop_reservation_lock() may have dropped a lock before it was
+            # acquired above - a new lock of the same key would not exclude
+            # this holder, so start over with the current locks
+            with self.reservation_locks_mutex:
+                current = all(self.reservation_locks.get(key) is lock
+                              for key, lock in zip(keys, locks))
+            if current:
+                return locks
+
+            self.__release_locks(locks)
+
+
+    def __release_locks(self, locks):
+        for lock in reversed(locks):
+            lock.release()
+
+
+    def __drop_reservation_lock(self, key):
+        # Forget the lock of a removed link/fog node, unless it is in use (a
+        # request holding it fails its availability check anyway)
+        with self.reservation_locks_mutex:
+            lock = self.reservation_locks.get(key)
+            if lock is not None and lock.acquire(blocking=False):
+                del self.reservation_locks[key]
+                lock.release()
+
+
+    def mark_changed(self):
+        """
+        Note that nodes, links or reservations changed. Call this after
+        modifying nodes/links directly (fog node resources, etc.).
+        """
+        self.changed = True
+
+
+    def mark_structure_changed(self):
+        """ Note that nodes or links were added/removed """
+        self.structure_version += 1
+        self.mark_changed()
+
+
+    def publish(self):
+        """
+        Publish the current state as a new TopologySnapshot. Should be
+        called with the mutex held (get_snapshot() does this).
+        """
+        self.changed = False
+        self.version += 1
+        self.snapshot = TopologySnapshot(self, self.version)
+
+
+    def get_snapshot(self):
+        """
+        Return the latest TopologySnapshot without waiting for the mutex.
+        Pending changes are published first, unless the mutex is held (then
+        the last published snapshot is returned).
+        """
+        if self.changed and self.mutex.acquire(blocking=False):
+            try:
+                if self.changed:
+                    self.publish()
+            finally:
+                self.mutex.release()
+
+        return self.snapshot
+
     
     def get_link_capacity(self, src_port_ofid, dst_port_ofid):
         """ Return the capacity of the link that tp_ofid is on. """
-        src_node_id = src_port_ofid.rsplit(":", 1)[-2]
-        for neighbor in self.neighbors[src_node_id]:
-            if neighbor["dst_port"] == dst_port_ofid:
-                return neighbor["bps_capacity"]
+        # KeyError if the link is not found
+        return self.links[(src_port_ofid, dst_port_ofid)].bps_capacity
+
+
+    def get_link(self, src_port, dst_port):
+        """
+        Return the edge leaving src_port towards dst_port, or None if there
+        is no such link.
+        """
+        return self.links.get((src_port, dst_port))
+
 
-        # Link not found
-        raise KeyError
+    def record_capacity_changes(self, edges):
+        """ Journal the new capacity of edges (after a bandwidth poll) """
+        for edge in edges:
+            self.journal.record(journal.LINK_CAPACITY,
+                                (edge.src_port, edge.dst_port),
+                                edge.bps_capacity)
+
+
+    def get_port_link(self, src_port):
+        """ Return the edge leaving src_port, or None if the port has none """
+        return self.port_links.get(src_port)
 
 
     def get_node_ids(self):
@@ -178,23 +553,11 @@ class Topology:
                   # file=sys.stderr)
             return
 
-        # Do not add the link if the link already exists
-        for i in range(0, len(self.neighbors[src_node_id])):
-            neighbor_id = self.neighbors[src_node_id][i]["dst_node_id"]
-            if (neighbor_id == dst_node_id and
-                self.neighbors[src_node_id][i]["src_port"] == src_port and
-                self.neighbors[src_node_id][i]["dst_port"] == dst_port):
-                # print("{}: link already exists - exiting".format(fname))
-                return
-
-        # Do not add the link if the link already exists
-        for i in range(0, len(self.neighbors[dst_node_id])):
-            neighbor_id = self.neighbors[dst_node_id][i]["dst_node_id"]
-            if (neighbor_id == src_node_id and
-                self.neighbors[dst_node_id][i]["src_port"] == dst_port and
-                self.neighbors[dst_node_id][i]["dst_port"] == src_port):
-                # print("{}: link already exists - exiting".format(fname))
-                return
+        # Do not add the link if the link already exists (in either direction)
+        if ((src_port, dst_port) in self.links or
+            (dst_port, src_port) in self.links):
+            # print("{}: link already exists - exiting".format(fname))
+            return
 
         # Derive src/dst interfaces
         # Want to make a version of this function in the Topology class. Not
@@ -203,51 +566,38 @@ class Topology:
         dst_int = self.mgr.get_interface(dst_node_id, dst_port)
             
         # Destination entry in the topology
-        src_entry = {
-            "src_node_id": src_node_id,
-            "dst_node_id": dst_node_id,
-            "src_port": src_port,
-            "dst_port": dst_port,
-            "src_int": src_int,
-            "dst_int": dst_int,
-            "bps_reserved": 0,
-            "bps_current": 0,
-            "bps_capacity": capacity,
-            "cur_bytes_sent": 0,
-            "cur_bytes_recvd": 0,
-            "prev_bytes_sent": 0,
-            "prev_bytes_recvd": 0,
-            "utilization_pct": 0.0
-        }
+        src_entry = Link(src_node_id, dst_node_id, src_port, dst_port,
+                         src_int, dst_int, capacity)
         self.neighbors[src_node_id].append(src_entry)
 
         # Destination entry in the topology
-        dst_entry = {
-            "src_node_id": dst_node_id,
-            "dst_node_id": src_node_id,
-            "src_port": dst_port,
-            "dst_port": src_port,
-            "src_int": dst_int,
-            "dst_int": src_int,
-            "bps_reserved": 0,
-            "bps_current": 0,
-            "bps_capacity": capacity,
-            "cur_bytes_sent": 0,
-            "cur_bytes_recvd": 0,
-            "prev_bytes_sent": 0,
-            "prev_bytes_recvd": 0,
-            "utilization_pct": 0.0
-        }
+        dst_entry = Link(dst_node_id, src_node_id, dst_port, src_port,
+                         dst_int, src_int, capacity)
         self.neighbors[dst_node_id].append(dst_entry)
 
-        # Add the link to self.links if it does not already exist
-        # if ((src_port, dst_port) not in self.links and
-        #     (dst_port, src_port) not in self.links):
-        #     self.links[(src_port, dst_port)] = src_index
-        #     self.links[(dst_port, dst_port)] = dst_index
+        # Index both directions of the link
+        self.__index_edge(src_entry)
+        self.__index_edge(dst_entry)
+        self.journal.record(journal.LINK_ADDED, (src_port, dst_port),
+                            src_entry)
+        self.journal.record(journal.LINK_ADDED, (dst_port, src_port),
+                            dst_entry)
+        self.mark_structure_changed()
         
         self.l += 1
 
+
+    def __index_edge(self, edge):
+        self.links[(edge.src_port, edge.dst_port)] = edge
+        if edge.src_port not in self.port_links:
+            self.port_links[edge.src_port] = edge
+
+
+    def __unindex_edge(self, edge):
+        self.links.pop((edge.src_port, edge.dst_port), None)
+        if self.port_links.get(edge.src_port) is edge:
+            del self.port_links[edge.src_port]
+
         
     # Delete ALL links between 2 nodes
     def del_link(self, src_node_id, dst_node_id):
@@ -257,34 +607,75 @@ class Topology:
                   # file=sys.stderr)
             return
 
-        # Del src -> dst edge in graph (+ grab node info)
-        for i in range(0, len(self.neighbors[src_node_id])):
-            if self.neighbors[src_node_id][i]["dst_node_id"] == dst_node_id:
-                # Grab port information to remove entry from self.links
-                src_port = self.neighbors[src_node_id][i]["src_port"]
-                dst_port = self.neighbors[src_node_id][i]["dst_port"]
-                
-                # Remove neighbor entry
-                self.neighbors[src_node_id].pop(i)
-
-        # Del dst -> src edge in graph
-        for i in range(0, len(self.neighbors[dst_node_id])):
-            if self.neighbors[dst_node_id][i]["dst_node_id"] == src_node_id:
-                # Remove neighbor entry
-                self.neighbors[dst_node_id].pop(i)
-
-        # Use port info to delete entry in links
-        # if (src_port, dst_port) in self.links:
-        #     del self.links[(src_port, dst_port)]
-        # elif (dst_port, src_port) in self.links:
-        #     del self.links[(dst_port, src_port)]
-        # else:
-        #     fname = sys._getframe().f_code.co_name
-        #     #print("{}: ERROR removing entry from self.links".format(fname),
-        #           file=sys.stderr)
+        # Del src -> dst edges in graph
+        # (Build new lists - popping while iterating skips entries)
+        num_removed = 0
+        kept = []
+        for edge in self.neighbors[src_node_id]:
+            if edge.dst_node_id == dst_node_id:
+                self.__unindex_edge(edge)
+                self.__record_link_removed(edge)
+                num_removed += 1
+            else:
+                kept.append(edge)
+        self.neighbors[src_node_id] = kept
+
+        # Del dst -> src edges in graph
+        kept = []
+        for edge in self.neighbors[dst_node_id]:
+            if edge.dst_node_id == src_node_id:
+                self.__unindex_edge(edge)
+                self.__record_link_removed(edge)
+            else:
+                kept.append(edge)
+        self.neighbors[dst_node_id] = kept
+
+        # The index may have pointed a port at one of the removed edges while
+        # the port has other edges left - re-point it
+        for edge in self.neighbors[src_node_id] + self.neighbors[dst_node_id]:
+            if edge.src_port not in self.port_links:
+                self.port_links[edge.src_port] = edge
 
         # Adjust link counter
+        self.l -= num_removed
+        if num_removed != 0:
+            self.mark_structure_changed()
+
+
+    def remove_link(self, src_port, dst_port):
+        """
+        Delete the link between two ports (both directions), leaving other
+        links between the same nodes alone. Its reservations go with it.
+        """
+        edge = self.links.get((src_port, dst_port))
+        if edge is None:
+            return
+
+        reverse = self.links.get((dst_port, src_port))
+        for cur_edge in (edge, reverse):
+            if cur_edge is None:
+                continue
+            node_edges = self.neighbors[cur_edge.src_node_id]
+            node_edges.remove(cur_edge)
+            self.__unindex_edge(cur_edge)
+            self.__record_link_removed(cur_edge)
+
+            # Re-point the port index if the port has other edges left
+            if cur_edge.src_port not in self.port_links:
+                for other in node_edges:
+                    if other.src_port == cur_edge.src_port:
+                        self.port_links[other.src_port] = other
+                        break
+
         self.l -= 1
+        self.mark_structure_changed()
+
+
+    def __record_link_removed(self, edge):
+        self.journal.record(journal.LINK_REMOVED,
+                            (edge.src_port, edge.dst_port), edge)
+        self.__drop_reservation_lock(
+            self.__link_lock_key(edge.src_port, edge.dst_port))
 
         
     def add_link_reservation(self, node_id, tp_ofid, value):
@@ -293,24 +684,23 @@ class Topology:
         To reduce a reservation: just add a negative value.
         """
 
-        try:
-            # Look for the port
-            port = None
-            for edge in self.neighbors[node_id]:
-                if edge["src_port"] == tp_ofid:
-                    port = edge
-                    break
-
-            # Stop if the port is down
-            if port is None:
-                # fname = sys._getframe().f_code.co_name
-                # print("{}: Port {} not found. Exiting.".format(fname, tp_ofid))
-                return
+        # Look for the port
+        port = self.port_links.get(tp_ofid)
 
-            # Adjust the link reservation amount
-            port["bps_reserved"] += value
-        except KeyError:
-            pass
+        # Stop if the port is down (or not on node_id)
+        if port is None or port.src_node_id != node_id:
+            # fname = sys._getframe().f_code.co_name
+            # print("{}: Port {} not found. Exiting.".format(fname, tp_ofid))
+            return
+
+        # Adjust the link reservation amount
+        locks = self.__acquire_locks(
+            [self.__link_lock_key(port.src_port, port.dst_port)])
+        port.bps_reserved += value
+        self.journal.record(journal.LINK_RESERVATION,
+                            (port.src_port, port.dst_port), value)
+        self.mark_changed()
+        self.__release_locks(locks)
 
 
     def set_link_reservation(self, tp_ofid, value):
@@ -319,24 +709,22 @@ class Topology:
         To reduce a reservation: just add a negative value.
         """
 
-        try:
-            # Get the node_id that the port is on
-            node_id = tp_ofid.rsplit(":", 1)[-2]
-
-            # Look for the port
-            port = None
-            for edge in self.neighbors[node_id]:
-                if edge["src_port"] == tp_ofid:
-                    port = edge
+        # Look for the port
+        port = self.port_links.get(tp_ofid)
 
-            # Stop if the port is down
-            if port is None:
-                return
+        # Stop if the port is down
+        if port is None:
+            return
 
-            # Adjust the link reservation amount
-            port["bps_reserved"] = value
-        except KeyError:
-            pass
+        # Adjust the link reservation amount
+        locks = self.__acquire_locks(
+            [self.__link_lock_key(port.src_port, port.dst_port)])
+        delta = value - port.bps_reserved
+        port.bps_reserved = value
+        self.journal.record(journal.LINK_RESERVATION,
+                            (port.src_port, port.dst_port), delta)
+        self.mark_changed()
+        self.__release_locks(locks)
         
         
     # n should be a node queried from odl.get_topologies()["node"]
@@ -365,28 +753,42 @@ class Topology:
                 
             # Need to differentiate between fog and edge here
             # Why? We only want fog CPU utilization, etc.  
-            self.nodes[node_id] = new_node
-            self.neighbors[node_id] = [] # list of dicts
-            self.node_ids.add(node_id)
-            self.n += 1
+            self.__insert_node(node_id, new_node)
         except BaseException:
             fname = sys._getframe().f_code.co_name
             #print("{}: Something went wrong - can't add node {}".
                   # format(fname, node["node-id"]), file=sys.stderr)
             return
 
+
+    def __insert_node(self, node_id, new_node):
+        self.nodes[node_id] = new_node
+        self.neighbors[node_id] = [] # list of Links
+        self.node_ids.add(node_id)
+        self.__index_node(node_id, new_node)
+        self.journal.record(journal.NODE_ADDED, node_id, new_node)
+        self.mark_structure_changed()
+        self.n += 1
+
         
     # Delete the node with id=node_id
     def del_node(self, node_id):
         try:
             # Delete in+outgoing links
-            for dst_node_id in self.neighbors[node_id]:
+            dst_node_ids = set([])
+            for edge in self.neighbors[node_id]:
+                dst_node_ids.add(edge.dst_node_id)
+            for dst_node_id in dst_node_ids:
                 self.del_link(node_id, dst_node_id)
 
             # Delete node
-            del self.nodes[node_id]
+            node = self.nodes.pop(node_id)
             del self.neighbors[node_id]
             self.node_ids.remove(node_id)
+            self.__unindex_node(node_id)
+            self.journal.record(journal.NODE_REMOVED, node_id, node)
+            self.__drop_reservation_lock(("fog", node_id))
+            self.mark_structure_changed()
 
             # Adjust node counter
             self.n -= 1
@@ -398,52 +800,133 @@ class Topology:
             return
         
 
+    def update_node(self, node):
+        """
+        Refresh an existing node from new ODL data (same format as
+        add_node()). Hosts keep their role (Edge/FogNode), but may have a new
+        IP address or attachment point.
+        """
+        cur_node = self.nodes.get(node["node-id"])
+        if not isinstance(cur_node, HostNode):
+            return
+
+        try:
+            ip_addr = node["host-tracker-service:addresses"][0]["ip"]
+            attachment_point = node["host-tracker-service:attachment-points"][0]["tp-id"]
+        except (KeyError, IndexError):
+            return
+        ovs_node_id, ovs_port = attachment_point.rsplit(":", 1)
+
+        if (cur_node.ip_addr != ip_addr or
+            cur_node.ovs_node_id != ovs_node_id or
+            cur_node.ovs_port != ovs_port):
+            cur_node.ip_addr = ip_addr
+            cur_node.ovs_node_id = ovs_node_id
+            cur_node.ovs_port = ovs_port
+            self.mark_changed()
+
+
+    def replace_node(self, node_id, new_node):
+        """
+        Replace the node object of an existing node, keeping its links.
+        Use this (not self.nodes[node_id] = ...) when a node changes role,
+        e.g. a HostNode becoming a FogNode/EdgeNode after greeting the FDK.
+        """
+        # KeyError if the node is not in the topology
+        self.nodes[node_id]
+
+        self.__unindex_node(node_id)
+        self.nodes[node_id] = new_node
+        self.__index_node(node_id, new_node)
+        self.journal.record(journal.NODE_ROLE_CHANGED, node_id, new_node)
+        self.mark_changed()
+
+
+    def __index_node(self, node_id, node):
+        if isinstance(node, OVSNode):
+            self.switch_ids[node_id] = None
+        if isinstance(node, HostNode):
+            self.host_ids[node_id] = None
+        if isinstance(node, EdgeNode):
+            self.edge_ids[node_id] = None
+        if isinstance(node, FogNode):
+            self.fog_ids[node_id] = None
+
+
+    def __unindex_node(self, node_id):
+        self.switch_ids.pop(node_id, None)
+        self.host_ids.pop(node_id, None)
+        self.edge_ids.pop(node_id, None)
+        self.fog_ids.pop(node_id, None)
+
+
+    def get_state(self):
+        """
+        Return the nodes, links and link reservations of the topology as
+        plain picklable data, for load_state() (see warm_restart.py).
+        Call with the mutex held.
+        """
+        links = []
+        seen = set([])
+        for edge in self.links.values():
+            if (edge.dst_port, edge.src_port) in seen:
+                continue
+            seen.add((edge.src_port, edge.dst_port))
+            reverse = self.links[(edge.dst_port, edge.src_port)]
+            links.append((edge.src_node_id, edge.dst_node_id, edge.src_port,
+                          edge.dst_port, edge.bps_capacity,
+                          edge.bps_reserved, reverse.bps_reserved))
+
+        return {
+            "nodes": list(self.nodes.values()),
+            "links": links
+        }
+
+
+    def load_state(self, state):
+        """
+        Add the nodes and links of a get_state() result to the topology,
+        with their reservations. Call with the mutex held.
+        """
+        for node in state["nodes"]:
+            if node.node_id not in self.nodes:
+                self.__insert_node(node.node_id, node)
+
+        for (src_node_id, dst_node_id, src_port, dst_port, capacity,
+             src_reserved, dst_reserved) in state["links"]:
+            self.add_link(src_node_id, dst_node_id, src_port, dst_port,
+                          capacity)
+            for key, reserved in (((src_port, dst_port), src_reserved),
+                                  ((dst_port, src_port), dst_reserved)):
+                edge = self.links.get(key)
+                if edge is not None and reserved != edge.bps_reserved:
+                    self.journal.record(journal.LINK_RESERVATION, key,
+                                        reserved - edge.bps_reserved)
+                    edge.bps_reserved = reserved
+
+
     def get_node(self, node_ofid):
         return self.nodes[node_ofid]
     
         
     def get_switch_ids(self):
         """ Return a list of OpenVSwitch node ids in this Topology. """
-        switch_ids = []
-        
-        for node_id in self.nodes:
-            if isinstance(self.nodes[node_id], OVSNode):
-                switch_ids.append(node_id)
-
-        return switch_ids
+        return list(self.switch_ids)
 
     
     def get_host_ids(self):
         """ Return a list of Edge/Fog node id's in this Topology """
-        host_ids = []
-        
-        for node_id in self.nodes:
-            if (isinstance(self.nodes[node_id], HostNode)):
-                host_ids.append(node_id)
-                
-        return host_ids
+        return list(self.host_ids)
 
     
     def get_edge_ids(self):
         """ Return a list of EdgeNode id's in this Topology """
-        edge_ids = []
-        
-        for node_id in self.nodes:
-            if (isinstance(self.nodes[node_id], EdgeNode)):
-                edge_ids.append(node_id)
-                
-        return edge_ids
+        return list(self.edge_ids)
 
     
     def get_fog_ids(self):
         """ Return a list of FogNode id's in this Topology """
-        fog_ids = []
-        
-        for node_id in self.nodes:
-            if (isinstance(self.nodes[node_id], FogNode)):
-                fog_ids.append(node_id)
-
-        return fog_ids
+        return list(self.fog_ids)
 
     
 class HostNode:
@@ -582,6 +1065,10 @@ class OVSNode:
         # Stores port information from opendaylight-inventory API
         self.node_connector_data = {} 
 
+        # Port speeds in bps, kept up to date by set_node_connector_data()
+        # (port ofid -> bps)
+        self.port_speeds = {}
+
         # Store the data used in the HTTP bodies for the link allocation API's
         self.qos_dict = {} # qos json
         self.queue_dict = {} # queues json
@@ -720,11 +1207,31 @@ class OVSNode:
 
 
     def set_node_connector_data(self, port_ofid, stats):
+        """
+        Save the inventory data of a port. Returns True if the speed of the
+        port changed (or the port is new).
+        """
         self.node_connector_data[port_ofid] = stats
 
+        try:
+            speed = stats["flow-node-inventory:current-speed"] #kbps
+        except KeyError:
+            return self.port_speeds.pop(port_ofid, None) is not None
+
+        # For VMs reporting 0 bandwidth speed, assign 1Gbps
+        if speed == 0:
+            speed = 1000000
+
+        bps = speed * 1000
+        if self.port_speeds.get(port_ofid) == bps:
+            return False
+        self.port_speeds[port_ofid] = bps
+        return True
+
         
     def del_node_connector_data(self, port_ofid):
         del self.node_connector_data[port_ofid]
+        self.port_speeds.pop(port_ofid, None)
 
 
     # ==========================================================================
@@ -765,18 +1272,16 @@ class OVSNode:
 
     
     def get_port_speed(self, port_ofid):
-        try:
-            port = self.get_node_connector_data(port_ofid)
-            speed = port["flow-node-inventory:current-speed"]
-
-            # For VMs reporting 0 bandwidth speed, assign 1Gbps
-            if speed == 0:
-                speed = 1000000
-                
-        except KeyError:
+        """ Return the speed of a port in kbps (None if unknown) """
+        bps = self.port_speeds.get(port_ofid)
+        if bps is None:
             return None
-        
-        return speed
+        return bps // 1000
+
+
+    def get_port_bps(self, port_ofid):
+        """ Return the speed of a port in bps (None if unknown) """
+        return self.port_speeds.get(port_ofid)
     
     
     def get_qos_max_rate(self, qos_id):
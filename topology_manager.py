@@ -7,13 +7,16 @@
 # 
 # In the Internet of Things Research Lab, Santa Clara University, CA, USA
 
+import confirmation
 import fdk
 import topology
 import manager
+import restconf
 
+import concurrent.futures
 import copy
+import hashlib
 import json
-import requests as req
 import selectors
 import socket
 import sys
@@ -37,9 +40,10 @@ class TopologyManager(manager.Manager):
     """
     
     def __init__(self, mgrs, head, ctrlr_ip_addr="localhost",
-                 open_link_capacity=100000000):
+                 open_link_capacity=100000000, restconf_client=None,
+                 compact_parse=False):
         # Call Manager constructor
-        super().__init__(mgrs, head, ctrlr_ip_addr)
+        super().__init__(mgrs, head, ctrlr_ip_addr, restconf_client)
 
         # A number which is the reserved bandwidth on all links for any
         # free-flowing traffic. Example: For 1Gbps links, you might set this to
@@ -56,14 +60,41 @@ class TopologyManager(manager.Manager):
         self.ofid_to_ovsdbid = {}
         self.ovsdbid_to_ofid = {}
 
+        # If True, parts of the network-topology and opendaylight-inventory
+        # documents which the FDK never reads are dropped while parsing (see
+        # restconf.loads_compact). Keeps memory flat on big fabrics.
+        self.compact_parse = compact_parse
+
         # Init and update topology data
         self.network_topology = None
         self.opendaylight_inventory = None
 
+        # Map of port OF id's to interface names (e.g. "openflow:1:2" -> "eth2")
+        # Filled from the inventory so that new links need no extra requests
+        self.interfaces = {}
+
+        # Digests of the raw network-topology and opendaylight-inventory
+        # documents currently parsed into the attributes above
+        self.network_topology_digest = None
+        self.opendaylight_inventory_digest = None
+
+        # Fingerprint of the inventory fields update_topology() reads.
+        # Port statistics change on every poll, the fields below do not.
+        self.opendaylight_inventory_fingerprint = None
+
+        # Digests of the documents and sub-documents (topologies, nodes,
+        # link lists) last processed successfully by update_topology().
+        # Unchanged sub-documents are not processed again.
+        self.processed_digests = {}
+
         # Greetings which must still be serviced.
         # Greetings remain unserviced when a device greets the FDK but has not
         # been discovered by ODL
         self.unserviced_greetings = {}
+
+        # Confirms queue/QoS/port changes against the operational data store
+        # (see the Bandwidth Allocation / QoS / Queue API below)
+        self.confirmer = confirmation.OperationalConfirmer(self)
         
         # Init functions (Moved outside of Constructor - should be called after
         # FlowManager is initialized
@@ -74,8 +105,8 @@ class TopologyManager(manager.Manager):
         # #print(json.dumps(self.network_topology, indent=3))
 
 
-    def shutdown(self):
-        super(TopologyManager, self).shutdown()
+    def shutdown(self, warm=False):
+        super(TopologyManager, self).shutdown(warm)
 
         # Release any held mutexes
         for top_id in self.tops:
@@ -86,7 +117,8 @@ class TopologyManager(manager.Manager):
                 # Already unlocked - do nothing
                 pass
 
-        self.shutdown_link_qos()
+        if not warm:
+            self.shutdown_link_qos()
 
         for top_id in self.tops:
             # Attempt to close any open sockets
@@ -123,15 +155,15 @@ class TopologyManager(manager.Manager):
     def query_network_topology(self):
         """ Get all topology information from ODL """
         # URL to grab entire topology
-        url = ("http://{}:8181/restconf/operational/"
-               "network-topology:network-topology/").format(self.ctrlr_ip_addr)
+        url = "operational/network-topology:network-topology/"
 
         # Make the request
-        resp = req.get(url, auth=("admin", "admin"), headers=self.head)
+        resp = self.restconf.get(url)
 
         # Parse and get topology
-        network_topology = resp.json()["network-topology"]["topology"]
+        network_topology = self.parse_network_topology(resp.content)
         self.update_network_topology(network_topology)
+        self.network_topology_digest = None
         
         return self.network_topology
 
@@ -141,27 +173,55 @@ class TopologyManager(manager.Manager):
 
 
     def query_network_topology_node(self, top_id, node_id):
-        url = ("http://{}:8181/restconf/operational/".format(self.ctrlr_ip_addr) +
-               "network-topology:network-topology/topology/{}/".format(top_id) +
+        url = ("operational/network-topology:network-topology/" +
+               "topology/{}/".format(top_id) +
                "node/{}".format(node_id.replace("/", "%2F")))
 
-        resp = req.get(url, auth=("admin", "admin"), headers=self.head)
+        resp = self.restconf.get(url)
         data = resp.json()["node"][0] # check node array, only 1 elem
         return data
 
 
+    def query_network_topology_nodes(self, keys):
+        """
+        Read several network-topology nodes at once (in parallel).
+        keys is a list of (top_id, node_id) tuples. Returns a dict mapping
+        each key to the node data, or to None if the node could not be read.
+        """
+        urls = []
+        for top_id, node_id in keys:
+            urls.append("operational/network-topology:network-topology/" +
+                        "topology/{}/".format(top_id) +
+                        "node/{}".format(node_id.replace("/", "%2F")))
+
+        resps = self.restconf.get_all(urls)
+
+        node_data = {}
+        for key, resp in zip(keys, resps):
+            try:
+                node_data[key] = resp.json()["node"][0]
+            except Exception:
+                # Failed request or node not (yet) in the data store
+                node_data[key] = None
+
+        return node_data
+
+
     def get_network_topology(self):
         return self.network_topology
 
     
     def query_opendaylight_inventory(self):
         # Create URL
-        url = ("http://{}:8181/restconf/".format(self.ctrlr_ip_addr) +
-               "operational/opendaylight-inventory:nodes/")
+        url = "operational/opendaylight-inventory:nodes/"
 
         # Issue and parse the request
-        resp = req.get(url, auth=("admin", "admin"), headers=self.head)
-        self.opendaylight_inventory = resp.json()["nodes"]["node"]
+        resp = self.restconf.get(url)
+        self.opendaylight_inventory = self.parse_opendaylight_inventory(
+            resp.content)
+        self.opendaylight_inventory_digest = None
+        self.opendaylight_inventory_fingerprint = None
+        self.update_interface_cache(self.opendaylight_inventory)
 
         return self.opendaylight_inventory
 
@@ -170,6 +230,142 @@ class TopologyManager(manager.Manager):
         return self.opendaylight_inventory
 
 
+    def query_topology_and_inventory(self):
+        """
+        Get the network-topology and opendaylight-inventory data from ODL.
+        Both documents are requested in parallel (1 round-trip instead of 2).
+        A document is only parsed again if its raw bytes changed.
+        """
+        urls = ["operational/network-topology:network-topology/",
+                "operational/opendaylight-inventory:nodes/"]
+        top_resp, inv_resp = self.restconf.get_all(urls)
+
+        # Failed requests come back as exceptions - surface them to the caller
+        for resp in (top_resp, inv_resp):
+            if isinstance(resp, Exception):
+                raise resp
+
+        top_digest = self.digest_bytes(top_resp.content)
+        if top_digest != self.network_topology_digest:
+            network_topology = self.parse_network_topology(top_resp.content)
+            self.update_network_topology(network_topology)
+            self.network_topology_digest = top_digest
+
+        inv_digest = self.digest_bytes(inv_resp.content)
+        if inv_digest != self.opendaylight_inventory_digest:
+            self.opendaylight_inventory = self.parse_opendaylight_inventory(
+                inv_resp.content)
+            self.opendaylight_inventory_digest = inv_digest
+            self.opendaylight_inventory_fingerprint = self.digest_bytes(
+                b"".join(self.inventory_node_digest(node)
+                         for node in self.opendaylight_inventory))
+            self.update_interface_cache(self.opendaylight_inventory)
+
+        return self.network_topology, self.opendaylight_inventory
+
+
+    def parse_network_topology(self, content):
+        """ Parse a raw network-topology document into its topology list """
+        if self.compact_parse:
+            data = restconf.loads_compact(content,
+                                          restconf.NETWORK_TOPOLOGY_UNUSED_KEYS)
+        else:
+            data = json.loads(content)
+        return data["network-topology"]["topology"]
+
+
+    def parse_opendaylight_inventory(self, content):
+        """ Parse a raw opendaylight-inventory document into its node list """
+        if self.compact_parse:
+            data = restconf.loads_compact(content,
+                                          restconf.INVENTORY_UNUSED_KEYS)
+        else:
+            data = json.loads(content)
+        return data["nodes"]["node"]
+
+
+    def digest_bytes(self, data):
+        """ Return a short fingerprint of a bytes object """
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+
+    def digest_data(self, data):
+        """ Return a short fingerprint of parsed JSON data """
+        return self.digest_bytes(
+            json.dumps(data, separators=(",", ":")).encode())
+
+
+    def inventory_node_digest(self, node):
+        """
+        Return a short fingerprint of an opendaylight-inventory node.
+        Only the node-connector fields update_topology() reads are included;
+        port statistics and flow tables are left out.
+        """
+        ports = []
+        for port in node.get("node-connector", []):
+            ports.append((port.get("id"),
+                          port.get("flow-node-inventory:name"),
+                          port.get("flow-node-inventory:current-speed")))
+        return self.digest_data([node["id"], ports])
+
+
+    def __is_unchanged(self, key, digest, seen):
+        """
+        Return True if the sub-document identified by key was already
+        processed with the same digest. Every digest checked during a pass of
+        update_topology() is recorded in seen.
+        """
+        seen[key] = digest
+        return self.processed_digests.get(key) == digest
+
+
+    def __remove_vanished_links(self, cur_top, fresh_links):
+        """
+        Delete the links of cur_top which are not in fresh_links (the
+        (src_port, dst_port) tuples of the latest ODL link list, in either
+        direction). Call with the topology mutex held.
+        """
+        vanished = []
+        for src_port, dst_port in cur_top.links:
+            if ((src_port, dst_port) not in fresh_links and
+                (dst_port, src_port) not in fresh_links):
+                vanished.append((src_port, dst_port))
+
+        # Both directions are in cur_top.links - the 2nd one is already gone
+        for src_port, dst_port in vanished:
+            cur_top.remove_link(src_port, dst_port)
+
+
+    def __remove_vanished_node(self, top_id, node_id):
+        """
+        Delete a node which is gone from ODL, with its links. Hosts with
+        allocated resources are kept (e.g. an idle host aged out by the host
+        tracker still runs its service) until they are deallocated.
+        Returns False if the node was kept.
+        """
+        try:
+            cur_top = self.tops[top_id]
+        except KeyError:
+            return True
+
+        res_mgr = self.mgrs.get("res")
+        if res_mgr is not None and res_mgr.has_allocations(node_id):
+            return False
+
+        cur_top.acquire_mutex(sys._getframe().f_code.co_name)
+        cur_top.del_node(node_id)
+        cur_top.release_mutex(sys._getframe().f_code.co_name)
+
+        # Forget switch mappings and flows of a switch
+        if self.switchid_to_oftopid.get(node_id) == top_id:
+            del self.switchid_to_oftopid[node_id]
+            ovsdb_id = self.ofid_to_ovsdbid.pop(node_id, None)
+            self.ovsdbid_to_ofid.pop(ovsdb_id, None)
+            self.mgrs["flow"].flows.pop(node_id, None)
+
+        return True
+
+
     def start_topology_update_thread(self, interval=1.0):
         """ Spin off a thread that will repeatedly query ODL for changes to the
         topology and update the topologies in TopologyManager accordingly """
@@ -204,13 +400,30 @@ class TopologyManager(manager.Manager):
 
     def update_topology(self):
         """
-        Grab new information and update all topology objects
+        Grab new information and update all topology objects.
+        Every topology, node and link list is fingerprinted, and only the
+        parts which changed since the last successful update are processed.
         """
         
-        # Query network-topology and OVSDB API
+        # Query network-topology and opendaylight-inventory API's (in parallel)
         # Update according to network-topology data returned
         # Contains nodes, links, etc.
-        self.query_network_topology()
+        self.query_topology_and_inventory()
+
+        # Nothing at all changed - nothing to do
+        top_doc_digest = self.network_topology_digest
+        inv_doc_digest = self.opendaylight_inventory_fingerprint
+        if (top_doc_digest is not None and inv_doc_digest is not None and
+            self.processed_digests.get("network-topology") == top_doc_digest and
+            self.processed_digests.get("inventory") == inv_doc_digest):
+            return
+
+        # Digests of all sub-documents in this pass
+        seen = {}
+
+        # Digests are only recorded once their sub-document is processed, so
+        # anything that fails part-way is processed again on the next pass
+        done = {}
 
         # Go through all OF topologies
         for top in self.network_topology:
@@ -229,12 +442,22 @@ class TopologyManager(manager.Manager):
                 cur_top.acquire_mutex(sys._getframe().f_code.co_name)
                 for node_data in top["node"]:
                     node_id = node_data["node-id"]
-                    cur_top.add_node(node_data)
+                    key = ("node", top_id, node_id)
+                    digest = self.digest_data(node_data)
+                    if self.__is_unchanged(key, digest, seen):
+                        continue
+
+                    if node_id in cur_top.nodes:
+                        cur_top.update_node(node_data)
+                    else:
+                        cur_top.add_node(node_data)
 
                     # Construct switch-to-topology id mapping
                     if isinstance(cur_top.get_node(node_id), topology.OVSNode):
                         self.switchid_to_oftopid[node_id] = top_id
 
+                    done[key] = digest
+
                 # # Initialize ARP flows on new switches
                 # for node_id in cur_top.get_switch_ids():
                 #     flow_mgr = self.mgrs["flow"]
@@ -247,15 +470,19 @@ class TopologyManager(manager.Manager):
                     
                 cur_top.release_mutex(sys._getframe().f_code.co_name)
                     
-                # Check that links exist before attempting to add them
-                # For tops w/ 1 switch, a KeyError is raised so this is important
-                try:
-                    top["link"]
-                except KeyError:
-                    return
+                # Tops w/ 1 switch have no link list at all
+                links = top.get("link", [])
+
+                # Skip the links if none of them changed
+                key = ("links", top_id)
+                digest = self.digest_data(links)
+                if self.__is_unchanged(key, digest, seen):
+                    continue
 
                 # Connect the nodes by checking link information
-                for link in top["link"]:
+                # (and collect the links ODL still has)
+                fresh_links = set([])
+                for link in links:
                     # src info
                     src_node_id = link["source"]["source-node"]
                     src_is_switch = src_node_id.startswith("openflow")
@@ -279,31 +506,54 @@ class TopologyManager(manager.Manager):
                     cur_top.acquire_mutex(sys._getframe().f_code.co_name)
                     cur_top.add_link(src_node_id, dst_node_id, src_port, dst_port)
                     cur_top.release_mutex(sys._getframe().f_code.co_name)
+                    fresh_links.add((src_port, dst_port))
+
+                # Remove links which are gone from ODL
+                cur_top.acquire_mutex(sys._getframe().f_code.co_name)
+                self.__remove_vanished_links(cur_top, fresh_links)
+                cur_top.release_mutex(sys._getframe().f_code.co_name)
+
+                done[key] = digest
                     
-        # Query opendaylight-inventory:nodes API and update topologies
-        # Contains information on OVSNode ports and flows
-        self.query_opendaylight_inventory()
+        # Update topologies with the opendaylight-inventory:nodes data
+        # (fetched above). Contains information on OVSNode ports and flows
         
         # Go through nodes
         for node in self.opendaylight_inventory:
             node_id = node["id"]
-            top_id = self.switchid_to_oftopid[node_id]
+            key = ("inventory", node_id)
+            digest = self.inventory_node_digest(node)
+            if self.__is_unchanged(key, digest, seen):
+                continue
+
+            # Switches not (or no longer) in a topology are retried next pass
+            try:
+                top_id = self.switchid_to_oftopid[node_id]
+            except KeyError:
+                continue
             cur_top = self.tops[top_id]
             cur_node = cur_top.get_node(node_id)
 
             cur_top.acquire_mutex(sys._getframe().f_code.co_name)
+            speeds_changed = False
             for port in node["node-connector"]:
                 # Save the node connector data
                 port_ofid = port["id"]
                 if port_ofid.endswith("LOCAL"):
                     continue
                 
-                cur_node.set_node_connector_data(port_ofid, port)
+                if cur_node.set_node_connector_data(port_ofid, port):
+                    speeds_changed = True
 
                 # Relate the port name to the port ofid in the switch
                 port_name = port["flow-node-inventory:name"]
                 cur_node.set_portname_to_portofid(port_name, port_ofid)
+            # Only re-read the port speeds of the links if one changed
+            if speeds_changed:
+                cur_top.link_stats.invalidate_speeds()
             cur_top.release_mutex(sys._getframe().f_code.co_name)
+
+            done[key] = digest
                 
         # Go through OVSDB topologies AFTER OF topologies
         for top in self.network_topology:
@@ -311,6 +561,11 @@ class TopologyManager(manager.Manager):
             if top_id.startswith("ovsdb"):
                 # Go through nodes in ovsdb topology
                 for node in top["node"]:
+                    key = ("ovsdb", top_id, node["node-id"])
+                    digest = self.digest_data(node)
+                    if self.__is_unchanged(key, digest, seen):
+                        continue
+
                     # Only consider bridges (OVSNodes)
                     try:
                         # 1-to-1 correspondence between bridge MACs AND OVSNodes
@@ -321,6 +576,7 @@ class TopologyManager(manager.Manager):
                         ovsdb_id = node["node-id"].rsplit("/", 2)[-3]
                         tp_info = node["termination-point"]
                     except KeyError:
+                        done[key] = digest
                         continue
                     
                     # Each bridge is represented as a node in the openflow topology
@@ -333,6 +589,7 @@ class TopologyManager(manager.Manager):
 
                     # Update the node with the appropriate information
                     # Can cause KeyError if manager is set but ctrlr isnt
+                    # (not marked as done - retried on the next pass)
                     try: 
                         cur_node = cur_top.nodes[node_id]
                     except KeyError:
@@ -350,6 +607,7 @@ class TopologyManager(manager.Manager):
                     cur_node.br_mac = br_mac
 
                     new_tp = False
+                    complete = True
                     for tp in tp_info:
                         ##print(tp)
                         # Skip bridges and other non-default ports
@@ -367,6 +625,8 @@ class TopologyManager(manager.Manager):
 
                             if tp_stats is None:
                                 # #print("TPOFPORT NOT FOUND ")
+                                # Inventory not there yet - retry next pass
+                                complete = False
                                 continue
 
                             tp_ofid = tp_stats["id"]
@@ -398,6 +658,25 @@ class TopologyManager(manager.Manager):
                     # But may assist keeping data consistent between threads
                     cur_top.release_mutex(sys._getframe().f_code.co_name)
 
+                    if complete:
+                        done[key] = digest
+
+        # Record what was processed, and forget sub-documents which are gone.
+        # Nodes whose sub-documents are gone were removed from ODL.
+        self.processed_digests.update(done)
+        for key in list(self.processed_digests):
+            if key not in seen:
+                if isinstance(key, tuple) and key[0] == "node":
+                    # Nodes still in use are retried on the next pass
+                    if not self.__remove_vanished_node(key[1], key[2]):
+                        continue
+                del self.processed_digests[key]
+
+        # Whole documents only count as processed if every part of them was
+        if all(self.processed_digests.get(key) == seen[key] for key in seen):
+            self.processed_digests["network-topology"] = top_doc_digest
+            self.processed_digests["inventory"] = inv_doc_digest
+
                     
 
 # ==============================================================================
@@ -561,9 +840,11 @@ class TopologyManager(manager.Manager):
 
         # Update node in the topology
         if host_type == "Fog":
-            cur_top.nodes[node_id] = cur_top.nodes[node_id].create_fog_node()
+            cur_top.replace_node(node_id,
+                                 cur_top.nodes[node_id].create_fog_node())
         elif host_type == "Edge":
-            cur_top.nodes[node_id] = cur_top.nodes[node_id].create_edge_node()
+            cur_top.replace_node(node_id,
+                                 cur_top.nodes[node_id].create_edge_node())
         else:
             # Bad greeting
             return False
@@ -648,6 +929,11 @@ class TopologyManager(manager.Manager):
         ovsdb_id = cur_node.ovsdb_id
         op_node_data = self.query_network_topology_node(ovsdb_top_id, ovsdb_id)
 
+        return self.__is_queue_in_data(op_node_data, q_id)
+
+
+    def __is_queue_in_data(self, op_node_data, q_id):
+        """ is_queue_operational() on already queried OVSDB node data """
         try:
             queues = op_node_data["ovsdb:queues"]
         except KeyError:
@@ -673,6 +959,11 @@ class TopologyManager(manager.Manager):
         ovsdb_id = cur_node.ovsdb_id
         op_node_data = self.query_network_topology_node(ovsdb_top_id, ovsdb_id)
 
+        return self.__is_qos_in_data(op_node_data, qos_id)
+
+
+    def __is_qos_in_data(self, op_node_data, qos_id):
+        """ is_qos_operational() on already queried OVSDB node data """
         try:
             qoses = op_node_data["ovsdb:qos-entries"]
         except KeyError:
@@ -700,6 +991,11 @@ class TopologyManager(manager.Manager):
         ovsdb_id = cur_node.ovsdb_id
         op_node_data = self.query_network_topology_node(ovsdb_top_id, ovsdb_id)
 
+        return self.__is_queue_on_qos_in_data(op_node_data, q_id, qos_id)
+
+
+    def __is_queue_on_qos_in_data(self, op_node_data, q_id, qos_id):
+        """ is_queue_on_qos() on already queried OVSDB node data """
         try:
             qoses = op_node_data["ovsdb:qos-entries"]
         except KeyError:
@@ -738,7 +1034,12 @@ class TopologyManager(manager.Manager):
         ovsdb_top_id = cur_node.ovsdb_top_id
         br_ovsdb_id = cur_node.br_ovsdb_id
         op_node_data = self.query_network_topology_node(ovsdb_top_id, br_ovsdb_id)
-        
+
+        return self.__is_qos_on_tp_in_data(cur_node, op_node_data, tp_ofid)
+
+
+    def __is_qos_on_tp_in_data(self, cur_node, op_node_data, tp_ofid):
+        """ is_qos_on_tp() on already queried OVSDB bridge data """
         try:
             tps = op_node_data["termination-point"]
         except KeyError:
@@ -811,25 +1112,28 @@ class TopologyManager(manager.Manager):
         return queue_dict
 
 
-    def create_queue(self, node_id, q_id, max_rate):
+    def create_queue(self, node_id, q_id, max_rate, wait=True):
         """ 
         Create a queue on the OVSNode with node_id.
-        Check to confirm creation and make repeated requests until the queue is
-        on the node.
+        The queue is tracked on the node once it is operational. With
+        wait=False the confirmation is only registered with self.confirmer,
+        and is done on the next self.confirmer.wait().
         """
 
         # Create the queue
         # print("Creating queue {} on node {}".format(q_id, node_id))
         queue_dict = self.__create_queue(node_id, q_id, max_rate)
-        
-        while True:
-            # Check that the creation is successful
-            # Concurrency ensured here since we wait before adding another queue
-            if self.is_queue_operational(node_id, q_id):
-                cur_node = self.get_ovsnode(node_id)
-                cur_top = self.get_topology(cur_node.get_top_id())
-                cur_node.add_queue(queue_dict)
-                break
+
+        # Check that the creation is successful
+        cur_node = self.get_ovsnode(node_id)
+        self.confirmer.expect(
+            cur_node.ovsdb_top_id, cur_node.ovsdb_id,
+            lambda data: self.__is_queue_in_data(data, q_id),
+            lambda: cur_node.add_queue(queue_dict),
+            "create queue {} on {}".format(q_id, node_id))
+
+        if wait:
+            self.confirmer.wait()
     
 
     def __create_queue(self, node_id, q_id, max_rate):
@@ -852,8 +1156,8 @@ class TopologyManager(manager.Manager):
         ovsdb_id = cur_node.ovsdb_id
 
         # Create URL
-        url = ("http://{}:8181/restconf/config/".format(self.ctrlr_ip_addr) +
-               "network-topology:network-topology/topology/{}/".format(ovsdb_top_id) +
+        url = ("config/network-topology:network-topology/" +
+               "topology/{}/".format(ovsdb_top_id) +
                "node/{}/ovsdb:queues/{}".format(ovsdb_id.replace("/", "%2F"), q_id))
 
         # Create HTTP body data - the payload
@@ -871,26 +1175,29 @@ class TopologyManager(manager.Manager):
             
         
         # Make the request
-        resp = req.put(url, auth=("admin", "admin"),
-                       headers=self.head, data=json.dumps(queue_dict))
+        resp = self.restconf.put(url, json.dumps(queue_dict))
 
         return queue_dict
         
 
-    def delete_queue(self, node_id, q_id):
+    def delete_queue(self, node_id, q_id, wait=True):
         """ Delete a queue on the specified node. It must be an OVSNode. """
 
         # print("Deleting queue {} on node {}".format(q_id, node_id))
         
         # Delete the queue
         self.__delete_queue(node_id, q_id)
-        
-        while True:
-            # Exit once queue is no longer operational
-            if not self.is_queue_operational(node_id, q_id):
-                cur_node = self.get_ovsnode(node_id)
-                cur_node.del_queue(q_id)
-                break
+
+        # Done once queue is no longer operational
+        cur_node = self.get_ovsnode(node_id)
+        self.confirmer.expect(
+            cur_node.ovsdb_top_id, cur_node.ovsdb_id,
+            lambda data: not self.__is_queue_in_data(data, q_id),
+            lambda: cur_node.del_queue(q_id),
+            "delete queue {} on {}".format(q_id, node_id))
+
+        if wait:
+            self.confirmer.wait()
     
     
     def __delete_queue(self, node_id, q_id):
@@ -914,8 +1221,8 @@ class TopologyManager(manager.Manager):
         ovsdb_id = cur_node.ovsdb_id
 
         # Create URL
-        url = ("http://{}:8181/restconf/config/".format(self.ctrlr_ip_addr) +
-               "network-topology:network-topology/topology/{}/".format(ovsdb_top_id) +
+        url = ("config/network-topology:network-topology/" +
+               "topology/{}/".format(ovsdb_top_id) +
                "node/{}/ovsdb:queues/{}".format(ovsdb_id.replace("/", "%2F"), q_id))
 
         # if __debug__:
@@ -924,7 +1231,7 @@ class TopologyManager(manager.Manager):
         #     print("URL: %s" % url)
         
         # Make request
-        resp = req.delete(url, auth=("admin", "admin"), headers=self.head)
+        resp = self.restconf.delete(url)
 
             
     def get_qos_skeleton(self):
@@ -987,7 +1294,8 @@ class TopologyManager(manager.Manager):
         return qos_dict
 
 
-    def create_qos(self, node_id, qos_id, max_rate, qos_dict=None, delete=False):
+    def create_qos(self, node_id, qos_id, max_rate, qos_dict=None, delete=False,
+                   wait=True):
         """ 
         Create a blank QoS.
         Add queues later using the payload generated here.
@@ -997,13 +1305,23 @@ class TopologyManager(manager.Manager):
         # Create the QoS
         temp = self.__create_qos(node_id, qos_id, max_rate, qos_dict)
         qos_dict = temp
-            
-        while True:
-            # Exit if the QoS exists
-            if (not delete and self.is_qos_operational(node_id, qos_id)) or delete:
-                cur_node = self.get_ovsnode(node_id)
-                cur_node.add_qos(qos_dict)
-                break            
+
+        cur_node = self.get_ovsnode(node_id)
+
+        # Nothing to confirm when removing queues from the QoS
+        if delete:
+            cur_node.add_qos(qos_dict)
+            return
+
+        # Done once the QoS exists
+        self.confirmer.expect(
+            cur_node.ovsdb_top_id, cur_node.ovsdb_id,
+            lambda data: self.__is_qos_in_data(data, qos_id),
+            lambda: cur_node.add_qos(qos_dict),
+            "create qos {} on {}".format(qos_id, node_id))
+
+        if wait:
+            self.confirmer.wait()
 
             
     def __create_qos(self, node_id, qos_id, max_rate, qos_dict=None):
@@ -1025,8 +1343,7 @@ class TopologyManager(manager.Manager):
         ovsdb_id = cur_node.ovsdb_id
 
         # Create URL
-        url = ("http://localhost:8181/restconf/config/" +
-               "network-topology:network-topology/" +
+        url = ("config/network-topology:network-topology/" +
                "topology/{}/".format(ovsdb_top_id) +
                "node/{}/".format(ovsdb_id.replace("/", "%2F")) +
                "ovsdb:qos-entries/{}".format(qos_id))
@@ -1061,13 +1378,12 @@ class TopologyManager(manager.Manager):
         #     print("JSON:")
         #     print(json.dumps(qos_dict, indent=4))
 
-        resp = req.put(url, auth=("admin", "admin"),
-                       headers=self.head, data=json.dumps(qos_dict))
+        resp = self.restconf.put(url, json.dumps(qos_dict))
 
         return qos_dict
 
 
-    def delete_qos(self, node_id, qos_id):
+    def delete_qos(self, node_id, qos_id, wait=True):
         """ 
         Delete a QoS. You MUST delete ALL queues on the QoS before this.
         """
@@ -1076,12 +1392,17 @@ class TopologyManager(manager.Manager):
 
         # Delete the qos
         self.__delete_qos(node_id, qos_id)
-        
-        while True:
-            if not self.is_qos_operational(node_id, qos_id):
-                cur_node = self.get_ovsnode(node_id)
-                cur_node.del_qos(qos_id)
-                break
+
+        # Done once the QoS is gone
+        cur_node = self.get_ovsnode(node_id)
+        self.confirmer.expect(
+            cur_node.ovsdb_top_id, cur_node.ovsdb_id,
+            lambda data: not self.__is_qos_in_data(data, qos_id),
+            lambda: cur_node.del_qos(qos_id),
+            "delete qos {} on {}".format(qos_id, node_id))
+
+        if wait:
+            self.confirmer.wait()
             
         
     def __delete_qos(self, node_id, qos_id):
@@ -1116,8 +1437,7 @@ class TopologyManager(manager.Manager):
             
             return
         
-        url = ("http://localhost:8181/restconf/config/" +
-               "network-topology:network-topology/" +
+        url = ("config/network-topology:network-topology/" +
                "topology/{}/".format(ovsdb_top_id) +
                "node/{}/".format(ovsdb_id.replace("/", "%2F")) +
                "ovsdb:qos-entries/{}".format(qos_id))
@@ -1127,13 +1447,15 @@ class TopologyManager(manager.Manager):
         #     print("%s:" % fname)
         #     print("URL: %s" % url)
 
-        resp = req.delete(url, auth=("admin", "admin"), headers=self.head)
+        resp = self.restconf.delete(url)
 
 
-    def place_queue_on_qos(self, node_id, qos_id, q_id):
+    def place_queue_on_qos(self, node_id, qos_id, q_id, wait=True):
         """ 
         Add a queue to a QoS and push it to a switch.
         Also reserves link bandwidth
+        NOTE: Only use wait=False for queues on DIFFERENT QoS'es. The QoS is
+        only updated on the OVSNode once the change is confirmed.
         """
 
         # print("Putting queue {} on qos {} (node {})".format(q_id, qos_id, node_id))
@@ -1154,11 +1476,14 @@ class TopologyManager(manager.Manager):
         # queue = cur_node.get_queue(q_id)
 
         # Wait for the change to take effect
-        while True:
-            if self.is_queue_on_qos(node_id, q_id, qos_id):
-                cur_node.set_queue_on_qos(q_id, qos_id)
-                break
-            #print("Queue not on the specified QoS...")
+        self.confirmer.expect(
+            cur_node.ovsdb_top_id, cur_node.ovsdb_id,
+            lambda data: self.__is_queue_on_qos_in_data(data, q_id, qos_id),
+            lambda: cur_node.set_queue_on_qos(q_id, qos_id),
+            "place queue {} on qos {} on {}".format(q_id, qos_id, node_id))
+
+        if wait:
+            self.confirmer.wait()
 
         # # Get the max-rate of the queue
         # for config in queue["queues-other-config"]:
@@ -1226,11 +1551,11 @@ class TopologyManager(manager.Manager):
         # #print("Putting qos_dict on {}".format(node_id))
         # #print(json.dumps(qos_dict, indent=3))
 
-        # Commit the changed dict
-        resp = self.create_qos(node_id, qos_id, max_rate, qos_dict)
+        # Commit the changed dict (confirmed by place_queue_on_qos)
+        resp = self.create_qos(node_id, qos_id, max_rate, qos_dict, wait=False)
 
 
-    def remove_queue_from_qos(self, node_id, qos_id, q_id):
+    def remove_queue_from_qos(self, node_id, qos_id, q_id, wait=True):
         """
         Delete a Queue from a QoS and push the change to a switch.
         Also deallocates link bandwidth
@@ -1262,10 +1587,14 @@ class TopologyManager(manager.Manager):
         # cur_top.add_link_reservation(tp_ofid, -max_rate)
         
         # Wait for the new change to hit
-        while True:
-            if not self.is_queue_on_qos(node_id, q_id, qos_id):
-                cur_node.unset_queue_on_qos(q_id)
-                break
+        self.confirmer.expect(
+            cur_node.ovsdb_top_id, cur_node.ovsdb_id,
+            lambda data: not self.__is_queue_on_qos_in_data(data, q_id, qos_id),
+            lambda: cur_node.unset_queue_on_qos(q_id),
+            "remove queue {} from qos {} on {}".format(q_id, qos_id, node_id))
+
+        if wait:
+            self.confirmer.wait()
     
 
     def __remove_queue_from_qos(self, node_id, qos_id, q_id): # CHANGE 
@@ -1370,7 +1699,7 @@ class TopologyManager(manager.Manager):
     # br_uuid: "ovsdb://uuid/123-345-.../bridge/br0" -> ovsdb_id
     # tp_id: "eth0", etc. == ovsdb:name -> int uuid, port uuid
     # qos_id: pick one! 
-    def place_qos_on_port(self, node_id, qos_id, tp_ofid):
+    def place_qos_on_port(self, node_id, qos_id, tp_ofid, wait=True):
         """
         Add the qos with id qos_id to the switch.
         tp_ofid is assumed to be the openflow id of the port
@@ -1380,13 +1709,22 @@ class TopologyManager(manager.Manager):
         # print("Putting qos {} on tp {} (node{})".format(qos_id, tp_ofid, node_id))
 
         tp_dict = self.__place_qos_on_port(node_id, qos_id, tp_ofid)
-        
-        while True:
-            if self.is_qos_on_tp(node_id, tp_ofid):
-                cur_node = self.get_ovsnode(node_id)
-                cur_node.set_port_data(tp_ofid, tp_dict)
-                cur_node.set_qos_on_port(qos_id, tp_ofid)
-                break
+
+        cur_node = self.get_ovsnode(node_id)
+
+        def on_confirm():
+            cur_node.set_port_data(tp_ofid, tp_dict)
+            cur_node.set_qos_on_port(qos_id, tp_ofid)
+
+        # Port data lives on the bridge node in OVSDB
+        self.confirmer.expect(
+            cur_node.ovsdb_top_id, cur_node.br_ovsdb_id,
+            lambda data: self.__is_qos_on_tp_in_data(cur_node, data, tp_ofid),
+            on_confirm,
+            "place qos {} on tp {}".format(qos_id, tp_ofid))
+
+        if wait:
+            self.confirmer.wait()
             
     
     def __place_qos_on_port(self, node_id, qos_id, tp_ofid):
@@ -1503,8 +1841,7 @@ class TopologyManager(manager.Manager):
             "qos-ref": qos_ref
         })
 
-        url = ("http://{}:8181/restconf/config/".format(self.ctrlr_ip_addr) +
-               "network-topology:network-topology/" +
+        url = ("config/network-topology:network-topology/" +
                "topology/{}/".format(ovsdb_top_id) +
                "node/{}/".format(br_ovsdb_id.replace("/", "%2F")) +
                "termination-point/{}".format(tp_id))
@@ -1519,25 +1856,34 @@ class TopologyManager(manager.Manager):
 
         ##print(url)
         ##print(json.dumps(tp_dict, indent=3))
-        resp = req.put(url, auth=("admin", "admin"),
-                       headers=self.head, data=json.dumps(tp_dict))
+        resp = self.restconf.put(url, json.dumps(tp_dict))
         ##print(resp.text)
             
         return tp_dict
 
 
-    def remove_qos_from_port(self, node_id, tp_ofid):
+    def remove_qos_from_port(self, node_id, tp_ofid, wait=True):
         """ Remove ALL QoS from a tp. Does NOT delete the QoS"""
 
         # print("Removing ALL qos from tp {} (node{})".format(tp_ofid, node_id))
         qos_id = self.__remove_qos_from_port(node_id, tp_ofid)
-        
-        while True:
-            if not self.is_qos_on_tp(node_id, tp_ofid):
-                cur_node = self.get_ovsnode(node_id)
-                cur_node.del_port_qos(tp_ofid)
-                cur_node.unset_qos(qos_id)
-                break
+
+        cur_node = self.get_ovsnode(node_id)
+
+        def on_confirm():
+            cur_node.del_port_qos(tp_ofid)
+            cur_node.unset_qos(qos_id)
+
+        # Port data lives on the bridge node in OVSDB
+        self.confirmer.expect(
+            cur_node.ovsdb_top_id, cur_node.br_ovsdb_id,
+            lambda data: not self.__is_qos_on_tp_in_data(cur_node, data,
+                                                         tp_ofid),
+            on_confirm,
+            "remove qos from tp {}".format(tp_ofid))
+
+        if wait:
+            self.confirmer.wait()
 
         
     def __remove_qos_from_port(self, node_id, tp_ofid):
@@ -1580,8 +1926,7 @@ class TopologyManager(manager.Manager):
         
         # del tp_dict["ovsdb:port-external-ids"]
 
-        url = ("http://{}:8181/restconf/config/".format(self.ctrlr_ip_addr) +
-               "network-topology:network-topology/" +
+        url = ("config/network-topology:network-topology/" +
                "topology/{}/".format(ovsdb_top_id) +
                "node/{}/".format(br_ovsdb_id.replace("/", "%2F")) +
                "termination-point/{}".format(tp_id))
@@ -1593,108 +1938,182 @@ class TopologyManager(manager.Manager):
 
         # tp_dict = { "termination-point": [ tp_dict ] }
 
-        resp = req.put(url, auth=("admin", "admin"),
-                       headers=self.head, data=json.dumps(tp_dict))
+        resp = self.restconf.put(url, json.dumps(tp_dict))
 
         return qos_id
 
 
-    def init_link_qos(self):
+    def init_link_qos(self, max_workers=1, node_ids=None):
+        """
+        Create the default queue/QoS of every port on every switch (or only
+        on the switches in node_ids).
+        With max_workers > 1, the per-switch pipelines (see init_switch_qos())
+        run concurrently on up to max_workers threads.
+        Returns a dict with the time (secs) taken by each switch.
+        """
         # Create queues (1 for each qos/port on each switch)
         # Create qoses (1 for each port on each switch)
         # Put qoses on ports
         # ^ NEED TO APPROPRIATELY TRACK THESE DURING EXECUTION FOR shutdown()
         # AND need to add update method to update qos accordingly
         ##print(self.switchid_to_oftopid)
-        for node_id in self.switchid_to_oftopid:
+        if node_ids is None:
+            node_ids = list(self.switchid_to_oftopid)
+        else:
+            node_ids = list(node_ids)
+        num_switches = len(node_ids)
+        switch_times = {}
+        start = timeit.default_timer()
+
+        def report(node_id, elapsed):
+            switch_times[node_id] = elapsed
+            if __debug__:
+                print("init_link_qos: [{}/{}] {} done in {:.2f}s".format(
+                    len(switch_times), num_switches, node_id, elapsed))
+
+        if max_workers <= 1 or num_switches <= 1:
+            for node_id in node_ids:
+                report(node_id, self.__timed_init_switch_qos(node_id))
+        else:
+            # Each switch only touches its own queues/QoS'es/ports, and
+            # confirmations are tracked per thread, so switches are independent
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=min(max_workers, num_switches),
+                    thread_name_prefix="link-qos") as executor:
+                futures = {
+                    executor.submit(self.__timed_init_switch_qos, node_id):
+                    node_id for node_id in node_ids
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    report(futures[future], future.result())
+
+        if __debug__:
+            print("init_link_qos: {} switches in {:.2f}s ({} workers)".format(
+                num_switches, timeit.default_timer() - start, max_workers))
+
+        return switch_times
+
+
+    def __timed_init_switch_qos(self, node_id):
+        start = timeit.default_timer()
+        self.init_switch_qos(node_id)
+        return timeit.default_timer() - start
+
+
+    def init_switch_qos(self, node_id):
+        """
+        Create and attach the default queue/QoS of every port of a switch.
+        Each stage is pushed for all ports first and then confirmed with one
+        self.confirmer.wait(), instead of confirming every change on its own.
+        """
+        # if __debug__:
+        #     print(node_id)
+        top_id = self.switchid_to_oftopid[node_id]
+        cur_top = self.tops[top_id]
+        cur_node = cur_top.nodes[node_id]
+        # #print(cur_node.port_dict)
+
+        # (tp_ofid, queue_id, qos_id) for each port on the switch
+        port_qos = []
+        for tp_ofid in list(cur_node.port_dict):
+            # Get the port num in string form
+            tp_dict = cur_node.port_dict[tp_ofid]
+            ##print(json.dumps(cur_node.port_dict, indent=3))
+            try:
+                ofport = str(self.get_tp_field(tp_dict, "ovsdb:ofport"))
+            except KeyError:
+                tp_name = str(self.get_tp_field(tp_dict, "ovsdb:name"))
+                tp_ofid = cur_node.get_portofid_from_portname(tp_name)
+                ofport = cur_node.get_portnum_from_portofid(tp_ofid)
+
+            port_qos.append((tp_ofid, "default" + str(ofport),
+                             "defaultqos" + str(ofport)))
+
+        # Create a queue for each port
+        for tp_ofid, queue_id, qos_id in port_qos:
             # if __debug__:
-            #     print(node_id)
-            top_id = self.switchid_to_oftopid[node_id]
-            cur_top = self.tops[top_id]
-            cur_node = cur_top.nodes[node_id]
-            # #print(cur_node.port_dict)
-                
-            for tp_ofid in cur_node.port_dict:
-                # Get the port num in string form
-                tp_dict = cur_node.port_dict[tp_ofid]
-                ##print(json.dumps(cur_node.port_dict, indent=3))
-                try:
-                    ofport = str(self.get_tp_field(tp_dict, "ovsdb:ofport"))
-                except KeyError:
-                    tp_name = str(self.get_tp_field(tp_dict, "ovsdb:name"))
-                    tp_ofid = cur_node.get_portofid_from_portname(tp_name)
-                    ofport = cur_node.get_portnum_from_portofid(tp_ofid)
-                    
-                # Create a queue for the port
-                queue_id = "default" + str(ofport)
-                # if __debug__:
-                #     print("Queue " + queue_id + " for " + node_id)
-                self.create_queue(node_id, queue_id, self.open_link_capacity)
-
-                #time.sleep(0.1)
-
-                # Create a qos for the port
-                qos_id = "defaultqos" + str(ofport)
-                # if __debug__:
-                #     print("qos " + qos_id + " for " + node_id)
-                port_speed = self.get_port_speed(tp_ofid)
-                self.create_qos(node_id, qos_id, port_speed)
-
-                #time.sleep(0.1)
-                                
-                # Put the queue on the QoS
-                # if __debug__:
-                #     print("put queue " + queue_id + " on qos " + qos_id + " for " + node_id)
-                self.place_queue_on_qos(node_id, qos_id, queue_id)
-
-                #time.sleep(0.1)
-                
-                # Put the queue on the QoS
-                # if __debug__:
-                #     print("put qos " + qos_id + " on tp " + tp_ofid + " for " + node_id)
-                self.place_qos_on_port(node_id, qos_id, tp_ofid)
+            #     print("Queue " + queue_id + " for " + node_id)
+            self.create_queue(node_id, queue_id, self.open_link_capacity,
+                              wait=False)
+        self.confirmer.wait()
 
-                #time.sleep(0.1)
+        # Create a qos for each port
+        for tp_ofid, queue_id, qos_id in port_qos:
+            # if __debug__:
+            #     print("qos " + qos_id + " for " + node_id)
+            port_speed = cur_node.get_port_bps(tp_ofid)
+            self.create_qos(node_id, qos_id, port_speed, wait=False)
+        self.confirmer.wait()
+
+        # Put the queues on the QoS'es (one queue per QoS)
+        for tp_ofid, queue_id, qos_id in port_qos:
+            # if __debug__:
+            #     print("put queue " + queue_id + " on qos " + qos_id + " for " + node_id)
+            self.place_queue_on_qos(node_id, qos_id, queue_id, wait=False)
+        self.confirmer.wait()
+
+        # Put the QoS'es on the ports
+        for tp_ofid, queue_id, qos_id in port_qos:
+            # if __debug__:
+            #     print("put qos " + qos_id + " on tp " + tp_ofid + " for " + node_id)
+            self.place_qos_on_port(node_id, qos_id, tp_ofid, wait=False)
+        self.confirmer.wait()
+
+        # Reserve the bandwidth on the ports
+        for tp_ofid, queue_id, qos_id in port_qos:
+            cur_top.set_link_reservation(tp_ofid, self.open_link_capacity)
+
+
+    def get_switches_without_qos(self):
+        """ Return the ids of switches whose link QoS is not set up """
+        node_ids = []
+        for node_id in self.switchid_to_oftopid:
+            if len(self.get_ovsnode(node_id).qos_dict) == 0:
+                node_ids.append(node_id)
+
+        return node_ids
 
-                # Reserve the bandwidth on the port
-                cur_top.set_link_reservation(tp_ofid, self.open_link_capacity) 
 
-                
     def shutdown_link_qos(self):
         for node_id in self.switchid_to_oftopid:
-            ##print(json.dumps(self.switchid_to_oftopid, indent=3))
-            top_id = self.switchid_to_oftopid[node_id]
-            cur_top = self.tops[top_id]
-            cur_node = cur_top.nodes[node_id]
+            self.shutdown_switch_qos(node_id)
 
-            # Remove QoSes from ports
-            for tp_ofid in cur_node.port_dict.keys():
-                ##print(cur_node.port_dict.keys())
-                self.remove_qos_from_port(node_id, tp_ofid)
-                
-                # Undo all reservations
-                cur_top.set_link_reservation(tp_ofid, 0) 
-            
-            #time.sleep(0.1)
 
-            # Remove queues from QoSes
-            for queue_id in cur_node.queue_dict.keys():
-                qos_id = cur_node.queue_to_qos[queue_id]
-                self.remove_queue_from_qos(node_id, qos_id, queue_id)
+    def shutdown_switch_qos(self, node_id):
+        """
+        Detach and delete every queue/QoS of a switch. Like init_switch_qos(),
+        each stage is pushed for the whole switch and confirmed once.
+        """
+        ##print(json.dumps(self.switchid_to_oftopid, indent=3))
+        top_id = self.switchid_to_oftopid[node_id]
+        cur_top = self.tops[top_id]
+        cur_node = cur_top.nodes[node_id]
 
-            #time.sleep(0.1)
+        # Remove QoSes from ports
+        for tp_ofid in list(cur_node.port_dict.keys()):
+            ##print(cur_node.port_dict.keys())
+            self.remove_qos_from_port(node_id, tp_ofid, wait=False)
+        self.confirmer.wait()
 
-            # Delete queues
-            for queue_id in copy.deepcopy(cur_node.queue_dict):
-                self.delete_queue(node_id, queue_id)
+        # Undo all reservations
+        for tp_ofid in cur_node.port_dict.keys():
+            cur_top.set_link_reservation(tp_ofid, 0)
 
-            #time.sleep(0.1)
+        # Remove queues from QoSes
+        for queue_id in list(cur_node.queue_dict.keys()):
+            qos_id = cur_node.queue_to_qos[queue_id]
+            self.remove_queue_from_qos(node_id, qos_id, queue_id, wait=False)
+        self.confirmer.wait()
 
-            # Delete QoS'es
-            for qos_id in copy.deepcopy(cur_node.qos_dict):
-                self.delete_qos(node_id, qos_id)
+        # Delete queues
+        for queue_id in copy.deepcopy(cur_node.queue_dict):
+            self.delete_queue(node_id, queue_id, wait=False)
+        self.confirmer.wait()
 
-            #time.sleep(0.1)
+        # Delete QoS'es
+        for qos_id in copy.deepcopy(cur_node.qos_dict):
+            self.delete_qos(node_id, qos_id, wait=False)
+        self.confirmer.wait()
 
 
 # ==============================================================================
@@ -1777,12 +2196,7 @@ class TopologyManager(manager.Manager):
         Return the port speed of the port with the corresponding OF id.
         """ 
         node_id = port_ofid.rsplit(":", 1)[0]
-        top_id = self.switchid_to_oftopid[node_id]
-        cur_top = self.tops[top_id]
-        node = cur_top.get_node(node_id)
-        port_speed = node.get_port_speed(port_ofid) #kbps
-        port_speed *= 1000
-        return port_speed
+        return self.get_ovsnode(node_id).get_port_bps(port_ofid)
 
     def clear_switches(self, top_id):
         """ 
@@ -1802,14 +2216,37 @@ class TopologyManager(manager.Manager):
         cur_top.release_mutex(sys._getframe().f_code.co_name)
 
 
+    def update_interface_cache(self, inventory):
+        """
+        Rebuild self.interfaces from opendaylight-inventory node data.
+        Done before links are processed, so get_interface() rarely has to go
+        to ODL.
+        """
+        interfaces = {}
+        for node in inventory:
+            for port in node.get("node-connector", []):
+                try:
+                    interfaces[port["id"]] = port["flow-node-inventory:name"]
+                except KeyError:
+                    continue
+
+        # Swap in one step - readers never see a half-built cache
+        self.interfaces = interfaces
+
+
     # Given a node_id and port_id, find the interface corresponding to port_id
     def get_interface(self, node_id, port_id):
         if port_id.startswith("openflow"):
-            # Make a call to grab information on the port
-            url = ("http://{}:8181/restconf/operational/"
-                   "opendaylight-inventory:nodes/node/{}/"
-                   "node-connector/{}").format(self.ctrlr_ip_addr, node_id, port_id)
-            resp = req.get(url, auth=("admin", "admin"), headers=self.head)
+            # Use the inventory data if we have it
+            try:
+                return self.interfaces[port_id]
+            except KeyError:
+                pass
+
+            # Cache miss: Make a call to grab information on the port
+            url = ("operational/opendaylight-inventory:nodes/node/{}/"
+                   "node-connector/{}").format(node_id, port_id)
+            resp = self.restconf.get(url)
 
             # Parse response
             try:
@@ -1825,6 +2262,7 @@ class TopologyManager(manager.Manager):
 
             # Select interface from the response
             interface = data["flow-node-inventory:name"]
+            self.interfaces[port_id] = interface
         else:
             interface = "eth0"
 
@@ -0,0 +1,128 @@
+# This file is a part of the The Fog Development Kit (FDK)
+#
+# Developed by:
+# - Colton Powell
+# - Christopher Desiniotis
+# - Dr. Behnam Dezfouli
+#
+# In the Internet of Things Research Lab, Santa Clara University, CA, USA
+
+# Warm restart snapshots.
+#
+# save_snapshot() writes the state the FDK builds up at runtime (topologies
+# with their link reservations, OVSNode QoS/queue/port maps, the flows of
+# FlowManager and the allocations of ResourceManager) to one pickle file.
+# load_snapshot() memory-maps that file on the next start, so fdk.py only has
+# to reconcile what changed in ODL since then (see
+# TopologyManager.update_topology()) and set up link QoS on switches which
+# have none, instead of rebuilding everything from scratch.
+
+import mmap
+import os
+import pickle
+import sys
+
+import topology
+
+
+# Bumped whenever the layout of a snapshot changes. Snapshots of other
+# versions are ignored.
+SNAPSHOT_VERSION = 2
+
+
+def save_snapshot(path, mgrs):
+    """
+    Write a snapshot of the managers in mgrs (see fdk.py) to path. The file
+    is replaced atomically, so a crash while saving keeps the last snapshot.
+    """
+    top_mgr = mgrs["top"]
+    flow_mgr = mgrs["flow"]
+    res_mgr = mgrs["res"]
+
+    tops = {}
+    for top_id, cur_top in top_mgr.tops.items():
+        cur_top.acquire_mutex()
+        try:
+            tops[top_id] = cur_top.get_state()
+        finally:
+            cur_top.release_mutex()
+
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "tops": tops,
+        "switchid_to_oftopid": top_mgr.switchid_to_oftopid,
+        "ofid_to_ovsdbid": top_mgr.ofid_to_ovsdbid,
+        "ovsdbid_to_ofid": top_mgr.ovsdbid_to_ofid,
+        "interfaces": top_mgr.interfaces,
+        "processed_digests": top_mgr.processed_digests,
+        "flows": flow_mgr.flows,
+        "allocated_resources": res_mgr.allocated_resources,
+        "swarm_ports": res_mgr.swarm.ports
+    }
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path, mgrs):
+    """
+    Restore the managers in mgrs from the snapshot at path. Call before the
+    first TopologyManager.update_topology(). Returns False (leaving the
+    managers untouched) if there is no usable snapshot.
+
+    The snapshot is removed once loaded: the state it describes is only
+    valid until the FDK changes the network again.
+    """
+    try:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                snapshot = pickle.loads(data)
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print("load_snapshot: can't read {}: {}".format(path, e),
+                  file=sys.stderr)
+        return False
+
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        print("load_snapshot: {} has version {} (expected {})".format(
+            path, snapshot.get("version"), SNAPSHOT_VERSION), file=sys.stderr)
+        return False
+
+    top_mgr = mgrs["top"]
+    flow_mgr = mgrs["flow"]
+    res_mgr = mgrs["res"]
+
+    # Interfaces first - add_link() looks them up
+    top_mgr.interfaces.update(snapshot["interfaces"])
+    top_mgr.switchid_to_oftopid.update(snapshot["switchid_to_oftopid"])
+    top_mgr.ofid_to_ovsdbid.update(snapshot["ofid_to_ovsdbid"])
+    top_mgr.ovsdbid_to_ofid.update(snapshot["ovsdbid_to_ofid"])
+
+    for top_id, state in snapshot["tops"].items():
+        try:
+            cur_top = top_mgr.tops[top_id]
+        except KeyError:
+            cur_top = topology.Topology(top_mgr)
+            top_mgr.tops[top_id] = cur_top
+
+        cur_top.acquire_mutex()
+        try:
+            cur_top.load_state(state)
+        finally:
+            cur_top.release_mutex()
+
+    # Only sub-documents which changed in ODL since the snapshot are
+    # processed by the next update_topology()
+    top_mgr.processed_digests.update(snapshot["processed_digests"])
+
+    flow_mgr.flows.update(snapshot["flows"])
+
+    res_mgr.allocated_resources.update(snapshot["allocated_resources"])
+    res_mgr.swarm.ports.update(snapshot["swarm_ports"])
+
+    os.remove(path)
+    return True